@@ -0,0 +1,125 @@
+"""Micro-batching of concurrent predict calls.
+
+Wringer stations send one or two hides per request, often at the same time.
+Requests for the same model that arrive within PREDICT_BATCH_WINDOW_MS of the
+first one waiting (or until PREDICT_BATCH_MAX_ROWS rows are queued) are
+stacked into one matrix, predicted in a single vectorized call on a worker
+thread, and the results are split back out to each caller.
+
+Batch sizes and queue waits are recorded in histograms, served by
+`GET /api/predict/batching` and `GET /metrics`, for tuning the window and size.
+"""
+
+import asyncio
+import os
+import time
+from typing import TYPE_CHECKING
+
+import metrics
+
+if TYPE_CHECKING:
+    import numpy as np
+
+WINDOW_MS = float(os.environ.get("PREDICT_BATCH_WINDOW_MS", "3"))
+MAX_ROWS = int(os.environ.get("PREDICT_BATCH_MAX_ROWS", "128"))
+
+batch_rows = metrics.histogram(
+    "predict_batch_rows", "Rows per batched predict call", [1, 2, 4, 8, 16, 32, 64, 128, 256]
+).labels()
+batch_requests = metrics.histogram(
+    "predict_batch_requests", "Requests merged into one predict call", [1, 2, 4, 8, 16, 32]
+).labels()
+queue_wait_ms = metrics.histogram(
+    "predict_batch_queue_wait_milliseconds", "Time a predict request waited to be batched",
+    [0.5, 1, 2, 3, 5, 10, 25, 50, 100],
+).labels()
+
+
+class _Pending:
+    __slots__ = ("X", "future", "enqueued")
+
+    def __init__(self, X: "np.ndarray", future: asyncio.Future):
+        self.X = X
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class _Queue:
+    __slots__ = ("model", "items", "rows", "timer")
+
+    def __init__(self, model):
+        self.model = model
+        self.items: list[_Pending] = []
+        self.rows = 0
+        self.timer: asyncio.TimerHandle | None = None
+
+
+_queues: dict[object, _Queue] = {}
+
+
+async def predict(key, model, X: "np.ndarray") -> "np.ndarray":
+    """Predict `X` with `model`, batched with concurrent calls for the same `key`.
+
+    `key` must change whenever the model does, e.g. after a retrain.
+    """
+    if WINDOW_MS <= 0:
+        return await asyncio.to_thread(model.predict, X)
+
+    loop = asyncio.get_running_loop()
+    queue = _queues.get(key)
+    if queue is None:
+        queue = _queues[key] = _Queue(model)
+    pending = _Pending(X, loop.create_future())
+    queue.items.append(pending)
+    queue.rows += len(X)
+
+    if queue.rows >= MAX_ROWS:
+        _flush(key)
+    elif queue.timer is None:
+        queue.timer = loop.call_later(WINDOW_MS / 1000, _flush, key)
+    return await pending.future
+
+
+def _flush(key):
+    queue = _queues.pop(key, None)
+    if queue is None:
+        return
+    if queue.timer is not None:
+        queue.timer.cancel()
+    asyncio.get_running_loop().create_task(_run(queue))
+
+
+async def _run(queue: _Queue):
+    import numpy as np
+
+    started = time.perf_counter()
+    for item in queue.items:
+        queue_wait_ms.observe((started - item.enqueued) * 1000)
+    batch_rows.observe(queue.rows)
+    batch_requests.observe(len(queue.items))
+
+    try:
+        X = queue.items[0].X if len(queue.items) == 1 else np.concatenate([i.X for i in queue.items])
+        predictions = await asyncio.to_thread(queue.model.predict, X)
+    except Exception as e:
+        for item in queue.items:
+            if not item.future.done():
+                item.future.set_exception(e)
+        return
+
+    offset = 0
+    for item in queue.items:
+        n = len(item.X)
+        if not item.future.done():
+            item.future.set_result(predictions[offset:offset + n])
+        offset += n
+
+
+def stats() -> dict:
+    return {
+        "windowMs": WINDOW_MS,
+        "maxRows": MAX_ROWS,
+        "batchRows": batch_rows.snapshot(),
+        "batchRequests": batch_requests.snapshot(),
+        "queueWaitMs": queue_wait_ms.snapshot(),
+    }
@@ -0,0 +1,116 @@
+"""A directory-backed stand-in for the boto3 S3 client.
+
+Implements the calls `s3_sync` and `replication` make, storing each object
+as a file under `root`, so benchmarks exercise the real persistence code
+(snapshots, change-log shipping, model uploads) without a network or
+credentials. Buckets are ignored: everything lives in one directory.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+
+class LocalS3:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def _write(self, key: str, write):
+        target = self._path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent)
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, target)
+
+    def _missing(self, key: str):
+        return KeyError(f"NoSuchKey: {key}")
+
+    @staticmethod
+    def _etag(path: Path) -> str:
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return f'"{digest.hexdigest()}"'
+
+    def upload_file(self, filename, bucket, key, Config=None):
+        with open(filename, "rb") as src:
+            self._write(key, lambda dst: shutil.copyfileobj(src, dst, 1024 * 1024))
+
+    def download_file(self, bucket, key, filename):
+        path = self._path(key)
+        if not path.is_file():
+            raise self._missing(key)
+        shutil.copyfile(path, filename)
+
+    def put_object(self, Bucket, Key, Body):
+        self._write(Key, lambda dst: dst.write(Body))
+        return {"ETag": self._etag(self._path(Key))}
+
+    def get_object(self, Bucket, Key):
+        path = self._path(Key)
+        if not path.is_file():
+            raise self._missing(Key)
+        return {"Body": io.BytesIO(path.read_bytes()), "ContentLength": path.stat().st_size}
+
+    def head_object(self, Bucket, Key):
+        path = self._path(Key)
+        if not path.is_file():
+            raise self._missing(Key)
+        return {"ETag": self._etag(path), "ContentLength": path.stat().st_size}
+
+    def delete_object(self, Bucket, Key):
+        self._path(Key).unlink(missing_ok=True)
+
+    def get_paginator(self, operation: str):
+        if operation != "list_objects_v2":
+            raise NotImplementedError(operation)
+        return _ListPaginator(self)
+
+
+class _ListPaginator:
+    PAGE_SIZE = 1000
+
+    def __init__(self, s3: LocalS3):
+        self._s3 = s3
+
+    def paginate(self, Bucket, Prefix=""):
+        root = self._s3.root
+        keys = sorted(
+            p.relative_to(root).as_posix()
+            for p in root.rglob("*")
+            if p.is_file() and p.relative_to(root).as_posix().startswith(Prefix)
+        )
+        for i in range(0, len(keys), self.PAGE_SIZE):
+            yield {
+                "Contents": [
+                    {
+                        "Key": key,
+                        "ETag": self._s3._etag(root / key),
+                        "Size": (root / key).stat().st_size,
+                    }
+                    for key in keys[i:i + self.PAGE_SIZE]
+                ]
+            }
+
+
+def install(root: Path, bucket: str = "benchmark"):
+    """Point `s3_sync` (and through it `replication`) at a LocalS3 under `root`.
+
+    Call after importing the app; the sync manifest is kept under `root` too
+    so benchmark runs never touch data/s3_manifest.json.
+    """
+    import s3_sync
+
+    s3_sync.BUCKET = bucket
+    s3_sync._client = LocalS3(Path(root) / "objects")
+    s3_sync.MANIFEST_PATH = Path(root) / "s3_manifest.json"
+    s3_sync._manifest = None
@@ -0,0 +1,66 @@
+"""Compare sklearn and compiled-forest predict latency.
+
+Usage: python -m benchmarks.forest_inference [--trees 1000] [--features 12]
+
+Fits a forest on synthetic defect counts, compiles it with `ml.forest`, checks
+that both engines return identical predictions and prints the median latency
+per request at batch sizes 1, 10 and 1000.
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from ml import forest
+
+
+def _median_ms(fn, repeat: int) -> float:
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trees", type=int, default=1000)
+    parser.add_argument("--features", type=int, default=12)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = rng.poisson(3, size=(args.rows, args.features)).astype(float)
+    score = X[:, : max(1, args.features // 3)].sum(axis=1) + rng.normal(0, 2, args.rows)
+    y = np.array(["A", "B", "C", "D"])[np.digitize(score, np.quantile(score, [0.25, 0.5, 0.75]))]
+
+    rf = RandomForestClassifier(n_estimators=args.trees, random_state=42, n_jobs=-1)
+    rf.fit(X, y)
+    rf.set_params(n_jobs=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "model.forest"
+        forest.save(forest.compile_forest(rf), path)
+        compiled = forest.load(path, mmap_mode="r")
+
+        print(f"{args.trees} trees, {args.features} features, max depth {compiled.max_depth}")
+        print(f"{'batch':>6} {'sklearn ms':>11} {'compiled ms':>12} {'speedup':>8}")
+        for batch in (1, 10, 1000):
+            Xb = rng.poisson(3, size=(batch, args.features)).astype(float)
+            if not np.array_equal(rf.predict(Xb), compiled.predict(Xb)):
+                raise SystemExit(f"Predictions differ at batch size {batch}")
+            sk = _median_ms(lambda: rf.predict(Xb), args.repeat)
+            fast = _median_ms(lambda: compiled.predict(Xb), args.repeat)
+            print(f"{batch:>6} {sk:>11.2f} {fast:>12.2f} {sk / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
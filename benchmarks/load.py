@@ -0,0 +1,460 @@
+"""Load benchmark: concurrent clients against the real app and synthetic hides.
+
+Usage:
+    python -m benchmarks.load run [--rows 100k] [--concurrency 8] [--server uvicorn]
+                                  [--scenarios bulk_insert,list_rows,...] [--output run.json]
+    python -m benchmarks.load compare before.json after.json
+
+`run` starts the app on a throwaway database in a temp directory (in-process
+over ASGI, or as a uvicorn server for real HTTP), with S3 persistence going to
+a local stand-in (`benchmarks.fake_s3`). It then creates one synthetic session
+(`benchmarks.synthetic`) and runs each scenario in turn:
+
+- bulk_insert: the rows in `--batch`-row `POST .../rows/bulk` requests
+- list_rows:   every row, paged with `after_id`/`limit`; each client scans a
+               slice of the id range
+- label:       `--requests` single-row `PUT .../rows/{id}` label edits
+- label_batch: `PATCH .../rows` with 100 label edits per request
+- train:       one training job on the stored rows, polled until done
+- predict:     `--requests` predict calls of 1-2 hides, like wringer stations
+
+Each scenario reports p50/p95/p99 latency, requests/s and rows/s; the run
+reports the server's peak RSS. Results are printed and, with `--output`,
+written as JSON for `compare`.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks import fake_s3, synthetic
+
+ROOT = Path(__file__).resolve().parent.parent
+SCENARIOS = ["bulk_insert", "list_rows", "label", "label_batch", "train", "predict"]
+LABEL_BATCH_SIZE = 100
+
+
+class Recorder:
+    """Latencies and outcomes of one scenario's requests."""
+
+    def __init__(self):
+        self.latencies_ms: list[float] = []
+        self.errors = 0
+        self.first_error: str | None = None
+        self.rows = 0
+        self._started = time.perf_counter()
+        self._elapsed: float | None = None
+
+    async def request(self, client, method: str, url: str, rows: int = 0, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception as e:
+            self.error(f"{type(e).__name__}: {e}")
+            return None
+        self.latencies_ms.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            self.error(f"{response.status_code} {response.text[:200]}")
+            return response
+        self.rows += rows
+        return response
+
+    def error(self, message: str):
+        self.errors += 1
+        self.first_error = self.first_error or message
+
+    def stop(self):
+        self._elapsed = time.perf_counter() - self._started
+
+    def summary(self, **extra) -> dict:
+        elapsed = self._elapsed if self._elapsed is not None else time.perf_counter() - self._started
+        latencies = sorted(self.latencies_ms)
+
+        def percentile(p: float) -> float | None:
+            if not latencies:
+                return None
+            return round(latencies[max(0, math.ceil(p / 100 * len(latencies)) - 1)], 2)
+
+        return {
+            "requests": len(latencies) + self.errors,
+            "errors": self.errors,
+            "firstError": self.first_error,
+            "elapsedSeconds": round(elapsed, 3),
+            "p50Ms": percentile(50),
+            "p95Ms": percentile(95),
+            "p99Ms": percentile(99),
+            "meanMs": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "requestsPerSecond": round(len(latencies) / elapsed, 1) if elapsed else None,
+            "rowsPerSecond": round(self.rows / elapsed, 1) if elapsed and self.rows else None,
+            **extra,
+        }
+
+
+async def _pool(concurrency: int, jobs):
+    """Run the coroutine factories in `jobs` with at most `concurrency` in flight."""
+    jobs = iter(jobs)
+
+    async def worker():
+        for job in jobs:
+            await job()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+# --- Scenarios ---
+
+async def _bulk_insert(client, ctx, args) -> dict:
+    rec = Recorder()
+    url = f"/api/sessions/{ctx['session_id']}/rows/bulk"
+
+    def jobs():
+        for chunk in synthetic.iter_rows(args.rows, seed=args.seed, chunk_size=args.batch):
+            yield lambda chunk=chunk: rec.request(client, "POST", url, rows=len(chunk), json={"rows": chunk})
+
+    await _pool(args.concurrency, jobs())
+    rec.stop()
+    return rec.summary()
+
+
+async def _list_rows(client, ctx, args) -> dict:
+    rec = Recorder()
+    url = f"/api/sessions/{ctx['session_id']}/rows"
+    ids: list[int] = []
+    # Ids are allocated in insert order, so slicing the range splits the work evenly
+    first = await client.get(url, params={"limit": 1})
+    lo = first.json()[0]["id"] - 1 if first.json() else 0
+    hi = lo + args.rows
+    step = math.ceil((hi - lo) / args.concurrency)
+
+    async def scan(start: int, end: int):
+        after = start
+        while after < end:
+            response = await rec.request(
+                client, "GET", url, params={"after_id": after, "limit": args.page}
+            )
+            if response is None or response.status_code >= 400:
+                return
+            page = [r for r in response.json() if r["id"] <= end]
+            rec.rows += len(page)
+            ids.extend(r["id"] for r in page)
+            if len(page) < args.page or "X-Next-After-Id" not in response.headers:
+                return
+            after = page[-1]["id"]
+
+    await asyncio.gather(*(scan(s, min(s + step, hi)) for s in range(lo, hi, step)))
+    rec.stop()
+    ctx["row_ids"] = ids
+    return rec.summary()
+
+
+async def _label(client, ctx, args) -> dict:
+    rec = Recorder()
+    rng = random.Random(args.seed)
+    ids = ctx.get("row_ids") or []
+    base = f"/api/sessions/{ctx['session_id']}/rows"
+
+    def jobs():
+        for _ in range(args.requests if ids else 0):
+            row_id, grade = rng.choice(ids), rng.choice(synthetic.GRADES)
+            yield lambda row_id=row_id, grade=grade: rec.request(
+                client, "PUT", f"{base}/{row_id}", rows=1, json={"targetColumn": grade}
+            )
+
+    await _pool(args.concurrency, jobs())
+    rec.stop()
+    return rec.summary()
+
+
+async def _label_batch(client, ctx, args) -> dict:
+    rec = Recorder()
+    rng = random.Random(args.seed + 1)
+    ids = ctx.get("row_ids") or []
+    url = f"/api/sessions/{ctx['session_id']}/rows"
+
+    def jobs():
+        for _ in range(max(1, args.requests // LABEL_BATCH_SIZE) if ids else 0):
+            updates = [
+                {"id": rng.choice(ids), "targetColumn": rng.choice(synthetic.GRADES)}
+                for _ in range(LABEL_BATCH_SIZE)
+            ]
+            yield lambda updates=updates: rec.request(
+                client, "PATCH", url, rows=len(updates), json={"updates": updates}
+            )
+
+    await _pool(args.concurrency, jobs())
+    rec.stop()
+    return rec.summary()
+
+
+async def _train(client, ctx, args) -> dict:
+    rec = Recorder()
+    response = await rec.request(client, "POST", "/api/train", json={
+        "sessionId": ctx["session_id"],
+        "forest": {"nEstimators": args.trees},
+    })
+    if response is None or response.status_code >= 400:
+        rec.stop()
+        return rec.summary()
+
+    job_id = response.json()["job_id"]
+    while True:
+        await asyncio.sleep(0.2)
+        job = (await client.get(f"/api/train/{job_id}")).json()
+        if job["status"] in ("completed", "failed"):
+            break
+    rec.stop()
+    if job["status"] == "failed":
+        rec.error(job["message"])
+        return rec.summary()
+
+    result = job["metrics"]
+    rec.rows = result["trainSize"] + result["testSize"]
+    profile = result.get("profile") or {}
+    return rec.summary(
+        accuracy=result["accuracy"],
+        trees=result["nEstimators"],
+        stagesMs={s["name"]: s["wallMs"] for s in profile.get("stages", [])},
+        workerPeakRssMb=profile.get("peakRssMb"),
+    )
+
+
+async def _predict(client, ctx, args) -> dict:
+    rec = Recorder()
+    rng = random.Random(args.seed + 2)
+    hides = synthetic.feature_rows(1000, seed=args.seed + 3)
+    url = f"/api/sessions/{ctx['session_id']}/predict"
+
+    def jobs():
+        for _ in range(args.requests):
+            rows = rng.sample(hides, rng.choice((1, 2)))
+            yield lambda rows=rows: rec.request(client, "POST", url, rows=len(rows), json={
+                "featureColumns": synthetic.FEATURE_COLUMNS,
+                "rows": rows,
+            })
+
+    await _pool(args.concurrency, jobs())
+    rec.stop()
+    return rec.summary()
+
+
+SCENARIO_FUNCS = {
+    "bulk_insert": _bulk_insert,
+    "list_rows": _list_rows,
+    "label": _label,
+    "label_batch": _label_batch,
+    "train": _train,
+    "predict": _predict,
+}
+
+
+async def _run_scenarios(client, args, peak_rss) -> dict:
+    response = await client.post("/api/sessions", json=synthetic.session_body("benchmark"))
+    response.raise_for_status()
+    ctx = {"session_id": response.json()["id"]}
+
+    results = {}
+    for name in args.scenarios:
+        print(f"[benchmark] {name} ...", file=sys.stderr)
+        results[name] = await SCENARIO_FUNCS[name](client, ctx, args)
+        print(f"[benchmark] {name}: {json.dumps(results[name])}", file=sys.stderr)
+    return {"scenarios": results, "peakRssMb": peak_rss()}
+
+
+# --- Servers ---
+
+def _peak_rss_mb(pid: int | str = "self") -> float | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _sandbox_env(workdir: Path) -> dict:
+    """Environment for the app under test: its own DB, quiet access log."""
+    return {
+        **os.environ,
+        "GRADE_NINJA_DB": str(workdir / "grade_ninja.db"),
+        "ACCESS_LOG_SAMPLE_RATE": os.environ.get("ACCESS_LOG_SAMPLE_RATE", "0"),
+    }
+
+
+def _load_app(workdir: Path):
+    """Import the app with S3 and model files redirected into `workdir`.
+
+    `GRADE_NINJA_DB` must already point into `workdir` (see `_sandbox_env`).
+    """
+    import main
+    import s3_sync
+    import training
+
+    fake_s3.install(workdir / "s3")
+    s3_sync.DATA_DIR = workdir
+    s3_sync.MODELS_DIR = training.MODELS_DIR = workdir / "models"
+    training.MODELS_DIR.mkdir(parents=True, exist_ok=True)
+    return main
+
+
+async def _run_inprocess(args, workdir: Path) -> dict:
+    import httpx
+
+    os.environ.update(_sandbox_env(workdir))
+    main = _load_app(workdir)
+    main.initialize()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        return await _run_scenarios(client, args, _peak_rss_mb)
+
+
+async def _run_uvicorn(args, workdir: Path) -> dict:
+    import httpx
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load", "serve", "--workdir", str(workdir),
+         "--port", str(args.port)],
+        cwd=ROOT, env=_sandbox_env(workdir),
+    )
+    try:
+        base_url = f"http://127.0.0.1:{args.port}"
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    if (await client.get("/ready")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise SystemExit("Server did not become ready")
+                await asyncio.sleep(0.1)
+            return await _run_scenarios(client, args, lambda: _peak_rss_mb(server.pid))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def _serve(args):
+    import uvicorn
+
+    main = _load_app(Path(args.workdir))
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# --- Commands ---
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run(args):
+    args.rows = synthetic.parse_size(args.rows)
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(prefix="grade-ninja-bench-") as tmp:
+        runner = _run_uvicorn if args.server == "uvicorn" else _run_inprocess
+        outcome = asyncio.run(runner(args, Path(tmp)))
+
+    result = {
+        "benchmark": "load",
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "rows": args.rows,
+            "server": args.server,
+            "concurrency": args.concurrency,
+            "batch": args.batch,
+            "page": args.page,
+            "requests": args.requests,
+            "trees": args.trees,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "commit": _git_commit(),
+        },
+        **outcome,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2) + "\n")
+
+
+def _compare(args):
+    before = json.loads(Path(args.before).read_text())
+    after = json.loads(Path(args.after).read_text())
+    fields = ("p50Ms", "p95Ms", "p99Ms", "rowsPerSecond")
+    print(f"{'scenario':<12} {'metric':<14} {'before':>10} {'after':>10} {'change':>8}")
+    for name, new in after["scenarios"].items():
+        old = before["scenarios"].get(name)
+        if old is None:
+            continue
+        for field in fields:
+            a, b = old.get(field), new.get(field)
+            if a is None or b is None:
+                continue
+            change = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+            print(f"{name:<12} {field:<14} {a:>10} {b:>10} {change:>8}")
+    print(f"{'server':<12} {'peakRssMb':<14} {before.get('peakRssMb')!s:>10} {after.get('peakRssMb')!s:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the benchmark")
+    run.add_argument("--rows", default="100k", help="1k, 100k, 1m or a row count")
+    run.add_argument("--server", choices=("inprocess", "uvicorn"), default="inprocess")
+    run.add_argument("--port", type=int, default=8765)
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--batch", type=int, default=1000, help="Rows per bulk insert request")
+    run.add_argument("--page", type=int, default=1000, help="Rows per list page")
+    run.add_argument("--requests", type=int, default=500, help="Requests for label and predict")
+    run.add_argument("--trees", type=int, default=100)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--scenarios", default=",".join(SCENARIOS))
+    run.add_argument("--output", help="Also write the JSON result here")
+    run.set_defaults(func=_run)
+
+    compare = commands.add_parser("compare", help="Compare two result files")
+    compare.add_argument("before")
+    compare.add_argument("after")
+    compare.set_defaults(func=_compare)
+
+    serve = commands.add_parser("serve", help=argparse.SUPPRESS)
+    serve.add_argument("--workdir", required=True)
+    serve.add_argument("--port", type=int, required=True)
+    serve.set_defaults(func=_serve)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure cold-start time, split into import and initialization phases.
+
+Usage: python -m benchmarks.startup [--runs 5]
+
+Each run starts a fresh interpreter against a throwaway database and reports:
+- import: `import main` (FastAPI app, routes; no ML libraries)
+- init phases: S3 download, DB creation/migration, job recovery, as timed by
+  `main.initialize`
+- ml import: what the first train/predict pays to load pandas, sklearn and
+  joblib
+Medians over all runs are printed as JSON.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.initialize()
+initialized = time.perf_counter()
+heavy = [m for m in ("pandas", "sklearn", "joblib", "numpy", "boto3") if m in sys.modules]
+import joblib, pandas, sklearn.ensemble
+ml_loaded = time.perf_counter()
+print(json.dumps({
+    "importMs": (imported - started) * 1000,
+    "initMs": (initialized - imported) * 1000,
+    "phasesMs": main.startup["phasesMs"],
+    "mlImportMs": (ml_loaded - initialized) * 1000,
+    "heavyModulesAtStartup": heavy,
+}))
+"""
+
+
+def _run_once() -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "GRADE_NINJA_DB": str(Path(tmp) / "bench.db"), "S3_BUCKET": ""}
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [_run_once() for _ in range(args.runs)]
+    phases = sorted({name for r in runs for name in r["phasesMs"]})
+    result = {
+        "runs": args.runs,
+        "importMs": round(statistics.median(r["importMs"] for r in runs), 1),
+        "initMs": round(statistics.median(r["initMs"] for r in runs), 1),
+        "phasesMs": {
+            name: round(statistics.median(r["phasesMs"].get(name, 0) for r in runs), 1)
+            for name in phases
+        },
+        "mlImportMs": round(statistics.median(r["mlImportMs"] for r in runs), 1),
+        "heavyModulesAtStartup": runs[-1]["heavyModulesAtStartup"],
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
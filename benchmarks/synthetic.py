@@ -0,0 +1,86 @@
+"""Synthetic hide datasets shaped like the ones `database._seed` builds by hand.
+
+Each hide gets a hidden severity between 0 (clean) and 1 (heavily damaged),
+mostly determined by its grade. Defect counts are Poisson draws whose mean
+moves with severity between the ranges seen in the seed sessions: breaks,
+cuts and scars go up with severity, `count_w` (clean wringer marks) goes
+down. Areas are drawn around a typical 45 sq ft hide. A fixed seed gives
+the same rows on every run.
+"""
+
+from typing import Iterator
+
+import numpy as np
+
+GRADES = ["A", "B", "C", "D", "E"]
+GRADE_WEIGHTS = [0.15, 0.25, 0.30, 0.20, 0.10]
+GRADE_COLORS = ["#00b894", "#6c5ce7", "#fdcb6e", "#e17055", "#d63031"]
+
+# Mean count at severity 0 and at severity 1
+COUNT_RANGES = {
+    "count_br": (1, 35),
+    "count_ct": (15, 170),
+    "count_d2": (0, 40),
+    "count_dc": (0, 14),
+    "count_he": (0, 5),
+    "count_hs": (2, 32),
+    "count_rw": (0, 22),
+    "count_w": (155, 15),
+}
+FEATURE_COLUMNS = list(COUNT_RANGES)
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def parse_size(value: str) -> int:
+    """Accept a preset name (1k, 100k, 1m) or a plain row count."""
+    return SIZES.get(value.lower()) or int(value)
+
+
+def session_body(name: str) -> dict:
+    """A `POST /api/sessions` body for a synthetic session."""
+    return {
+        "name": name,
+        "grades": [
+            {"id": i + 1, "name": g, "color": c} for i, (g, c) in enumerate(zip(GRADES, GRADE_COLORS))
+        ],
+        "targetColumn": "grade",
+        "featureColumns": FEATURE_COLUMNS,
+        "datasetFilename": f"{name}.csv",
+    }
+
+
+def _draw(rng: np.random.Generator, n: int, labeled_fraction: float) -> dict[str, np.ndarray]:
+    grade = rng.choice(len(GRADES), size=n, p=GRADE_WEIGHTS)
+    severity = np.clip(grade / (len(GRADES) - 1) + rng.normal(0, 0.08, n), 0, 1)
+    columns = {
+        name: rng.poisson(lo + (hi - lo) * severity)
+        for name, (lo, hi) in COUNT_RANGES.items()
+    }
+    columns["area_sqft"] = np.round(rng.normal(45, 4, n), 1)
+    columns["area_br"] = np.round(columns["count_br"] * rng.uniform(0.00012, 0.0002, n), 3)
+    columns["grade"] = np.where(rng.random(n) < labeled_fraction, np.array(GRADES)[grade], "")
+    return columns
+
+
+def iter_rows(n: int, seed: int = 0, labeled_fraction: float = 0.7,
+              chunk_size: int = 1000) -> Iterator[list[dict]]:
+    """Yield `n` rows in lists of `chunk_size`, ready for `POST .../rows/bulk`."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        columns = _draw(rng, size, labeled_fraction)
+        lists = {name: values.tolist() for name, values in columns.items()}
+        names = list(lists)
+        yield [
+            {**dict(zip(names, values)), "imageSrc": f"/hide{(start + i) % 2 + 1}.webp"}
+            for i, values in enumerate(zip(*lists.values()))
+        ]
+
+
+def feature_rows(n: int, seed: int = 1) -> list[dict]:
+    """`n` unlabeled rows holding just the feature columns, for predict requests."""
+    columns = _draw(np.random.default_rng(seed), n, labeled_fraction=0)
+    return [
+        {name: int(columns[name][i]) for name in FEATURE_COLUMNS} for i in range(n)
+    ]
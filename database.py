@@ -1,25 +1,250 @@
 import json
-import sqlite3
 import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import metrics
+import replication
+import row_store
 
 DB_PATH = os.environ.get("GRADE_NINJA_DB", "data/grade_ninja.db")
 
-_connection: sqlite3.Connection | None = None
+# Connection tuning, see https://www.sqlite.org/pragma.html
+BUSY_TIMEOUT_MS = int(os.environ.get("GRADE_NINJA_DB_BUSY_TIMEOUT_MS", "30000"))
+SYNCHRONOUS = os.environ.get("GRADE_NINJA_DB_SYNCHRONOUS", "NORMAL")
+MMAP_SIZE = int(os.environ.get("GRADE_NINJA_DB_MMAP_SIZE", str(256 * 1024**2)))
+CACHE_SIZE = int(os.environ.get("GRADE_NINJA_DB_CACHE_SIZE", "-20000"))
+
+WRITE_POOL_SIZE = int(os.environ.get("GRADE_NINJA_DB_WRITE_POOL_SIZE", "4"))
+READ_POOL_SIZE = int(os.environ.get("GRADE_NINJA_DB_READ_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("GRADE_NINJA_DB_POOL_TIMEOUT", "30"))
+
+
+_query_seconds = metrics.histogram(
+    "sqlite_query_duration_seconds",
+    "Time spent in execute calls (the first step of a SELECT; further rows are fetched lazily)",
+    labelnames=("statement",),
+)
+_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "BEGIN", "COMMIT", "PRAGMA")
+
+
+def _statement(sql: str) -> str:
+    words = sql.lstrip()[:8].split(maxsplit=1)
+    verb = words[0].upper() if words else ""
+    return verb if verb in _STATEMENTS else "OTHER"
+
+
+class TimedConnection(sqlite3.Connection):
+    """A connection that records how long each statement takes to execute."""
+
+    def execute(self, sql, parameters=(), /):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _query_seconds.labels(_statement(sql)).observe(time.perf_counter() - started)
+
+    def executemany(self, sql, parameters, /):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            _query_seconds.labels(_statement(sql)).observe(time.perf_counter() - started)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            _query_seconds.labels("COMMIT").observe(time.perf_counter() - started)
+
+
+def connect(readonly: bool = False) -> sqlite3.Connection:
+    """Open a new, fully configured connection to the database.
+
+    Connections run in autocommit mode: every statement commits on its own
+    unless it is issued inside `transaction()`.
+    """
+    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        factory=TimedConnection,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    if not readonly:
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size={CACHE_SIZE}")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+# Called with no arguments whenever a write connection comes back to the pool
+# having changed the database
+_write_listeners: list = []
+
+
+def add_write_listener(callback):
+    _write_listeners.append(callback)
+
+
+def _notify_write():
+    for callback in _write_listeners:
+        try:
+            callback()
+        except Exception as e:
+            print(f"[database] Write listener failed: {type(e).__name__}: {e}")
+
+
+class ConnectionPool:
+    """A fixed-size pool of connections, opened lazily."""
+
+    def __init__(self, size: int, readonly: bool = False):
+        self.size = size
+        self.readonly = readonly
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        # id(conn) -> total_changes when it was last released
+        self._changes: dict[int, int] = {}
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                open_new = True
+            else:
+                open_new = False
+        if open_new:
+            try:
+                return connect(readonly=self.readonly)
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=POOL_TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError("Timed out waiting for a database connection") from None
+
+    def release(self, conn: sqlite3.Connection):
+        # Never hand another request someone else's uncommitted work
+        if conn.in_transaction:
+            conn.rollback()
+        changed = False
+        if not self.readonly:
+            total = conn.total_changes
+            changed = self._changes.get(id(conn), 0) != total
+            self._changes[id(conn)] = total
+        self._idle.put(conn)
+        if changed:
+            _notify_write()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._opened = 0
+        self._changes.clear()
+
+
+_write_pool = ConnectionPool(WRITE_POOL_SIZE)
+_read_pool = ConnectionPool(READ_POOL_SIZE, readonly=True)
+
+
+def reset_pools():
+    """Replace the pools without closing their connections.
+
+    For a process that has pointed `DB_PATH` at another file (the tests do),
+    whose pooled connections still hold the old one. Write listeners are
+    dropped too; the app's startup registers its own again.
+    """
+    global _write_pool, _read_pool
+    _write_pool = ConnectionPool(WRITE_POOL_SIZE)
+    _read_pool = ConnectionPool(READ_POOL_SIZE, readonly=True)
+    _write_listeners.clear()
+
+
+@contextmanager
+def connection(readonly: bool = False) -> Iterator[sqlite3.Connection]:
+    """Borrow a connection from the write pool (or the read-only pool)."""
+    pool = _read_pool if readonly else _write_pool
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def transaction(db: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Run a block as one write transaction; commit on success, roll back on error."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.rollback()
+        # The rollback may have undone metric columns added in the block
+        row_store.forget_columns()
+        raise
+    db.commit()
+
+
+def bump_data_version(db: sqlite3.Connection, session_id: int | None = None) -> int:
+    """Advance the database-wide data version and stamp it on `session_id`.
+
+    Call from every write that changes what the session and row endpoints
+    return, inside the write's transaction. Versions come from one counter, so
+    a value is never reused, even by a deleted and recreated session; pass no
+    session for writes that only change the session list (a delete).
+    """
+    version = db.execute(
+        "UPDATE data_version SET value = value + 1 WHERE id = 1 RETURNING value"
+    ).fetchall()[0][0]
+    if session_id is not None:
+        db.execute("UPDATE sessions SET data_version = ? WHERE id = ?", (version, session_id))
+    return version
+
 
+def get_db() -> Iterator[sqlite3.Connection]:
+    """FastAPI dependency: a per-request connection from the write pool."""
+    with connection() as db:
+        yield db
 
-def get_db() -> sqlite3.Connection:
-    global _connection
-    if _connection is None:
-        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
-        _connection = sqlite3.connect(DB_PATH, check_same_thread=False)
-        _connection.row_factory = sqlite3.Row
-        _connection.execute("PRAGMA journal_mode=WAL")
-        _connection.execute("PRAGMA foreign_keys=ON")
-    return _connection
+
+def get_read_db() -> Iterator[sqlite3.Connection]:
+    """FastAPI dependency: a per-request read-only connection.
+
+    WAL lets these read concurrently with each other and with the writer.
+    """
+    with connection(readonly=True) as db:
+        yield db
 
 
 def init_db():
-    db = get_db()
+    with connection() as db:
+        _init_db(db)
+
+
+def _init_db(db: sqlite3.Connection):
     db.executescript("""
         CREATE TABLE IF NOT EXISTS sessions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -46,19 +271,117 @@ def init_db():
 
         CREATE INDEX IF NOT EXISTS idx_dataset_rows_session
             ON dataset_rows(session_id);
+
+        CREATE TABLE IF NOT EXISTS train_jobs (
+            id TEXT PRIMARY KEY,
+            session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            stage TEXT,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            metrics TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_train_jobs_session
+            ON train_jobs(session_id);
+
+        CREATE TABLE IF NOT EXISTS predictions (
+            row_id INTEGER NOT NULL REFERENCES dataset_rows(id) ON DELETE CASCADE,
+            model_version TEXT NOT NULL,
+            session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            predicted TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            probabilities TEXT NOT NULL,
+            PRIMARY KEY (row_id, model_version)
+        ) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_predictions_session
+            ON predictions(session_id, model_version, row_id);
+
+        CREATE TABLE IF NOT EXISTS scoring_jobs (
+            id TEXT PRIMARY KEY,
+            session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            model_version TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            rows_total INTEGER NOT NULL DEFAULT 0,
+            rows_scored INTEGER NOT NULL DEFAULT 0,
+            message TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_scoring_jobs_session
+            ON scoring_jobs(session_id);
+
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            row_key TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS replication_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            base_id TEXT,
+            next_segment INTEGER NOT NULL DEFAULT 1,
+            bytes_since_base INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS dataset_uploads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            filename TEXT NOT NULL,
+            format TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'processing',
+            rows_ingested INTEGER NOT NULL DEFAULT 0,
+            message TEXT,
+            created_at TEXT NOT NULL,
+            finished_at TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO data_version (id, value) VALUES (1, 0);
     """)
-    db.commit()
 
     # Migrate: add train_result column if missing
     cols = [row[1] for row in db.execute("PRAGMA table_info(sessions)").fetchall()]
     if "train_result" not in cols:
         db.execute("ALTER TABLE sessions ADD COLUMN train_result TEXT")
-        db.commit()
+    if "tuned_params" not in cols:
+        db.execute("ALTER TABLE sessions ADD COLUMN tuned_params TEXT")
+    if "data_version" not in cols:
+        db.execute("ALTER TABLE sessions ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0")
+
+    # Migrate: move count_*/area_* metrics out of the JSON blobs into typed columns
+    if db.execute("PRAGMA user_version").fetchone()[0] < 1:
+        with transaction(db):
+            row_store.migrate(db)
+            db.execute("PRAGMA user_version = 1")
+
+    # Migrate: store data blobs compact so responses can copy them verbatim
+    if db.execute("PRAGMA user_version").fetchone()[0] < 2:
+        with transaction(db):
+            row_store.compact_blobs(db)
+            db.execute("PRAGMA user_version = 2")
+
+    # Change-log replication to S3, see replication.py
+    if replication.ENABLED:
+        replication.install_triggers(db)
+    else:
+        replication.drop_triggers(db)
 
     # Seed with mock data if tables are empty
     count = db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
     if count == 0:
-        _seed(db)
+        with transaction(db):
+            _seed(db)
 
 
 def _seed(db: sqlite3.Connection):
@@ -171,13 +494,6 @@ def _seed(db: sqlite3.Connection):
         )
         session_id = cursor.lastrowid
 
-        db.executemany(
-            """INSERT INTO dataset_rows (session_id, target_column, data)
-               VALUES (?, ?, ?)""",
-            [
-                (session_id, row.get(target_col, ""), json.dumps(row))
-                for row in rows
-            ],
+        row_store.insert_rows(
+            db, session_id, [(row.get(target_col, ""), row) for row in rows]
         )
-
-    db.commit()
@@ -0,0 +1,74 @@
+"""Chunked parsing of uploaded dataset files.
+
+CSV is read with pandas in fixed-size chunks; Parquet is read batch by batch
+with pyarrow. Either way only one chunk of rows is held in memory at a time.
+
+Columns are read with pandas' nullable dtypes, so an integer column with gaps
+is stored as 2, not 2.0, just as the JSON row endpoints would store it.
+"""
+
+import math
+import os
+from typing import BinaryIO, Iterator
+
+import row_store
+
+CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", "5000"))
+
+
+def detect_format(filename: str, content_type: str | None) -> str:
+    name = filename.lower()
+    if name.endswith((".parquet", ".pq")) or (content_type or "").endswith("parquet"):
+        return "parquet"
+    return "csv"
+
+
+def _frames(file: BinaryIO, fmt: str, target_column: str | None):
+    import pandas as pd
+
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        nullable_ints = {
+            pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype(),
+            pa.int32(): pd.Int32Dtype(), pa.int64(): pd.Int64Dtype(),
+            pa.uint8(): pd.UInt8Dtype(), pa.uint16(): pd.UInt16Dtype(),
+            pa.uint32(): pd.UInt32Dtype(), pa.uint64(): pd.UInt64Dtype(),
+        }
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=CHUNK_ROWS):
+            yield batch.to_pandas(types_mapper=nullable_ints.get)
+        return
+
+    # Labels stay strings even when they look numeric ("1", "2", ...)
+    dtype = {target_column: "string"} if target_column else None
+    yield from pd.read_csv(file, chunksize=CHUNK_ROWS, dtype=dtype, dtype_backend="numpy_nullable")
+
+
+def iter_row_chunks(
+    file: BinaryIO, fmt: str, target_column: str | None, feature_columns: list[str]
+) -> Iterator[list[tuple[str, dict]]]:
+    """Yield lists of (label, data) pairs, one list per chunk of the file.
+
+    Feature columns and count_*/area_* metrics are coerced to numbers; values
+    that are missing or not numeric are left out of the row.
+    """
+    import pandas as pd
+
+    for df in _frames(file, fmt, target_column):
+        numeric = [
+            c for c in df.columns
+            if c != target_column and (c in feature_columns or row_store.METRIC_NAME.match(str(c)))
+        ]
+        for c in numeric:
+            df[c] = pd.to_numeric(df[c], errors="coerce", dtype_backend="numpy_nullable")
+
+        chunk = []
+        for record in df.to_dict("records"):
+            data = {
+                str(k): v for k, v in record.items()
+                if not (v is None or v is pd.NA or (isinstance(v, float) and math.isnan(v)))
+            }
+            label = str(data.get(target_column, "")) if target_column else ""
+            chunk.append((label, data))
+        yield chunk
@@ -0,0 +1,71 @@
+"""Shared bookkeeping for the background job tables (`train_jobs`, `scoring_jobs`).
+
+Both tables have `id`, `status`, `message` and `finished_at` columns; the
+worker updates its row as it goes and the API polls it. What follows a job
+in the server process (S3 uploads, extra DB writes) runs on one finisher
+thread, see `after_job`.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from database import connection
+
+_finisher: ThreadPoolExecutor | None = None
+_finisher_lock = threading.Lock()
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def update_job(db, table: str, job_id: str, **fields):
+    set_parts = ", ".join(f"{k} = ?" for k in fields)
+    db.execute(
+        f"UPDATE {table} SET {set_parts} WHERE id = ?",
+        (*fields.values(), job_id),
+    )
+
+
+def recover_jobs(table: str):
+    """Fail jobs left queued/running by a previous process. Called on startup."""
+    with connection() as db:
+        cursor = db.execute(
+            f"""UPDATE {table}
+                SET status = 'failed', message = 'Interrupted by server restart', finished_at = ?
+                WHERE status IN ('queued', 'running')""",
+            (now(),),
+        )
+    if cursor.rowcount:
+        print(f"[jobs] Marked {cursor.rowcount} interrupted job(s) in {table} as failed")
+
+
+def after_job(fn, *args):
+    """Run `fn(*args)` on the finisher thread, after earlier calls. Errors are logged.
+
+    Done callbacks run on the process pool's management thread, which can't
+    collect results or start queued jobs until they return, so they should
+    only record the outcome and hand slow work (uploads) to this.
+    """
+    global _finisher
+    with _finisher_lock:
+        if _finisher is None:
+            _finisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-finisher")
+
+    def run():
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"[jobs] {fn.__name__} failed: {type(e).__name__}: {e}")
+
+    _finisher.submit(run)
+
+
+def drain():
+    """Wait for the work handed to `after_job` so far (e.g. on shutdown)."""
+    global _finisher
+    with _finisher_lock:
+        finisher, _finisher = _finisher, None
+    if finisher is not None:
+        finisher.shutdown(wait=True)
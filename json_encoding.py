@@ -0,0 +1,50 @@
+"""JSON encoding of API responses.
+
+By default responses are encoded exactly like FastAPI's JSONResponse. With
+JSON_ENCODER=orjson (and orjson installed) routes returning plain dicts and
+lists are encoded with orjson instead, several times faster on large
+payloads. Its output differs in edge cases: floats in exponent form are
+written as 1e-5 rather than 1e-05, and NaN becomes null instead of an error.
+Row listings are unaffected; they splice pre-encoded rows (see
+`routes.rows._row_encoder`).
+"""
+
+import json
+import os
+
+from fastapi.datastructures import Default
+from fastapi.responses import JSONResponse
+
+ENCODER = os.environ.get("JSON_ENCODER", "json").lower()
+
+# Byte for byte what JSONResponse.render produces, as text
+encode = json.JSONEncoder(
+    ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+).encode
+
+orjson = None
+if ENCODER == "orjson":
+    try:
+        import orjson
+    except ImportError:
+        print("[json_encoding] JSON_ENCODER=orjson but orjson is not installed; using json")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return encode(content).encode("utf-8")
+
+
+class OrjsonResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+def response_class():
+    """The app's default response class for the configured encoder.
+
+    Left as FastAPI's placeholder unless orjson is on, so routes with a
+    response model keep serializing straight from pydantic.
+    """
+    return OrjsonResponse if orjson is not None else Default(JSONResponse)
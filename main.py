@@ -1,20 +1,83 @@
+import os
+import random
 import time
 import logging
+import threading
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from s3_sync import download_all
-from database import init_db
-from routes import train, sessions, rows
+from s3_sync import download_all, flush_db_upload, schedule_db_upload
+from database import add_write_listener, init_db
+import jobs
+import json_encoding
+import metrics
+from training import shutdown_executor
+from routes import train, sessions, rows, predictions
 
 logger = logging.getLogger("grade-ninja")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
 
+# Fraction of requests written to the access log; server errors are always logged
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get("ACCESS_LOG_SAMPLE_RATE", "0.01"))
+
+_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "Request latency by route", labelnames=("method", "route")
+)
+_requests = metrics.counter(
+    "http_requests_total", "Requests by route and status", ("method", "route", "status")
+)
+_in_flight = metrics.gauge("http_requests_in_flight", "Requests currently being served").labels()
+
+# Startup work runs on a background thread so the port is bound, and `/`
+# answers liveness checks, while the DB is restored and migrated. `/ready`
+# and the API report 503 until it has finished.
+startup = {"status": "starting", "phasesMs": {}, "error": None}
+
+
+def _recover_jobs():
+    jobs.recover_jobs("train_jobs")
+    jobs.recover_jobs("scoring_jobs")
+
+
+def initialize():
+    phases = startup["phasesMs"]
+    try:
+        for name, step in (
+            ("s3Download", download_all),
+            ("initDb", init_db),
+            ("recoverJobs", _recover_jobs),
+        ):
+            started = time.perf_counter()
+            step()
+            phases[name] = round((time.perf_counter() - started) * 1000, 1)
+        add_write_listener(schedule_db_upload)
+        startup["status"] = "ready"
+        logger.info(f"Startup complete: {phases}")
+    except Exception as e:
+        startup["status"] = "failed"
+        startup["error"] = f"{type(e).__name__}: {e}"
+        logger.exception("Startup failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    threading.Thread(target=initialize, name="startup", daemon=True).start()
+    yield
+    # uvicorn re-raises SIGTERM after shutting down, so atexit handlers never run
+    shutdown_executor()
+    jobs.drain()
+    flush_db_upload()
+
+
 app = FastAPI(
     title="Grade Ninja API",
     version="0.1.0",
     description="ML-powered leather grading API. Classifies industrial leather hides based on defect analysis.",
+    lifespan=lifespan,
+    default_response_class=json_encoding.response_class(),
 )
 
 app.add_middleware(
@@ -23,26 +86,44 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After-Id", "X-Model-Version", "ETag"],
 )
 
 
 @app.middleware("http")
-async def log_request_timing(request: Request, call_next):
-    start = time.time()
-    method = request.method
-    path = request.url.path
-    logger.info(f"→ {method} {path} received")
-    response = await call_next(request)
-    elapsed_ms = (time.time() - start) * 1000
-    logger.info(f"← {method} {path} {response.status_code} ({elapsed_ms:.0f}ms)")
-    return response
+async def require_ready(request: Request, call_next):
+    if startup["status"] != "ready" and request.url.path.startswith("/api/"):
+        detail = "Service is starting" if startup["status"] == "starting" else "Service failed to start"
+        return JSONResponse({"detail": detail}, status_code=503, headers={"Retry-After": "1"})
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    start = time.perf_counter()
+    # Lets handlers tell how long reading and validating the body took
+    request.state.received = start
+    status = 500
+    _in_flight.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        _in_flight.dec()
+        # Label by route template, not raw path, to keep one series per endpoint
+        route = request.scope.get("route")
+        route = route.path if route is not None else "unmatched"
+        _request_seconds.labels(request.method, route).observe(elapsed)
+        _requests.labels(request.method, route, str(status)).inc()
+        if status >= 500 or random.random() < ACCESS_LOG_SAMPLE_RATE:
+            logger.info("%s %s %d (%.1fms)", request.method, request.url.path, status, elapsed * 1000)
 
 app.include_router(train.router)
 app.include_router(sessions.router)
 app.include_router(rows.router)
-
-download_all()
-init_db()
+app.include_router(predictions.router)
 
 
 @app.get("/", tags=["health"], summary="Health check")
@@ -51,6 +132,29 @@ def health_check():
     return {"status": "ok", "service": "grade-ninja-api"}
 
 
+@app.get("/ready", tags=["health"], summary="Readiness check")
+def readiness_check():
+    """Returns 200 once startup (S3 restore, DB migrations, job recovery) has finished, 503 before."""
+    return JSONResponse(startup, status_code=200 if startup["status"] == "ready" else 503)
+
+
+def _collect_startup():
+    return [
+        ("app_ready", "gauge", "1 once startup has finished", [({}, int(startup["status"] == "ready"))]),
+        ("app_startup_phase_seconds", "gauge", "Duration of each startup phase",
+         [({"phase": name}, ms / 1000) for name, ms in startup["phasesMs"].items()]),
+    ]
+
+
+metrics.add_collector(_collect_startup)
+
+
+@app.get("/metrics", tags=["health"], summary="Prometheus metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Request latencies, SQLite query times, model cache, batching, training and S3 transfer metrics."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
 
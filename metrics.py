@@ -0,0 +1,204 @@
+"""In-process metrics, served in Prometheus text format by `GET /metrics`.
+
+Modules declare their metrics at import time with `counter`, `gauge` and
+`histogram`, and update them on the hot path: an update is a dict lookup
+and a short lock, no I/O. State that a module already tracks itself (model
+cache counters, startup phases) is read at scrape time through
+`add_collector` instead of being counted twice.
+
+Everything is per process; training and scoring workers report back through
+their parent (see `training._on_job_done`).
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers a cached read (~1 ms) up to a slow S3 restore
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class Histogram:
+    """Fixed-bucket histogram; `snapshot` reports cumulative counts per upper bound."""
+
+    def __init__(self, bounds: list[float]):
+        self.bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, value)] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip([*self.bounds, "+Inf"], counts):
+            running += count
+            cumulative.append({"le": bound, "count": running})
+        return {"buckets": cumulative, "count": running, "sum": round(total, 3)}
+
+
+class Counter:
+    """A single value that only goes up."""
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge(Counter):
+    """A single value that can go up and down."""
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Metric:
+    """A named metric with one series per combination of label values."""
+
+    def __init__(self, name: str, help: str, kind: str, factory, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self._factory = factory
+        self._series: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Return the series for `values` (one per label name), creating it on first use."""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                series = self._series.setdefault(values, self._factory())
+        return series
+
+    def samples(self):
+        with self._lock:
+            items = list(self._series.items())
+        for values, series in items:
+            yield dict(zip(self.labelnames, values)), series
+
+
+_metrics: list[Metric] = []
+_collectors: list = []
+
+
+def _register(metric: Metric) -> Metric:
+    _metrics.append(metric)
+    return metric
+
+
+def counter(name: str, help: str, labelnames: tuple = ()) -> Metric:
+    return _register(Metric(name, help, "counter", Counter, labelnames))
+
+
+def gauge(name: str, help: str, labelnames: tuple = ()) -> Metric:
+    return _register(Metric(name, help, "gauge", Gauge, labelnames))
+
+
+def histogram(name: str, help: str, bounds: list[float] = LATENCY_BUCKETS,
+              labelnames: tuple = ()) -> Metric:
+    return _register(Metric(name, help, "histogram", lambda: Histogram(bounds), labelnames))
+
+
+def add_collector(collect):
+    """Register `collect()`, called on every scrape.
+
+    It returns a list of `(name, kind, help, samples)` where samples is a list
+    of `(labels dict, value)`; kind is "counter" or "gauge".
+    """
+    _collectors.append(collect)
+
+
+# Shared by s3_sync and replication
+s3_transfer_bytes = counter(
+    "s3_transfer_bytes_total", "Bytes transferred to and from S3", ("direction",)
+)
+s3_transfer_seconds = histogram(
+    "s3_transfer_duration_seconds", "Duration of individual S3 transfers",
+    [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120], ("direction",),
+)
+
+
+class _Transfer:
+    __slots__ = ("bytes",)
+
+    def __init__(self, nbytes: int):
+        self.bytes = nbytes
+
+
+@contextmanager
+def s3_transfer(direction: str, nbytes: int = 0):
+    """Time one S3 transfer ("upload" or "download").
+
+    Pass the size up front or set `.bytes` on the yielded object once it is
+    known. Failed transfers are not recorded.
+    """
+    transfer = _Transfer(nbytes)
+    started = time.perf_counter()
+    yield transfer
+    s3_transfer_seconds.labels(direction).observe(time.perf_counter() - started)
+    s3_transfer_bytes.labels(direction).inc(transfer.bytes)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value))
+    return repr(value)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, series in metric.samples():
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_labels(labels)} {_number(series.value)}")
+                continue
+            snap = series.snapshot()
+            for bucket in snap["buckets"]:
+                le = bucket["le"] if bucket["le"] == "+Inf" else _number(float(bucket["le"]))
+                lines.append(f"{metric.name}_bucket{_labels({**labels, 'le': le})} {bucket['count']}")
+            lines.append(f"{metric.name}_sum{_labels(labels)} {_number(snap['sum'])}")
+            lines.append(f"{metric.name}_count{_labels(labels)} {snap['count']}")
+
+    for collect in _collectors:
+        for name, kind, help, samples in collect():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
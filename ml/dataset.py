@@ -0,0 +1,112 @@
+"""Load a session's rows straight from SQLite into NumPy arrays."""
+
+import sqlite3
+from typing import Iterator
+
+import numpy as np
+
+import row_store
+
+CHUNK_SIZE = 10_000
+_PLAIN = (int, float, bool, type(None))
+
+
+def _feature_expr(column: str, typed: set[str]) -> str:
+    # The raw JSON value; to_float_matrix coerces text the way pandas does
+    path = "'$.\"" + column.replace("'", "''").replace('"', '\\"') + "\"'"
+    from_blob = f"json_extract(data, {path})"
+    # Typed metric columns only ever hold numbers; values that didn't fit one stay in the blob
+    if column in typed:
+        return f"COALESCE({row_store.quote(column)}, {from_blob})"
+    return from_blob
+
+
+def to_float_matrix(values: list, width: int) -> np.ndarray:
+    """Coerce rows of JSON scalars to a float64 matrix the way `frame_to_arrays` does.
+
+    Numbers, booleans and None (-> NaN) convert directly. Rows holding text
+    (or nested values) go through pd.to_numeric(errors="coerce"), so "12"
+    counts as 12 and "n/a" as NaN, exactly as on the request-rows path;
+    pandas is only used then.
+    """
+    if all(type(v) in _PLAIN for row in values for v in row):
+        return np.array(values, dtype=np.float64).reshape(-1, width)
+    import pandas as pd
+
+    block = np.array(values, dtype=object).reshape(-1, width)
+    X = np.empty(block.shape, dtype=np.float64)
+    for j in range(width):
+        X[:, j] = pd.to_numeric(block[:, j], errors="coerce")
+    return X
+
+
+def load_session_arrays(
+    db: sqlite3.Connection, session_id: int, feature_columns: list[str]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return (X, y) for every labeled row in the session.
+
+    Features are read from the typed metric columns (or extracted from the
+    JSON blob by SQLite for other keys) and copied into a float64 matrix chunk
+    by chunk, so no per-row dicts or DataFrames are built.
+    """
+    # labeled_count is maintained on every write, so it sizes the matrix up front
+    row = db.execute(
+        "SELECT labeled_count FROM sessions WHERE id = ?", (session_id,)
+    ).fetchone()
+    capacity = row[0] if row else 0
+
+    typed = set(row_store.metric_columns(db))
+    select = ", ".join(
+        ["target_column"] + [_feature_expr(c, typed) for c in feature_columns]
+    )
+    cursor = db.cursor()
+    cursor.row_factory = None
+    cursor.execute(
+        f"""SELECT {select} FROM dataset_rows
+            WHERE session_id = ? AND target_column != ''
+            ORDER BY id""",
+        (session_id,),
+    )
+
+    width = len(feature_columns)
+    X = np.empty((capacity, width), dtype=np.float64)
+    labels: list[str] = []
+    filled = 0
+    while True:
+        chunk = cursor.fetchmany(CHUNK_SIZE)
+        if not chunk:
+            break
+        if filled + len(chunk) > len(X):
+            grown = np.empty((max(2 * len(X), filled + len(chunk)), width), dtype=np.float64)
+            grown[:filled] = X[:filled]
+            X = grown
+        X[filled:filled + len(chunk)] = to_float_matrix([r[1:] for r in chunk], width)
+        labels.extend(r[0] for r in chunk)
+        filled += len(chunk)
+
+    return X[:filled], np.array(labels, dtype=object)
+
+
+def iter_unlabeled_chunks(
+    db: sqlite3.Connection, session_id: int, feature_columns: list[str],
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Yield (row_ids, X) for the session's unlabeled rows, `chunk_size` rows at a time."""
+    typed = set(row_store.metric_columns(db))
+    select = ", ".join(["id"] + [_feature_expr(c, typed) for c in feature_columns])
+    cursor = db.cursor()
+    cursor.row_factory = None
+    cursor.execute(
+        f"""SELECT {select} FROM dataset_rows
+            WHERE session_id = ? AND target_column = ''
+            ORDER BY id""",
+        (session_id,),
+    )
+    width = len(feature_columns)
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            break
+        ids = np.array([r[0] for r in chunk], dtype=np.int64)
+        X = to_float_matrix([r[1:] for r in chunk], width)
+        yield ids, X
@@ -0,0 +1,249 @@
+"""Vectorized NumPy inference for trained Random Forests.
+
+`compile_forest` flattens every tree of a fitted `RandomForestClassifier` into
+one set of node arrays. `CompiledForest.predict` then walks all trees for the
+whole batch at once, one tree level per step, instead of calling into sklearn
+once per estimator. That wins by an order of magnitude on small batches; on
+batches of hundreds of rows sklearn's Cython traversal is faster again (see
+benchmarks/forest_inference.py).
+
+Predictions match sklearn's exactly: inputs are compared as float32 like
+sklearn's tree code, missing values follow each node's `missing_go_to_left`,
+and per-tree probabilities are summed in tree order before the argmax.
+
+A compiled forest is saved as a directory of `.npy` files plus a
+`manifest.json` recording its size, tree count, feature columns and class
+labels. The arrays can be loaded with `mmap_mode="r"` so worker processes
+share pages, and `pack` / `unpack` turn the directory into a single
+(optionally gzipped) tar for transfer.
+"""
+
+import json
+import os
+import shutil
+import tarfile
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+ARRAYS = ("roots", "feature", "threshold", "children", "missing_left", "value")
+
+
+class CompiledForest:
+    """Node arrays for all trees, concatenated tree after tree:
+
+    - roots: index of each tree's root node
+    - feature / threshold: the split test (unused at leaves)
+    - children: node index of the (left, right) child; leaves point back at
+      themselves
+    - missing_left: where NaN inputs go
+    - value: normalized class probabilities
+    """
+
+    def __init__(self, roots, feature, threshold, children, missing_left, value,
+                 classes, n_features: int, max_depth: int, meta: dict | None = None):
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.value = value
+        self.classes = classes
+        self.n_features = n_features
+        self.max_depth = max_depth
+        self.meta = meta or {}
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Return the leaf node for every (tree, sample) pair, tree-major.
+
+        All pairs descend one level per step; pairs that reached a leaf drop
+        out of the working set, so deep trees only cost what they use.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n = X.shape[0]
+        feature = self.feature
+        threshold = self.threshold
+        children = self.children.reshape(-1)
+        missing_left = self.missing_left
+        x_flat = X.reshape(-1)
+
+        current = np.repeat(np.asarray(self.roots, dtype=np.int32), n)
+        sample_base = np.tile(np.arange(n, dtype=np.int32) * self.n_features, self.n_trees)
+        position = np.arange(current.size)
+        leaves = np.empty(current.size, dtype=np.int32)
+        for _ in range(self.max_depth):
+            x = x_flat.take(sample_base + feature.take(current))
+            # NaN compares False, so it lands right unless the node says otherwise
+            go_right = ~(x <= threshold.take(current))
+            missing = np.isnan(x)
+            if missing.any():
+                go_right[missing] = ~missing_left.take(current[missing])
+            child = children.take(current * 2 + go_right)
+            moved = child != current
+            if not moved.all():
+                leaves[position[~moved]] = current[~moved]
+                child = child[moved]
+                sample_base = sample_base[moved]
+                position = position[moved]
+            current = child
+            if not current.size:
+                break
+        leaves[position] = current
+        return leaves
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        n = len(X)
+        leaves = self.value.take(self._leaves(X), axis=0)
+        # Sum over axis 0 adds tree by tree, the same order sklearn accumulates in
+        proba = leaves.reshape(self.n_trees, n, -1).sum(axis=0)
+        return proba / self.n_trees
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def compile_forest(rf, meta: dict | None = None) -> CompiledForest:
+    """Flatten a fitted RandomForestClassifier into concatenated node arrays."""
+    trees = [est.tree_ for est in rf.estimators_]
+    counts = np.array([t.node_count for t in trees])
+    roots = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int32)
+    n_nodes = int(counts.sum())
+    n_classes = len(rf.classes_)
+    # Feature indices fit in int16 for any realistic dataset
+    feature_dtype = np.int16 if rf.n_features_in_ <= np.iinfo(np.int16).max else np.int32
+
+    feature = np.zeros(n_nodes, dtype=feature_dtype)
+    threshold = np.zeros(n_nodes, dtype=np.float64)
+    children = np.zeros((n_nodes, 2), dtype=np.int32)
+    missing_left = np.zeros(n_nodes, dtype=bool)
+    value = np.zeros((n_nodes, n_classes), dtype=np.float64)
+
+    for t, base in zip(trees, roots):
+        n = t.node_count
+        nodes = slice(base, base + n)
+        is_leaf = t.children_left[:n] == -1
+        own = np.arange(n)
+        feature[nodes] = np.where(is_leaf, 0, t.feature[:n])
+        threshold[nodes] = t.threshold[:n]
+        children[nodes, 0] = base + np.where(is_leaf, own, t.children_left[:n])
+        children[nodes, 1] = base + np.where(is_leaf, own, t.children_right[:n])
+        missing_left[nodes] = t.missing_go_to_left[:n].astype(bool)
+        # Normalize like DecisionTreeClassifier.predict_proba
+        v = t.value[:n, 0, :n_classes]
+        totals = v.sum(axis=1, keepdims=True)
+        totals[totals == 0.0] = 1.0
+        value[nodes] = v / totals
+
+    return CompiledForest(
+        roots, feature, threshold, children, missing_left, value,
+        classes=np.asarray(rf.classes_),
+        n_features=int(rf.n_features_in_),
+        max_depth=max(t.max_depth for t in trees),
+        meta=meta,
+    )
+
+
+def _replace_dir(tmp: Path, path: Path):
+    """Move directory `tmp` to `path`, swapping out any existing directory.
+
+    Not atomic: a directory can't be renamed over another, so `path` is
+    missing between the two renames. Readers never see a partly written
+    forest, but may briefly see none (see `swapping`).
+    """
+    old = None
+    if path.exists():
+        old = path.with_name(f"{path.name}.old-{uuid.uuid4().hex[:8]}")
+        os.rename(path, old)
+    os.rename(tmp, path)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def save(forest: CompiledForest, path: Path) -> dict:
+    """Write the forest to directory `path`, replacing any previous one.
+
+    The files are written to a new directory that is then moved into place
+    (see `_replace_dir`). Returns the manifest.
+    """
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.tmp-{uuid.uuid4().hex[:8]}")
+    tmp.mkdir(parents=True)
+    size = 0
+    for name in ARRAYS:
+        np.save(tmp / f"{name}.npy", getattr(forest, name))
+        size += (tmp / f"{name}.npy").stat().st_size
+    manifest = {
+        **forest.meta,
+        "format": FORMAT_VERSION,
+        "classes": forest.classes.tolist(),
+        "n_features": forest.n_features,
+        "n_trees": forest.n_trees,
+        "n_nodes": forest.n_nodes,
+        "max_depth": forest.max_depth,
+        "size_bytes": size,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    (tmp / MANIFEST_FILENAME).write_text(json.dumps(manifest))
+
+    _replace_dir(tmp, path)
+    return manifest
+
+
+def swapping(path: Path) -> bool:
+    """Whether `_replace_dir` is between its two renames for directory `path`."""
+    path = Path(path)
+    return any(path.parent.glob(f"{path.name}.old-*"))
+
+
+def read_manifest(path: Path) -> dict:
+    """Read the manifest of the compiled forest in directory `path`."""
+    manifest = json.loads((Path(path) / MANIFEST_FILENAME).read_text())
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compiled forest format: {manifest.get('format')}")
+    return manifest
+
+
+def load(path: Path, mmap_mode: str | None = None) -> CompiledForest:
+    """Load a compiled forest; `mmap_mode="r"` maps the arrays instead of reading them."""
+    path = Path(path)
+    manifest = read_manifest(path)
+    arrays = {name: np.load(path / f"{name}.npy", mmap_mode=mmap_mode) for name in ARRAYS}
+    return CompiledForest(
+        **arrays,
+        classes=np.asarray(manifest["classes"]),
+        n_features=manifest["n_features"],
+        max_depth=manifest["max_depth"],
+        meta=manifest,
+    )
+
+
+def pack(path: Path, archive: Path, compress: bool = True):
+    """Write the forest directory `path` into a tar archive, gzipped if `compress`."""
+    with tarfile.open(archive, "w:gz" if compress else "w") as tar:
+        for name in (MANIFEST_FILENAME, *(f"{a}.npy" for a in ARRAYS)):
+            tar.add(Path(path) / name, arcname=name)
+
+
+def unpack(archive: Path, path: Path):
+    """Extract an archive written by `pack` into directory `path`, replacing it
+    the way `save` does.
+    """
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.tmp-{uuid.uuid4().hex[:8]}")
+    with tarfile.open(archive, "r:*") as tar:
+        tar.extractall(tmp, filter="data")
+    read_manifest(tmp)
+
+    _replace_dir(tmp, path)
@@ -1,82 +1,197 @@
+import time
+import warnings
+from typing import Callable
+
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
 
+from profiling import StageProfiler
 
-def train_random_forest(
-    df: pd.DataFrame, target_column: str, feature_columns: list[str]
-) -> dict:
-    """Train a Random Forest classifier and return model + full metrics.
 
-    Returns dict with: model, accuracy, train_size, test_size,
-    confusion_matrix, classification_report, feature_importances,
-    target_distribution
-    """
+def frame_to_arrays(
+    df: pd.DataFrame, target_column: str, feature_columns: list[str]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Coerce features to float and drop rows without a label."""
     X = df[feature_columns].apply(pd.to_numeric, errors="coerce")
     y = df[target_column]
 
     # Drop rows where target is NaN or empty
     valid = y.notna() & (y != "")
-    X = X.loc[valid]
-    y = y.loc[valid]
+    return X.loc[valid].to_numpy(dtype=np.float64), y.loc[valid].to_numpy()
 
-    # Need at least 2 samples per class for stratified split
-    if len(y) < 5 or y.nunique() < 2:
-        raise ValueError(
-            f"Not enough data to train: {len(y)} rows, {y.nunique()} classes"
-        )
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
+def _grow_forest(
+    X_train: np.ndarray,
+    y_train: np.ndarray,
+    max_trees: int,
+    tree_step: int,
+    tolerance: float,
+    patience: int,
+    time_budget: float | None,
+    progress: Callable[[str, float], None] | None,
+    params: dict,
+) -> tuple[RandomForestClassifier, list[dict]]:
+    """Add trees in steps of `tree_step` until out-of-bag accuracy converges.
 
+    Stops once the OOB score has moved by at most `tolerance` for `patience`
+    consecutive steps, or when `max_trees` or `time_budget` seconds is reached.
+    """
     rf = RandomForestClassifier(
-        n_estimators=1000,
+        n_estimators=min(tree_step, max_trees),
+        warm_start=True,
+        oob_score=True,
         random_state=42,
         n_jobs=-1,
-        class_weight="balanced",
-        verbose=1,
+        **{"class_weight": "balanced", **params},
     )
-    rf.fit(X_train, y_train)
-
-    y_pred = rf.predict(X_test)
-    acc = accuracy_score(y_test, y_pred)
-
-    # Confusion matrix as {actual: {predicted: count}}
-    labels = sorted(y.unique())
-    cm = confusion_matrix(y_test, y_pred, labels=labels)
-    cm_dict = {}
-    for i, actual in enumerate(labels):
-        cm_dict[str(actual)] = {
-            str(labels[j]): int(cm[i][j]) for j in range(len(labels))
-        }
+    curve: list[dict] = []
+    stable = 0
+    started = time.monotonic()
+    while True:
+        with warnings.catch_warnings():
+            # Early steps leave some samples without OOB votes, and sklearn warns
+            # about class_weight presets with warm_start; both are expected here
+            warnings.simplefilter("ignore", UserWarning)
+            rf.fit(X_train, y_train)
 
-    # Classification report as per-class dict
-    report = classification_report(y_test, y_pred, labels=labels, output_dict=True)
+        score = float(rf.oob_score_)
+        if curve and abs(score - curve[-1]["oobScore"]) <= tolerance:
+            stable += 1
+        else:
+            stable = 0
+        curve.append({"trees": rf.n_estimators, "oobScore": round(score, 4)})
+        if progress:
+            progress("fitting", 0.1 + 0.6 * rf.n_estimators / max_trees)
+
+        if stable >= patience or rf.n_estimators >= max_trees:
+            break
+        if time_budget is not None and time.monotonic() - started >= time_budget:
+            break
+        rf.set_params(n_estimators=min(rf.n_estimators + tree_step, max_trees))
+
+    return rf, curve
+
+
+def check_trainable(y: np.ndarray) -> None:
+    """Raise ValueError if `y` is too small for the stratified holdout split."""
+    classes = np.unique(y)
+    # Need at least 2 samples per class for stratified split
+    if len(y) < 5 or len(classes) < 2:
+        raise ValueError(
+            f"Not enough data to train: {len(y)} rows, {len(classes)} classes"
+        )
 
-    # Feature importances
-    importances = {
-        col: round(float(imp), 4)
-        for col, imp in zip(feature_columns, rf.feature_importances_)
-    }
 
-    # Target distribution in training data
-    dist = y.value_counts().to_dict()
-    target_dist = {str(k): int(v) for k, v in dist.items()}
+def holdout_split(X: np.ndarray, y: np.ndarray):
+    """The stratified 80/20 (X_train, X_test, y_train, y_test) split models are scored on.
 
-    # Weighted averages from report
-    weighted = report.get("weighted avg", {})
+    Anything that tunes the model (see `ml.tuning`) must only see the
+    training part, or the reported accuracy is measured on rows it chose for.
+    """
+    return train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+
+
+def fit_random_forest(
+    X: np.ndarray,
+    y: np.ndarray,
+    feature_columns: list[str],
+    progress: Callable[[str, float], None] | None = None,
+    n_estimators: int = 1000,
+    adaptive: bool = False,
+    tree_step: int = 50,
+    tolerance: float = 0.002,
+    patience: int = 2,
+    time_budget: float | None = None,
+    params: dict | None = None,
+    profiler: StageProfiler | None = None,
+) -> dict:
+    """Train a Random Forest classifier and return model + full metrics.
+
+    `X` is a float feature matrix (NaN for missing values) with one column per
+    entry in `feature_columns`; `y` holds the non-empty labels.
+    `progress(stage, fraction)` is called as training moves between stages.
+
+    By default a fixed forest of `n_estimators` trees is fitted. With
+    `adaptive=True` the forest is grown with warm_start and `n_estimators`
+    becomes an upper bound (see `_grow_forest`). `params` overrides the
+    default RandomForestClassifier hyperparameters (e.g. a tuned config).
+    The split, fit, evaluation and report stages are recorded on `profiler`.
+
+    Returns dict with: model, accuracy, train_size, test_size,
+    confusion_matrix, classification_report, feature_importances,
+    target_distribution, n_estimators, oob_curve, hyperparameters
+    """
+    check_trainable(y)
+    classes, class_counts = np.unique(y, return_counts=True)
 
-    # Evaluation
-    print("\n" + "=" * 50)
-    print("RANDOM FOREST RESULTS")
-    print("=" * 50)
-    print(f"\nAccuracy: {acc:.4f}")
-    print("\nConfusion Matrix:")
-    print(cm)
-    print("\nClassification Report:")
-    print(classification_report(y_test, y_pred, labels=labels))
+    profiler = profiler or StageProfiler()
+    with profiler.stage("split"):
+        X_train, X_test, y_train, y_test = holdout_split(X, y)
+
+    if progress:
+        progress("fitting", 0.1)
+    with profiler.stage("fit"):
+        if adaptive:
+            rf, oob_curve = _grow_forest(
+                X_train, y_train, n_estimators, tree_step, tolerance, patience,
+                time_budget, progress, params or {},
+            )
+        else:
+            rf = RandomForestClassifier(
+                n_estimators=n_estimators,
+                random_state=42,
+                n_jobs=-1,
+                verbose=1,
+                **{"class_weight": "balanced", **(params or {})},
+            )
+            rf.fit(X_train, y_train)
+            oob_curve = None
+
+    if progress:
+        progress("evaluating", 0.7)
+    with profiler.stage("evaluate"):
+        y_pred = rf.predict(X_test)
+        acc = accuracy_score(y_test, y_pred)
+
+        # Confusion matrix as {actual: {predicted: count}}
+        labels = list(classes)
+        cm = confusion_matrix(y_test, y_pred, labels=labels)
+        cm_dict = {}
+        for i, actual in enumerate(labels):
+            cm_dict[str(actual)] = {
+                str(labels[j]): int(cm[i][j]) for j in range(len(labels))
+            }
+
+    # Both reports (the dict returned and the text printed) are timed together
+    with profiler.stage("report"):
+        # Classification report as per-class dict
+        report = classification_report(y_test, y_pred, labels=labels, output_dict=True)
+
+        # Feature importances
+        importances = {
+            col: round(float(imp), 4)
+            for col, imp in zip(feature_columns, rf.feature_importances_)
+        }
+
+        # Target distribution in training data
+        order = np.argsort(-class_counts, kind="stable")
+        target_dist = {str(classes[i]): int(class_counts[i]) for i in order}
+
+        # Weighted averages from report
+        weighted = report.get("weighted avg", {})
+
+        # Evaluation
+        print("\n" + "=" * 50)
+        print("RANDOM FOREST RESULTS")
+        print("=" * 50)
+        print(f"\nAccuracy: {acc:.4f}")
+        print("\nConfusion Matrix:")
+        print(cm)
+        print("\nClassification Report:")
+        print(classification_report(y_test, y_pred, labels=labels))
 
     return {
         "model": rf,
@@ -99,4 +214,10 @@ def train_random_forest(
         },
         "feature_importances": importances,
         "target_distribution": target_dist,
+        "n_estimators": len(rf.estimators_),
+        "oob_curve": oob_curve,
+        "hyperparameters": {
+            k: rf.get_params()[k]
+            for k in ("max_depth", "min_samples_leaf", "max_features", "class_weight")
+        },
     }
@@ -0,0 +1,159 @@
+"""Time-budgeted hyperparameter search for the session Random Forest.
+
+Candidates are sampled from a small grid and scored with stratified k-fold
+cross-validation in a process pool. Successive halving keeps the best third
+of the candidates after each round and triples the number of trees, so weak
+configurations are dropped after a cheap evaluation. The search stops at the
+wall-clock budget and returns the best configuration scored so far; the pool
+is terminated then, so evaluations still running don't outlive the budget.
+"""
+
+import itertools
+import math
+import multiprocessing
+import os
+import queue
+import random
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+SEARCH_SPACE = {
+    "max_depth": [None, 8, 16, 32],
+    "min_samples_leaf": [1, 2, 4, 8],
+    "max_features": ["sqrt", "log2", 0.5, None],
+    "class_weight": ["balanced", "balanced_subsample", None],
+}
+
+ETA = 3
+MIN_TREES = 25
+
+# Per-worker copies of the training data, set once by _init_worker
+_X: np.ndarray | None = None
+_y: np.ndarray | None = None
+_folds: list[tuple[np.ndarray, np.ndarray]] = []
+
+
+def _init_worker(X: np.ndarray, y: np.ndarray, folds):
+    global _X, _y, _folds
+    _X, _y, _folds = X, y, folds
+
+
+def _cv_scores(params: dict, n_estimators: int) -> list[float]:
+    scores = []
+    for train_idx, test_idx in _folds:
+        rf = RandomForestClassifier(
+            n_estimators=n_estimators, random_state=42, n_jobs=1, **params
+        )
+        rf.fit(_X[train_idx], _y[train_idx])
+        scores.append(float(rf.score(_X[test_idx], _y[test_idx])))
+    return scores
+
+
+def sample_candidates(n: int, seed: int = 42) -> list[dict]:
+    """Draw `n` distinct configurations from SEARCH_SPACE."""
+    keys = list(SEARCH_SPACE)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    rng = random.Random(seed)
+    return rng.sample(grid, min(n, len(grid)))
+
+
+def search(
+    X: np.ndarray,
+    y: np.ndarray,
+    budget_seconds: float = 60,
+    n_candidates: int = 24,
+    folds: int = 5,
+    max_trees: int = 400,
+    workers: int | None = None,
+) -> dict:
+    """Run successive-halving CV search and return the best configuration.
+
+    Returns dict with: params, n_estimators, mean_score, cv_scores, rounds,
+    evaluated, elapsed_seconds, leaderboard
+    """
+    deadline = time.monotonic() + budget_seconds
+    started = time.monotonic()
+
+    _, class_counts = np.unique(y, return_counts=True)
+    k = max(2, min(folds, int(class_counts.min())))
+    splits = list(StratifiedKFold(n_splits=k, shuffle=True, random_state=42).split(X, y))
+
+    candidates = sample_candidates(n_candidates)
+    n_trees = MIN_TREES
+    # (n_trees, mean, scores) of the deepest completed evaluation per candidate
+    best_eval: dict[int, tuple[int, float, list[float]]] = {}
+    rounds = []
+    evaluated = 0
+
+    workers = workers or os.cpu_count() or 1
+    # Unlike a ProcessPoolExecutor, a Pool can kill evaluations that are already running
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(X, y, splits))
+    # (candidate, scores or the exception it raised), filled by the pool's result thread
+    finished: queue.Queue = queue.Queue()
+    alive = list(range(len(candidates)))
+    try:
+        while alive and time.monotonic() < deadline:
+            for i in alive:
+                pool.apply_async(
+                    _cv_scores, (candidates[i], n_trees),
+                    callback=lambda scores, i=i: finished.put((i, scores)),
+                    error_callback=lambda error, i=i: finished.put((i, error)),
+                )
+            done_round = {}
+            while len(done_round) < len(alive):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    i, scores = finished.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if isinstance(scores, BaseException):
+                    raise scores
+                done_round[i] = scores
+                best_eval[i] = (n_trees, float(np.mean(scores)), scores)
+                evaluated += 1
+
+            rounds.append({"trees": n_trees, "candidates": len(alive), "completed": len(done_round)})
+            if len(done_round) < len(alive) or len(alive) == 1 or n_trees >= max_trees:
+                break
+
+            ranked = sorted(done_round, key=lambda i: -np.mean(done_round[i]))
+            alive = ranked[:max(1, math.ceil(len(ranked) / ETA))]
+            n_trees = min(n_trees * ETA, max_trees)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    if not best_eval:
+        raise TimeoutError(
+            f"Hyperparameter search budget of {budget_seconds}s ended before any candidate finished"
+        )
+
+    # Prefer the candidate that survived the most rounds, then the best mean
+    leaderboard = sorted(
+        best_eval.items(), key=lambda item: (-item[1][0], -item[1][1])
+    )
+    best_i, (best_trees, best_mean, best_scores) = leaderboard[0]
+
+    return {
+        "params": candidates[best_i],
+        "n_estimators": best_trees,
+        "mean_score": round(best_mean, 4),
+        "cv_scores": [round(s, 4) for s in best_scores],
+        "rounds": rounds,
+        "evaluated": evaluated,
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+        "leaderboard": [
+            {
+                "params": candidates[i],
+                "trees": trees,
+                "meanScore": round(mean, 4),
+                "stdScore": round(float(np.std(scores)), 4),
+            }
+            for i, (trees, mean, scores) in leaderboard[:10]
+        ],
+    }
@@ -0,0 +1,120 @@
+"""In-process LRU cache for trained models.
+
+Deserializing a 1000-tree forest on every predict call is expensive, so loaded
+models are kept in memory keyed by path. An entry is only reused while the
+file's mtime and size are unchanged (for a directory, the newest mtime and the
+total size of the files in it); `invalidate` drops it explicitly after a
+new model has been written.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import metrics
+
+MAX_ENTRIES = int(os.environ.get("MODEL_CACHE_SIZE", "8"))
+MAX_BYTES = int(os.environ.get("MODEL_CACHE_MAX_BYTES", str(2 * 1024**3)))
+
+_lock = threading.Lock()
+_entries: "OrderedDict[str, tuple[tuple[int, int], int, object]]" = OrderedDict()
+_total_bytes = 0
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+
+def _signature(path: Path) -> tuple[int, int]:
+    st = os.stat(path)
+    if not os.path.isdir(path):
+        return (st.st_mtime_ns, st.st_size)
+    mtime, size = st.st_mtime_ns, 0
+    for entry in os.scandir(path):
+        est = entry.stat()
+        mtime = max(mtime, est.st_mtime_ns)
+        size += est.st_size
+    return (mtime, size)
+
+
+def _evict_locked():
+    global _total_bytes
+    while _entries and (len(_entries) > MAX_ENTRIES or _total_bytes > MAX_BYTES):
+        _, (_, size, _) = _entries.popitem(last=False)
+        _total_bytes -= size
+        _stats["evictions"] += 1
+
+
+def load(path: Path, loader):
+    """Return the object stored at `path`, loading it with `loader(path)` on a miss.
+
+    `path` may be a file or a directory. Raises FileNotFoundError if it does
+    not exist.
+    """
+    global _total_bytes
+    key = str(path)
+    sig = _signature(path)
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == sig:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry[2]
+        _stats["misses"] += 1
+
+    # Load outside the lock so a slow deserialization doesn't block other sessions
+    obj = loader(path)
+
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _total_bytes -= old[1]
+        # A model larger than the whole budget is served but never cached
+        if sig[1] <= MAX_BYTES and MAX_ENTRIES > 0:
+            _entries[key] = (sig, sig[1], obj)
+            _total_bytes += sig[1]
+            _evict_locked()
+    return obj
+
+
+def invalidate(path: Path):
+    """Drop the cached entry for `path`, if any."""
+    global _total_bytes
+    with _lock:
+        entry = _entries.pop(str(path), None)
+        if entry is not None:
+            _total_bytes -= entry[1]
+            _stats["invalidations"] += 1
+
+
+def clear():
+    global _total_bytes
+    with _lock:
+        _entries.clear()
+        _total_bytes = 0
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "bytes": _total_bytes,
+            "maxEntries": MAX_ENTRIES,
+            "maxBytes": MAX_BYTES,
+        }
+
+
+def _collect():
+    s = stats()
+    return [
+        ("model_cache_requests_total", "counter", "Model cache lookups by outcome",
+         [({"result": "hit"}, s["hits"]), ({"result": "miss"}, s["misses"])]),
+        ("model_cache_evictions_total", "counter", "Models evicted from the cache", [({}, s["evictions"])]),
+        ("model_cache_invalidations_total", "counter", "Models dropped after a retrain",
+         [({}, s["invalidations"])]),
+        ("model_cache_entries", "gauge", "Models currently cached", [({}, s["entries"])]),
+        ("model_cache_bytes", "gauge", "On-disk size of the cached models", [({}, s["bytes"])]),
+    ]
+
+
+metrics.add_collector(_collect)
@@ -0,0 +1,86 @@
+"""Per-stage wall time, CPU time and peak memory for training runs.
+
+    profiler = StageProfiler()
+    with profiler.stage("fit"):
+        rf.fit(X, y)
+    profiler.summary()  # stored as TrainResultMetrics.profile
+
+CPU time is the whole process's (`time.process_time`), so it includes the
+threads a forest fits on; it exceeding wall time means the stage ran in
+parallel. Peak memory is the resident set high-water mark: on Linux the mark
+is reset at the start of every stage (via /proc/self/clear_refs), so each
+stage reports its own peak. Elsewhere only the process-lifetime peak is
+available and it is reported as is.
+"""
+
+import sys
+import time
+from contextlib import contextmanager
+
+_CLEAR_REFS = "/proc/self/clear_refs"
+_STATUS = "/proc/self/status"
+
+
+def _reset_peak_rss() -> bool:
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            # 5 resets the peak RSS counter (Linux >= 4.0)
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open(_STATUS) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class StageProfiler:
+    """Records one entry per stage, in the order the stages ran.
+
+    `stages` may carry entries measured elsewhere, e.g. in another process
+    before the job was handed to a worker.
+    """
+
+    def __init__(self, stages: list[dict] | None = None):
+        self.stages: list[dict] = list(stages or [])
+
+    def add(self, name: str, wall_seconds: float, cpu_seconds: float | None = None,
+            peak_rss_mb: float | None = None):
+        """Record a stage timed by the caller; CPU and memory are optional."""
+        self.stages.append({
+            "name": name,
+            "wallMs": round(wall_seconds * 1000, 2),
+            "cpuMs": round(cpu_seconds * 1000, 2) if cpu_seconds is not None else None,
+            "peakRssMb": round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+        })
+
+    @contextmanager
+    def stage(self, name: str):
+        _reset_peak_rss()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu, _peak_rss_mb())
+
+    def summary(self) -> dict:
+        peaks = [s["peakRssMb"] for s in self.stages if s["peakRssMb"] is not None]
+        return {
+            "stages": self.stages,
+            "wallMs": round(sum(s["wallMs"] for s in self.stages), 2),
+            "cpuMs": round(sum(s["cpuMs"] or 0 for s in self.stages), 2),
+            "peakRssMb": max(peaks) if peaks else None,
+        }
@@ -0,0 +1,366 @@
+"""Change-log replication of the SQLite database to S3.
+
+With S3_PERSIST_MODE=changelog, triggers record the primary key of every row
+inserted, updated or deleted in the replicated tables into `change_log`. The
+background uploader (see s3_sync) ships those changes as numbered, gzipped
+JSON-lines segments holding each changed row's current contents, or a delete
+marker, so upload size follows the change rather than the database. Segment
+headers also carry the AUTOINCREMENT counters (`sqlite_sequence`), so ids of
+rows deleted since the base are not handed out again after a restore. Every
+S3_REPLICA_BASE_SEGMENTS segments, or once the segments outweigh the database,
+a compacted base snapshot starts a new chain.
+
+S3 layout:
+
+    replica/LATEST                               {"base": "<base_id>"}
+    replica/<base_id>/base.db.gz                 backup of the whole database
+    replica/<base_id>/segment-00000001.jsonl.gz  changes after the base, in order
+
+Restoring fetches the latest base and replays its segments in order. When the
+local database already sits on the latest base, only the segments it hasn't
+seen are fetched and replayed.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import metrics
+import row_store
+
+ENABLED = os.environ.get("S3_PERSIST_MODE", "snapshot") == "changelog"
+BASE_EVERY_SEGMENTS = int(os.environ.get("S3_REPLICA_BASE_SEGMENTS", "500"))
+SEGMENT_MAX_CHANGES = int(os.environ.get("S3_REPLICA_SEGMENT_MAX_CHANGES", "50000"))
+KEEP_BASES = 2
+
+PREFIX = "replica/"
+LATEST_KEY = PREFIX + "LATEST"
+
+TABLES = (
+    "sessions",
+    "dataset_rows",
+    "dataset_uploads",
+    "train_jobs",
+    "scoring_jobs",
+    "predictions",
+    "data_version",
+)
+
+
+def _pk_columns(db: sqlite3.Connection, table: str) -> list[str]:
+    info = db.execute(f"PRAGMA table_info({row_store.quote(table)})").fetchall()
+    return [r[1] for r in sorted((r for r in info if r[5]), key=lambda r: r[5])]
+
+
+def _trigger_name(table: str, op: str) -> str:
+    return f"replog_{table}_{op}"
+
+
+def install_triggers(db: sqlite3.Connection):
+    """Start recording changed keys of the replicated tables in change_log."""
+    for table in TABLES:
+        pk = _pk_columns(db, table)
+        for op, ref in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+            key = "json_array(" + ", ".join(f"{ref}.{row_store.quote(c)}" for c in pk) + ")"
+            db.execute(
+                f"""CREATE TRIGGER IF NOT EXISTS {_trigger_name(table, op)}
+                    AFTER {op.upper()} ON {table}
+                    BEGIN INSERT INTO change_log (tbl, row_key) VALUES ('{table}', {key}); END"""
+            )
+
+
+def drop_triggers(db: sqlite3.Connection):
+    """Stop recording changes and forget the replica chain.
+
+    Changes made while replication is off are not logged, so turning it back
+    on must start from a fresh base.
+    """
+    for table in TABLES:
+        for op in ("insert", "update", "delete"):
+            db.execute(f"DROP TRIGGER IF EXISTS {_trigger_name(table, op)}")
+    db.execute("DELETE FROM change_log")
+    db.execute("UPDATE replication_state SET base_id = NULL, next_segment = 1, bytes_since_base = 0")
+
+
+def _state(db: sqlite3.Connection) -> tuple[str | None, int, int]:
+    row = db.execute(
+        "SELECT base_id, next_segment, bytes_since_base FROM replication_state WHERE id = 1"
+    ).fetchone()
+    return tuple(row) if row else (None, 1, 0)
+
+
+def _set_state(db: sqlite3.Connection, base_id: str | None, next_segment: int, bytes_since_base: int):
+    db.execute(
+        """INSERT OR REPLACE INTO replication_state (id, base_id, next_segment, bytes_since_base)
+           VALUES (1, ?, ?, ?)""",
+        (base_id, next_segment, bytes_since_base),
+    )
+
+
+def _segment_key(base_id: str, number: int) -> str:
+    return f"{PREFIX}{base_id}/segment-{number:08d}.jsonl.gz"
+
+
+def _base_key(base_id: str) -> str:
+    return f"{PREFIX}{base_id}/base.db.gz"
+
+
+# --- Shipping ---
+
+def ship(s3, bucket: str, transfer_config=None) -> int:
+    """Upload pending changes, starting a new base when due. Returns segments shipped.
+
+    Runs on the background uploader thread only; uses its own connection so
+    its bookkeeping writes don't schedule another upload.
+    """
+    import database
+
+    db = database.connect()
+    try:
+        base_id, next_segment, bytes_since_base = _state(db)
+        if (
+            base_id is None
+            or next_segment > BASE_EVERY_SEGMENTS
+            or bytes_since_base > os.path.getsize(database.DB_PATH)
+        ):
+            _ship_base(s3, bucket, db, transfer_config)
+            return 0
+
+        shipped = 0
+        while True:
+            payload, last_seq = _build_segment(db, base_id, next_segment)
+            if payload is None:
+                return shipped
+            with metrics.s3_transfer("upload", len(payload)):
+                s3.put_object(Bucket=bucket, Key=_segment_key(base_id, next_segment), Body=payload)
+            next_segment += 1
+            bytes_since_base += len(payload)
+            with database.transaction(db):
+                db.execute("DELETE FROM change_log WHERE seq <= ?", (last_seq,))
+                _set_state(db, base_id, next_segment, bytes_since_base)
+            shipped += 1
+            print(
+                f"[replication] Shipped segment {next_segment - 1} of base {base_id} "
+                f"({len(payload)} bytes)"
+            )
+    finally:
+        db.close()
+
+
+def _build_segment(db: sqlite3.Connection, base_id: str, number: int):
+    """Return (gzipped segment, last change seq), or (None, None) with nothing pending."""
+    # One read transaction, so every row comes from the same snapshot
+    db.execute("BEGIN")
+    try:
+        changes = db.execute(
+            "SELECT seq, tbl, row_key FROM change_log ORDER BY seq LIMIT ?",
+            (SEGMENT_MAX_CHANGES,),
+        ).fetchall()
+        if not changes:
+            return None, None
+        sequences = {
+            name: seq
+            for name, seq in db.execute("SELECT name, seq FROM sqlite_sequence")
+            if name in TABLES
+        }
+        keys = dict.fromkeys((tbl, row_key) for _, tbl, row_key in changes)
+
+        pk_columns = {}
+        lines = []
+        for tbl, row_key in keys:
+            if tbl not in pk_columns:
+                pk_columns[tbl] = _pk_columns(db, tbl)
+            key = json.loads(row_key)
+            where = " AND ".join(f"{row_store.quote(c)} = ?" for c in pk_columns[tbl])
+            row = db.execute(f"SELECT * FROM {tbl} WHERE {where}", key).fetchone()
+            lines.append(json.dumps({
+                "t": tbl,
+                "k": key,
+                "row": dict(zip(row.keys(), row)) if row is not None else None,
+            }, separators=(",", ":")))
+    finally:
+        db.rollback()
+
+    header = json.dumps({
+        "base": base_id,
+        "segment": number,
+        "fromSeq": changes[0][0],
+        "toSeq": changes[-1][0],
+        "records": len(lines),
+        "sequences": sequences,
+    })
+    return gzip.compress("\n".join([header, *lines]).encode()), changes[-1][0]
+
+
+def _ship_base(s3, bucket: str, db: sqlite3.Connection, transfer_config):
+    import database
+
+    previous_base = _state(db)[0]
+    base_id = f"{time.time_ns() // 1_000_000:013d}"
+    with tempfile.TemporaryDirectory(dir=Path(database.DB_PATH).parent) as tmp:
+        copy = Path(tmp) / "base.db"
+        target = sqlite3.connect(copy)
+        db.backup(target)
+        # Everything logged so far is part of the copy itself
+        last_seq = target.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        target.execute("DELETE FROM change_log")
+        _set_state(target, base_id, 1, 0)
+        target.commit()
+        target.close()
+
+        compressed = copy.with_suffix(".db.gz")
+        with open(copy, "rb") as src, gzip.open(compressed, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        size = compressed.stat().st_size
+        with metrics.s3_transfer("upload", size):
+            s3.upload_file(str(compressed), bucket, _base_key(base_id), Config=transfer_config)
+
+    s3.put_object(Bucket=bucket, Key=LATEST_KEY, Body=json.dumps({"base": base_id}).encode())
+    with database.transaction(db):
+        db.execute("DELETE FROM change_log WHERE seq <= ?", (last_seq,))
+        _set_state(db, base_id, 1, 0)
+    print(f"[replication] Shipped base {base_id} ({size} bytes)")
+    _prune_bases(s3, bucket, keep={base_id, previous_base})
+
+
+def _list_keys(s3, bucket: str, prefix: str) -> list[str]:
+    keys = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def _prune_bases(s3, bucket: str, keep: set):
+    """Delete all but the newest KEEP_BASES chains (and never one in `keep`)."""
+    try:
+        keys = _list_keys(s3, bucket, PREFIX)
+        bases = sorted({k[len(PREFIX):].split("/")[0] for k in keys if "/" in k[len(PREFIX):]})
+        stale = set(bases[:-KEEP_BASES]) - keep
+        for key in keys:
+            if key[len(PREFIX):].split("/")[0] in stale:
+                s3.delete_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        print(f"[replication] Error pruning old bases: {e}")
+
+
+# --- Restoring ---
+
+def _apply_sequences(db: sqlite3.Connection, sequences: dict[str, int]):
+    """Raise the AUTOINCREMENT counters to at least the primary's."""
+    for name, seq in sequences.items():
+        if not db.execute(
+            "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, name)
+        ).rowcount:
+            db.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (name, seq))
+
+
+def _apply_segment(db: sqlite3.Connection, payload: bytes):
+    lines = gzip.decompress(payload).decode().split("\n")
+    pk_columns: dict[str, list[str]] = {}
+    columns: dict[str, set[str]] = {}
+    for line in lines[1:]:
+        record = json.loads(line)
+        tbl = record["t"]
+        if tbl not in pk_columns:
+            pk_columns[tbl] = _pk_columns(db, tbl)
+            columns[tbl] = {r[1] for r in db.execute(f"PRAGMA table_info({tbl})")}
+
+        row = record["row"]
+        if row is None:
+            where = " AND ".join(f"{row_store.quote(c)} = ?" for c in pk_columns[tbl])
+            db.execute(f"DELETE FROM {tbl} WHERE {where}", record["k"])
+            continue
+        # Metric columns added on the primary after the base was taken
+        for name in row.keys() - columns[tbl]:
+            db.execute(f"ALTER TABLE {tbl} ADD COLUMN {row_store.quote(name)}")
+            columns[tbl].add(name)
+        names = ", ".join(row_store.quote(c) for c in row)
+        placeholders = ", ".join("?" * len(row))
+        db.execute(
+            f"INSERT OR REPLACE INTO {tbl} ({names}) VALUES ({placeholders})",
+            list(row.values()),
+        )
+    # Segments shipped before the header carried them have none
+    _apply_sequences(db, json.loads(lines[0]).get("sequences", {}))
+
+
+def _replay(db_path: Path, s3, bucket: str, base_id: str, segments: list[tuple[int, str]]):
+    """Apply `segments` to the database at `db_path` in one transaction."""
+    # Foreign keys stay off: segments hold rows in change order, not dependency order
+    db = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        # Keep local changes that haven't been shipped; drop what the replay logs
+        local_seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        _, next_segment, bytes_since_base = _state(db)
+        for number, key in segments:
+            with metrics.s3_transfer("download") as transfer:
+                payload = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+                transfer.bytes = len(payload)
+            _apply_segment(db, payload)
+            next_segment = number + 1
+            bytes_since_base += len(payload)
+        db.execute("DELETE FROM change_log WHERE seq > ?", (local_seq,))
+        _set_state(db, base_id, next_segment, bytes_since_base)
+        db.execute("COMMIT")
+    finally:
+        db.close()
+
+
+def _local_base(db_path: Path) -> tuple[str | None, int]:
+    if not db_path.exists():
+        return None, 1
+    try:
+        db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            base_id, next_segment, _ = _state(db)
+        finally:
+            db.close()
+        return base_id, next_segment
+    except sqlite3.Error:
+        return None, 1
+
+
+def restore(s3, bucket: str, db_path) -> bool:
+    """Bring the local database up to the latest replica. Returns False if there is none."""
+    db_path = Path(db_path)
+    try:
+        latest = s3.get_object(Bucket=bucket, Key=LATEST_KEY)["Body"].read()
+    except Exception:
+        return False
+    base_id = json.loads(latest)["base"]
+
+    segments = sorted(
+        (int(key.rsplit("-", 1)[1].split(".")[0]), key)
+        for key in _list_keys(s3, bucket, f"{PREFIX}{base_id}/segment-")
+    )
+    local_base, local_next = _local_base(db_path)
+    if local_base == base_id:
+        pending = [(n, k) for n, k in segments if n >= local_next]
+        if pending:
+            _replay(db_path, s3, bucket, base_id, pending)
+        print(f"[replication] Local DB on base {base_id}; replayed {len(pending)} segment(s)")
+        return True
+
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=db_path.parent) as tmp:
+        compressed = Path(tmp) / "base.db.gz"
+        restored = Path(tmp) / "base.db"
+        with metrics.s3_transfer("download") as transfer:
+            s3.download_file(bucket, _base_key(base_id), str(compressed))
+            transfer.bytes = compressed.stat().st_size
+        with gzip.open(compressed, "rb") as src, open(restored, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        if segments:
+            _replay(restored, s3, bucket, base_id, segments)
+        # A WAL left over from the old local copy must not be replayed onto the new one
+        for suffix in ("-wal", "-shm"):
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+        os.replace(restored, db_path)
+    print(f"[replication] Restored base {base_id} plus {len(segments)} segment(s)")
+    return True
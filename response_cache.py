@@ -0,0 +1,130 @@
+"""Conditional GETs for the session and row endpoints, plus a cache of their bodies.
+
+Every write to a session stamps a new `data_version` on it (see
+`database.bump_data_version`), and the read endpoints derive their ETag from
+that version and the query parameters that shape the body. Restoring an older
+database snapshot from S3 on startup winds the versions back, so every tag
+also carries an epoch drawn when the process starts. A poll carrying a matching `If-None-Match` is answered with a
+bodyless 304 after one indexed lookup; a poll without one is served the bytes
+another client was sent for the same URL at the same version, when cached.
+
+The cache keeps one entry per URL, replaced as soon as the version moves on,
+and evicts least recently used URLs beyond RESPONSE_CACHE_MAX_BYTES (0 turns
+it off; ETags and 304s still work).
+"""
+
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from fastapi import Request, Response
+
+import json_encoding
+import metrics
+
+MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024**2)))
+
+_lock = threading.Lock()
+# (path, query) -> (etag, body, headers)
+_entries: "OrderedDict[tuple[str, str], tuple[str, bytes, dict]]" = OrderedDict()
+_total_bytes = 0
+_stats = {"notModified": 0, "hits": 0, "misses": 0, "evictions": 0}
+_epoch = uuid.uuid4().hex[:8]
+
+
+def etag(*parts) -> str:
+    """A tag for the content `parts` (versions, normalized query values) identify."""
+    return '"' + "-".join(str(p) for p in (_epoch, *parts)) + '"'
+
+
+def _matches(if_none_match: str | None, tag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return any(
+        candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(",")
+    )
+
+
+def _headers(tag: str, extra: dict | None = None) -> dict:
+    # no-cache: clients may store the body but must revalidate before reusing it
+    return {**(extra or {}), "ETag": tag, "Cache-Control": "no-cache"}
+
+
+def not_modified(request: Request, tag: str) -> Response | None:
+    """A 304 for `tag` if the client already has it, else None."""
+    if not _matches(request.headers.get("if-none-match"), tag):
+        return None
+    with _lock:
+        _stats["notModified"] += 1
+    return Response(status_code=304, headers=_headers(tag))
+
+
+def _evict_locked():
+    global _total_bytes
+    while _entries and _total_bytes > MAX_BYTES:
+        _, (_, body, _) = _entries.popitem(last=False)
+        _total_bytes -= len(body)
+        _stats["evictions"] += 1
+
+
+def json_response(request: Request, tag: str, build) -> Response:
+    """Answer a GET whose content is fully determined by `tag`.
+
+    `build()` returns `(content, headers)`, content being JSON-able or already
+    encoded JSON bytes, and only runs when the client does
+    not have `tag` and no body for this URL at `tag` is cached. Read the
+    version `tag` is derived from before the data `build` reads: a body newer
+    than its tag is harmless (the next poll fetches it again), an older one
+    would be served as current until the next write.
+    """
+    global _total_bytes
+    response = not_modified(request, tag)
+    if response is not None:
+        return response
+
+    key = (request.url.path, request.url.query)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == tag:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return Response(entry[1], media_type="application/json", headers=_headers(tag, entry[2]))
+        _stats["misses"] += 1
+
+    content, headers = build()
+    body = content if isinstance(content, bytes) else json_encoding.dumps(content)
+
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _total_bytes -= len(old[1])
+        # A body larger than the whole budget is served but never cached
+        if len(body) <= MAX_BYTES:
+            _entries[key] = (tag, body, headers)
+            _total_bytes += len(body)
+            _evict_locked()
+    return Response(body, media_type="application/json", headers=_headers(tag, headers))
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "entries": len(_entries), "bytes": _total_bytes, "maxBytes": MAX_BYTES}
+
+
+def _collect():
+    s = stats()
+    return [
+        ("response_cache_requests_total", "counter", "Cacheable GETs by outcome",
+         [({"result": "not_modified"}, s["notModified"]), ({"result": "hit"}, s["hits"]),
+          ({"result": "miss"}, s["misses"])]),
+        ("response_cache_evictions_total", "counter", "Cached responses evicted", [({}, s["evictions"])]),
+        ("response_cache_entries", "gauge", "Responses currently cached", [({}, s["entries"])]),
+        ("response_cache_bytes", "gauge", "Size of the cached response bodies", [({}, s["bytes"])]),
+    ]
+
+
+metrics.add_collector(_collect)
@@ -0,0 +1,104 @@
+import json
+import sqlite3
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+
+from database import get_db, get_read_db
+from schemas import PredictionResponse, ScoreResponse
+from row_store import MAX_PAGE_SIZE
+import s3_sync
+import scoring
+import training
+
+router = APIRouter(prefix="/api", tags=["Predictions"])
+
+
+def _job_to_response(job: dict) -> ScoreResponse:
+    return ScoreResponse(
+        job_id=job["id"],
+        status=job["status"],
+        sessionId=job["session_id"],
+        modelVersion=job["model_version"],
+        created_at=job["created_at"],
+        message=job["message"] or "",
+        progress=job["progress"],
+        rowsTotal=job["rows_total"],
+        rowsScored=job["rows_scored"],
+        started_at=job["started_at"],
+        finished_at=job["finished_at"],
+    )
+
+
+@router.post(
+    "/sessions/{session_id}/score",
+    response_model=ScoreResponse,
+    summary="Score the session's unlabeled rows",
+)
+def start_scoring(session_id: int, db: sqlite3.Connection = Depends(get_db)):
+    """Queue a job that predicts every unlabeled row with the session's model.
+
+    Poll `GET /api/score/{job_id}` for progress, then page through
+    `GET /api/sessions/{session_id}/predictions`.
+    """
+    if not db.execute("SELECT id FROM sessions WHERE id = ?", (session_id,)).fetchone():
+        raise HTTPException(status_code=404, detail="Session not found")
+    s3_sync.ensure_model(session_id)
+    version = training.model_version(session_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="No trained model for this session")
+
+    job = scoring.create_job(db, session_id, version)
+    scoring.submit(job["id"], session_id)
+    return _job_to_response(job)
+
+
+@router.get("/score/{job_id}", response_model=ScoreResponse, summary="Get scoring status")
+def get_scoring_job(job_id: str, db: sqlite3.Connection = Depends(get_read_db)):
+    job = scoring.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Scoring job not found")
+    return _job_to_response(job)
+
+
+@router.get(
+    "/sessions/{session_id}/predictions",
+    response_model=list[PredictionResponse],
+    summary="List stored predictions",
+)
+def list_predictions(
+    session_id: int,
+    response: Response,
+    model_version: str | None = Query(
+        None, description="Defaults to the model of the latest completed scoring job"
+    ),
+    after_id: int | None = Query(None, description="Return rows with id greater than this"),
+    limit: int = Query(1000, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    db: sqlite3.Connection = Depends(get_read_db),
+):
+    """Page through predictions ordered by row id.
+
+    Pass the `X-Next-After-Id` header value as `after_id` to fetch the next page.
+    """
+    version = model_version or scoring.latest_version(db, session_id)
+    if version is None:
+        return []
+
+    rows = db.execute(
+        """SELECT row_id, predicted, confidence, probabilities FROM predictions
+           WHERE session_id = ? AND model_version = ? AND row_id > ?
+           ORDER BY row_id LIMIT ?""",
+        (session_id, version, after_id or 0, limit),
+    ).fetchall()
+    if len(rows) == limit:
+        response.headers["X-Next-After-Id"] = str(rows[-1]["row_id"])
+    response.headers["X-Model-Version"] = version
+    return [
+        PredictionResponse(
+            rowId=r["row_id"],
+            modelVersion=version,
+            predicted=r["predicted"],
+            confidence=r["confidence"],
+            probabilities=json.loads(r["probabilities"]),
+        )
+        for r in rows
+    ]
@@ -1,14 +1,27 @@
 import json
-from fastapi import APIRouter, HTTPException
+import sqlite3
+from datetime import datetime, timezone
+from typing import Literal
 
-from database import get_db
-from schemas import RowsBulkCreate, RowUpdate
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+
+from database import bump_data_version, connection, get_db, get_read_db, transaction
+import ingest
+import json_encoding
+import response_cache
+import row_store
+from schemas import RowsBatchUpdate, RowsBulkCreate, RowUpdate
 
 router = APIRouter(prefix="/api/sessions/{session_id}/rows", tags=["rows"])
 
+STREAM_CHUNK_SIZE = 1000
+# Members `_row_to_dict` sets itself; a row whose data holds one is encoded the slow way
+_OWN_MEMBERS = ('"id":', '"sessionId":', '"targetColumn":')
+
 
 def _row_to_dict(row) -> dict:
-    data = json.loads(row["data"])
+    data = row_store.row_data(row)
     # Spread data first, then override with DB columns so they always win
     return {
         **data,
@@ -18,14 +31,76 @@ def _row_to_dict(row) -> dict:
     }
 
 
-def _assert_session(session_id: int):
-    db = get_db()
+def _row_encoder(cursor: sqlite3.Cursor):
+    """Return `encode(row)`: the JSON text of `_row_to_dict(row)`, byte for byte.
+
+    The stored data blob is spliced in as is instead of being parsed, merged
+    and re-encoded; rows where that could differ fall back to the full path.
+    """
+    columns = [c[0] for c in cursor.description]
+    members = row_store.member_encoder(columns)
+    id_index, session_index, label_index = (
+        columns.index(c) for c in ("id", "session_id", "target_column")
+    )
+    encode_json = json_encoding.encode
+
+    def encode(row) -> str:
+        text = members(row)
+        if text is None or any(key in text for key in _OWN_MEMBERS):
+            return encode_json(_row_to_dict(row))
+        return (
+            f'{{{text}{"," if text else ""}"id":{row[id_index]},'
+            f'"sessionId":{row[session_index]},"targetColumn":{encode_json(row[label_index])}}}'
+        )
+
+    return encode
+
+
+def _apply_update(label: str, data: dict, body: RowUpdate, target_col_name: str | None):
+    """Return the (label, data) a row has after applying `body`."""
+    new_target = body.targetColumn if body.targetColumn is not None else label
+    data = dict(data)
+
+    if body.data:
+        data.update(body.data)
+
+    # Also update the target column key inside the data JSON
+    if target_col_name and body.targetColumn is not None:
+        data[target_col_name] = body.targetColumn
+    return new_target, data
+
+
+def _assert_session(db, session_id: int):
     s = db.execute("SELECT id FROM sessions WHERE id = ?", (session_id,)).fetchone()
     if not s:
         raise HTTPException(status_code=404, detail="Session not found")
 
 
-def _update_session_counts(db, session_id: int):
+def _adjust_session_counts(db, session_id: int, rows_delta: int, labeled_delta: int):
+    """Apply a write's effect on the session's row/label counters and data version."""
+    if rows_delta or labeled_delta:
+        db.execute(
+            """UPDATE sessions
+               SET row_count = row_count + ?, labeled_count = labeled_count + ?
+               WHERE id = ?""",
+            (rows_delta, labeled_delta, session_id),
+        )
+    bump_data_version(db, session_id)
+
+
+def _delete_rows(db, session_id: int, condition: str, params: tuple):
+    """Delete the session's rows matching the SQL `condition`, keeping its counters right."""
+    where = f"session_id = ? AND {condition}"
+    rows, labeled = db.execute(
+        f"SELECT COUNT(*), COUNT(NULLIF(target_column, '')) FROM dataset_rows WHERE {where}",
+        (session_id, *params),
+    ).fetchone()
+    db.execute(f"DELETE FROM dataset_rows WHERE {where}", (session_id, *params))
+    _adjust_session_counts(db, session_id, -rows, -labeled)
+
+
+def reconcile_session_counts(db, session_id: int) -> dict:
+    """Recount rows/labels from dataset_rows, repairing any counter drift."""
     row_count = db.execute(
         "SELECT COUNT(*) FROM dataset_rows WHERE session_id = ?", (session_id,)
     ).fetchone()[0]
@@ -37,25 +112,102 @@ def _update_session_counts(db, session_id: int):
         "UPDATE sessions SET row_count = ?, labeled_count = ? WHERE id = ?",
         (row_count, labeled_count, session_id),
     )
+    bump_data_version(db, session_id)
+    return {"rowCount": row_count, "labeledCount": labeled_count}
+
+
+def _rows_query(session_id: int, after_id: int | None, limit: int | None):
+    sql = "SELECT * FROM dataset_rows WHERE session_id = ? AND id > ? ORDER BY id"
+    params = [session_id, after_id or 0]
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def _stream_rows(session_id: int, after_id: int | None, limit: int | None, fmt: str):
+    # The cursor's read transaction keeps one consistent snapshot for the whole stream
+    with connection(readonly=True) as db:
+        cursor = db.execute(*_rows_query(session_id, after_id, limit))
+        encode = _row_encoder(cursor)
+        first = True
+        if fmt == "json":
+            yield "["
+        while True:
+            chunk = cursor.fetchmany(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            encoded = [encode(r) for r in chunk]
+            if fmt == "ndjson":
+                yield "\n".join(encoded) + "\n"
+            else:
+                yield ("" if first else ",") + ",".join(encoded)
+            first = False
+        if fmt == "json":
+            yield "]"
 
 
 @router.get("")
-def list_rows(session_id: int):
-    _assert_session(session_id)
-    db = get_db()
-    rows = db.execute(
-        "SELECT * FROM dataset_rows WHERE session_id = ? ORDER BY id", (session_id,)
-    ).fetchall()
-    return [_row_to_dict(r) for r in rows]
+def list_rows(
+    session_id: int,
+    request: Request,
+    after_id: int | None = Query(None, description="Return rows with id greater than this"),
+    limit: int | None = Query(None, ge=1, le=row_store.MAX_PAGE_SIZE, description="Page size"),
+    stream: Literal["ndjson", "json"] | None = Query(
+        None, description="Stream the rows as NDJSON or a JSON array instead of buffering"
+    ),
+    db: sqlite3.Connection = Depends(get_read_db),
+):
+    """List a session's rows ordered by id.
 
+    With `limit`, rows are returned a page at a time; pass the `X-Next-After-Id`
+    header value as `after_id` to fetch the next page. With `stream`, rows are
+    read from the cursor in chunks and written out as they are encoded.
 
-@router.post("/bulk", status_code=201)
-def bulk_create_rows(session_id: int, body: RowsBulkCreate):
-    _assert_session(session_id)
-    db = get_db()
+    Responses carry an ETag derived from the session's data version and the
+    query; a request whose `If-None-Match` still matches gets a 304 without
+    touching the rows.
+    """
+    session = db.execute(
+        "SELECT data_version FROM sessions WHERE id = ?", (session_id,)
+    ).fetchone()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    tag = response_cache.etag(
+        "rows", session_id, session["data_version"], after_id or 0, limit or "all", stream or "buffered"
+    )
+
+    if stream:
+        not_modified = response_cache.not_modified(request, tag)
+        if not_modified is not None:
+            return not_modified
+        media_type = "application/x-ndjson" if stream == "ndjson" else "application/json"
+        return StreamingResponse(
+            _stream_rows(session_id, after_id, limit, stream),
+            media_type=media_type,
+            headers={"ETag": tag, "Cache-Control": "no-cache"},
+        )
+
+    def build():
+        cursor = db.execute(*_rows_query(session_id, after_id, limit))
+        encode = _row_encoder(cursor)
+        rows = cursor.fetchall()
+        headers = {}
+        if limit is not None and len(rows) == limit:
+            headers["X-Next-After-Id"] = str(rows[-1]["id"])
+        return ("[" + ",".join(map(encode, rows)) + "]").encode("utf-8"), headers
+
+    return response_cache.json_response(request, tag, build)
 
+
+@router.post("/bulk", status_code=201)
+def bulk_create_rows(
+    session_id: int, body: RowsBulkCreate, db: sqlite3.Connection = Depends(get_db)
+):
     # Get session target column for extracting label
     session = db.execute("SELECT target_column FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
     target_col = session["target_column"] or ""
 
     params = []
@@ -63,57 +215,247 @@ def bulk_create_rows(session_id: int, body: RowsBulkCreate):
         target_value = row.get("targetColumn", row.get(target_col, "")) if target_col else row.get("targetColumn", "")
         # Strip frontend-internal keys from the data JSON — they live in DB columns
         clean = {k: v for k, v in row.items() if k not in ("targetColumn", "sessionId")}
-        params.append((session_id, target_value or "", json.dumps(clean)))
+        params.append((target_value or "", clean))
 
-    db.executemany(
-        "INSERT INTO dataset_rows (session_id, target_column, data) VALUES (?, ?, ?)",
-        params,
-    )
-    _update_session_counts(db, session_id)
-    db.commit()
+    with transaction(db):
+        row_store.insert_rows(db, session_id, params)
+        _adjust_session_counts(
+            db, session_id, len(params), sum(1 for label, _ in params if label)
+        )
     return {"inserted": len(body.rows)}
 
 
-@router.put("/{row_id}")
-def update_row(session_id: int, row_id: int, body: RowUpdate):
-    _assert_session(session_id)
-    db = get_db()
+def _upload_to_dict(row) -> dict:
+    return {
+        "id": row["id"],
+        "sessionId": row["session_id"],
+        "filename": row["filename"],
+        "format": row["format"],
+        "status": row["status"],
+        "rowsIngested": row["rows_ingested"],
+        "message": row["message"],
+        "createdAt": row["created_at"],
+        "finishedAt": row["finished_at"],
+    }
 
-    existing = db.execute(
-        "SELECT * FROM dataset_rows WHERE id = ? AND session_id = ?",
-        (row_id, session_id),
+
+@router.post("/upload", status_code=201, summary="Ingest a CSV or Parquet dataset file")
+def upload_dataset(
+    session_id: int,
+    file: UploadFile = File(...),
+    replace: bool = Query(False, description="Replace the session's existing rows"),
+    db: sqlite3.Connection = Depends(get_db),
+):
+    """Stream a dataset file into the session in bounded memory.
+
+    The file is parsed in chunks; each chunk is coerced and inserted in its own
+    transaction and the upload record's `rowsIngested` advances as it commits.
+    The record is only returned once ingestion is over, so progress is polled
+    from `GET /rows/uploads`, which lists the session's uploads as they run. On
+    success the session's `datasetFilename` is set to the uploaded file's name
+    and, with `replace`, the rows the session had before are deleted. On
+    failure the rows inserted so far are deleted again and the upload record
+    is returned as the error's detail.
+    """
+    session = db.execute(
+        "SELECT target_column, feature_columns FROM sessions WHERE id = ?", (session_id,)
     ).fetchone()
-    if not existing:
-        raise HTTPException(status_code=404, detail="Row not found")
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    target_col = session["target_column"]
+    feature_columns = json.loads(session["feature_columns"])
 
-    current_data = json.loads(existing["data"])
-    new_target = body.targetColumn if body.targetColumn is not None else existing["target_column"]
+    filename = file.filename or "upload"
+    fmt = ingest.detect_format(filename, file.content_type)
+    upload_id = db.execute(
+        """INSERT INTO dataset_uploads (session_id, filename, format, status, created_at)
+           VALUES (?, ?, ?, 'processing', ?)""",
+        (session_id, filename, fmt, datetime.now(timezone.utc).isoformat()),
+    ).lastrowid
 
-    if body.data:
-        current_data.update(body.data)
+    # Ids only grow, so the rows to replace are those up to the newest one now
+    replace_through = db.execute(
+        "SELECT MAX(id) FROM dataset_rows WHERE session_id = ?", (session_id,)
+    ).fetchone()[0] if replace else None
 
-    # Also update the target column key inside the data JSON
-    session = db.execute("SELECT target_column FROM sessions WHERE id = ?", (session_id,)).fetchone()
-    target_col_name = session["target_column"]
-    if target_col_name and body.targetColumn is not None:
-        current_data[target_col_name] = body.targetColumn
+    # (first, last) ids of the rows each committed chunk inserted
+    staged = []
+    ingested = 0
+    try:
+        for chunk in ingest.iter_row_chunks(file.file, fmt, target_col, feature_columns):
+            if not chunk:
+                continue
+            with transaction(db):
+                row_store.insert_rows(db, session_id, chunk)
+                # One statement under the write lock, so its ids are consecutive
+                last_id = db.execute("SELECT last_insert_rowid()").fetchone()[0]
+                staged.append((last_id - len(chunk) + 1, last_id))
+                _adjust_session_counts(
+                    db, session_id, len(chunk), sum(1 for label, _ in chunk if label)
+                )
+                ingested += len(chunk)
+                db.execute(
+                    "UPDATE dataset_uploads SET rows_ingested = ? WHERE id = ?",
+                    (ingested, upload_id),
+                )
+    except Exception as e:
+        with transaction(db):
+            for first_id, last_id in staged:
+                _delete_rows(db, session_id, "id BETWEEN ? AND ?", (first_id, last_id))
+            db.execute(
+                """UPDATE dataset_uploads SET status = 'failed', message = ?, finished_at = ?
+                   WHERE id = ?""",
+                (f"{type(e).__name__}: {e}", datetime.now(timezone.utc).isoformat(), upload_id),
+            )
+            bump_data_version(db, session_id)
+        row = db.execute("SELECT * FROM dataset_uploads WHERE id = ?", (upload_id,)).fetchone()
+        # Parse errors (pandas' included) are ValueErrors: the file is at fault
+        raise HTTPException(
+            status_code=400 if isinstance(e, ValueError) else 500, detail=_upload_to_dict(row)
+        ) from e
+    else:
+        with transaction(db):
+            if replace_through is not None:
+                _delete_rows(db, session_id, "id <= ?", (replace_through,))
+            db.execute(
+                """UPDATE dataset_uploads SET status = 'completed', finished_at = ?
+                   WHERE id = ?""",
+                (datetime.now(timezone.utc).isoformat(), upload_id),
+            )
+            db.execute(
+                "UPDATE sessions SET dataset_filename = ? WHERE id = ?", (filename, session_id)
+            )
+            bump_data_version(db, session_id)
 
-    db.execute(
-        "UPDATE dataset_rows SET target_column = ?, data = ? WHERE id = ?",
-        (new_target, json.dumps(current_data), row_id),
-    )
-    _update_session_counts(db, session_id)
-    db.commit()
+    row = db.execute("SELECT * FROM dataset_uploads WHERE id = ?", (upload_id,)).fetchone()
+    return _upload_to_dict(row)
+
+
+@router.get("/uploads", summary="List the session's dataset uploads, newest first")
+def list_uploads(session_id: int, db: sqlite3.Connection = Depends(get_read_db)):
+    _assert_session(db, session_id)
+    rows = db.execute(
+        "SELECT * FROM dataset_uploads WHERE session_id = ? ORDER BY id DESC", (session_id,)
+    ).fetchall()
+    return [_upload_to_dict(row) for row in rows]
+
+
+@router.get("/uploads/{upload_id}", summary="Get dataset upload status")
+def get_upload(
+    session_id: int, upload_id: int, db: sqlite3.Connection = Depends(get_read_db)
+):
+    row = db.execute(
+        "SELECT * FROM dataset_uploads WHERE id = ? AND session_id = ?",
+        (upload_id, session_id),
+    ).fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return _upload_to_dict(row)
+
+
+@router.put("/{row_id}")
+def update_row(
+    session_id: int, row_id: int, body: RowUpdate, db: sqlite3.Connection = Depends(get_db)
+):
+    with transaction(db):
+        _assert_session(db, session_id)
+
+        existing = db.execute(
+            "SELECT * FROM dataset_rows WHERE id = ? AND session_id = ?",
+            (row_id, session_id),
+        ).fetchone()
+        if not existing:
+            raise HTTPException(status_code=404, detail="Row not found")
+
+        session = db.execute("SELECT target_column FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        new_target, current_data = _apply_update(
+            existing["target_column"], row_store.row_data(existing), body, session["target_column"]
+        )
+
+        row_store.update_row(db, row_id, new_target, current_data)
+        _adjust_session_counts(
+            db, session_id, 0, bool(new_target) - bool(existing["target_column"])
+        )
 
     updated = db.execute("SELECT * FROM dataset_rows WHERE id = ?", (row_id,)).fetchone()
     return _row_to_dict(updated)
 
 
+@router.patch("", summary="Update many rows in one transaction")
+def batch_update_rows(
+    session_id: int, body: RowsBatchUpdate, db: sqlite3.Connection = Depends(get_db)
+):
+    """Apply a batch of `{id, targetColumn, data}` updates with a single commit.
+
+    Each update is applied like `PUT /rows/{row_id}`; ids that don't belong to
+    the session are reported as `not_found` without failing the batch.
+    """
+    with transaction(db):
+        session = db.execute(
+            "SELECT target_column FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        target_col_name = session["target_column"]
+
+        ids = list(dict.fromkeys(u.id for u in body.updates))
+        current: dict[int, tuple[str, dict]] = {}
+        for i in range(0, len(ids), row_store.ID_LOOKUP_CHUNK):
+            chunk = ids[i:i + row_store.ID_LOOKUP_CHUNK]
+            for r in db.execute(
+                f"""SELECT * FROM dataset_rows
+                    WHERE session_id = ? AND id IN ({", ".join("?" * len(chunk))})""",
+                (session_id, *chunk),
+            ):
+                current[r["id"]] = (r["target_column"], row_store.row_data(r))
+
+        labeled_delta = 0
+        changed: set[int] = set()
+        results = []
+        for item in body.updates:
+            if item.id not in current:
+                results.append({"id": item.id, "status": "not_found"})
+                continue
+            label, data = current[item.id]
+            new_label, new_data = _apply_update(label, data, item, target_col_name)
+            labeled_delta += bool(new_label) - bool(label)
+            current[item.id] = (new_label, new_data)
+            changed.add(item.id)
+            results.append({"id": item.id, "status": "updated"})
+
+        if changed:
+            row_store.update_rows(
+                db, [(row_id, *current[row_id]) for row_id in changed]
+            )
+            _adjust_session_counts(db, session_id, 0, labeled_delta)
+
+    for result in results:
+        if result["status"] == "updated":
+            label, data = current[result["id"]]
+            result["row"] = {
+                **data,
+                "id": result["id"],
+                "sessionId": session_id,
+                "targetColumn": label,
+            }
+    return {"updated": len(changed), "results": results}
+
+
 @router.delete("")
-def delete_rows(session_id: int):
-    _assert_session(session_id)
-    db = get_db()
-    db.execute("DELETE FROM dataset_rows WHERE session_id = ?", (session_id,))
-    _update_session_counts(db, session_id)
-    db.commit()
+def delete_rows(session_id: int, db: sqlite3.Connection = Depends(get_db)):
+    with transaction(db):
+        _assert_session(db, session_id)
+        db.execute("DELETE FROM dataset_rows WHERE session_id = ?", (session_id,))
+        db.execute(
+            "UPDATE sessions SET row_count = 0, labeled_count = 0 WHERE id = ?", (session_id,)
+        )
+        bump_data_version(db, session_id)
     return {"deleted": True}
+
+
+@router.post("/reconcile", summary="Recount session row/label counters")
+def reconcile_counts(session_id: int, db: sqlite3.Connection = Depends(get_db)):
+    """Recompute `rowCount`/`labeledCount` with a full scan. Only needed to repair drift."""
+    with transaction(db):
+        _assert_session(db, session_id)
+        return reconcile_session_counts(db, session_id)
@@ -1,7 +1,9 @@
 import json
-from fastapi import APIRouter, HTTPException
+import sqlite3
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 
-from database import get_db
+from database import bump_data_version, get_db, get_read_db, transaction
+import response_cache
 from schemas import SessionCreate, SessionUpdate, SessionResponse
 
 router = APIRouter(prefix="/api/sessions", tags=["sessions"])
@@ -14,6 +16,71 @@ DEFAULT_GRADES = [
     {"id": 5, "name": "E", "color": "#d63031"},
 ]
 
+# Response field -> sessions column, in response order
+FIELDS = {
+    "id": "id",
+    "name": "name",
+    "date": "date",
+    "status": "status",
+    "grades": "grades",
+    "gradeCount": "grade_count",
+    "targetColumn": "target_column",
+    "featureColumns": "feature_columns",
+    "datasetFilename": "dataset_filename",
+    "rowCount": "row_count",
+    "labeledCount": "labeled_count",
+    "trainResult": "train_result",
+    "createdAt": "created_at",
+}
+JSON_FIELDS = {"grades", "featureColumns", "trainResult"}
+# What the session list page shows
+SUMMARY_FIELDS = ["id", "name", "date", "status", "datasetFilename", "rowCount", "labeledCount", "createdAt"]
+
+FIELDS_QUERY = Query(
+    None,
+    description="Comma-separated fields to return, or `summary` for the list page's fields. "
+    "Columns that aren't asked for (e.g. the large `trainResult`) are never read.",
+)
+
+
+def _parse_fields(fields: str | None) -> list[str] | None:
+    """The requested fields in response order, or None for the full session."""
+    if fields is None:
+        return None
+    if fields == "summary":
+        return SUMMARY_FIELDS
+    names = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = sorted(names - FIELDS.keys())
+    if unknown or not names:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown fields: {', '.join(unknown) or '(none given)'}; "
+            f"choose from {', '.join(FIELDS)} or 'summary'",
+        )
+    return [f for f in FIELDS if f in names]
+
+
+def _fields_key(fields: list[str] | None) -> str:
+    """`fields` as an ETag part: the same for every spelling of one projection."""
+    return "all" if fields is None else ".".join(fields)
+
+
+def _select(fields: list[str] | None) -> str:
+    return "*" if fields is None else ", ".join(FIELDS[f] for f in fields)
+
+
+def _project(row, fields: list[str] | None) -> dict:
+    """A session response with only `fields`, read straight from the row without validation."""
+    if fields is None:
+        return _row_to_session(row)
+    projected = {}
+    for field in fields:
+        value = row[FIELDS[field]]
+        if field in JSON_FIELDS:
+            value = json.loads(value) if value else None
+        projected[field] = value
+    return projected
+
 
 def _row_to_session(row) -> dict:
     train_result_raw = row["train_result"]
@@ -37,54 +104,87 @@ def _row_to_session(row) -> dict:
 
 
 @router.get("")
-def list_sessions():
-    db = get_db()
-    rows = db.execute("SELECT * FROM sessions ORDER BY id").fetchall()
-    return [_row_to_session(r) for r in rows]
+def list_sessions(
+    request: Request, fields: str | None = FIELDS_QUERY, db: sqlite3.Connection = Depends(get_read_db)
+):
+    """List all sessions. Answers `If-None-Match` with 304 until any session changes.
+
+    `?fields=summary` returns just what the session list page shows and skips
+    the training results, which make up most of a full listing.
+    """
+    selected = _parse_fields(fields)
+    # Every session write advances the database-wide version, so it tags the whole list
+    version = db.execute("SELECT value FROM data_version WHERE id = 1").fetchone()[0]
+
+    def build():
+        rows = db.execute(f"SELECT {_select(selected)} FROM sessions ORDER BY id").fetchall()
+        return [_project(r, selected) for r in rows], {}
+
+    tag = response_cache.etag("sessions", version, _fields_key(selected))
+    return response_cache.json_response(request, tag, build)
 
 
 @router.get("/{session_id}")
-def get_session(session_id: int):
-    db = get_db()
-    row = db.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+def get_session(
+    session_id: int,
+    request: Request,
+    fields: str | None = FIELDS_QUERY,
+    db: sqlite3.Connection = Depends(get_read_db),
+):
+    """Get one session. Answers `If-None-Match` with 304 until the session changes."""
+    selected = _parse_fields(fields)
+    row = db.execute(
+        "SELECT data_version FROM sessions WHERE id = ?", (session_id,)
+    ).fetchone()
     if not row:
         raise HTTPException(status_code=404, detail="Session not found")
-    return _row_to_session(row)
+
+    def build():
+        full = db.execute(
+            f"SELECT {_select(selected)} FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if not full:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return _project(full, selected), {}
+
+    tag = response_cache.etag("session", session_id, row["data_version"], _fields_key(selected))
+    return response_cache.json_response(request, tag, build)
 
 
 @router.post("", status_code=201)
-def create_session(body: SessionCreate):
-    db = get_db()
+def create_session(body: SessionCreate, db: sqlite3.Connection = Depends(get_db)):
     now = body.date or __import__("datetime").date.today().isoformat()
     grades = [g.model_dump() for g in body.grades] if body.grades else DEFAULT_GRADES
     grade_count = body.gradeCount if body.gradeCount is not None else len(grades)
 
-    cursor = db.execute(
-        """INSERT INTO sessions
-           (name, date, status, grades, grade_count, target_column,
-            feature_columns, dataset_filename, row_count, labeled_count, created_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?)""",
-        (
-            body.name,
-            now,
-            body.status,
-            json.dumps(grades),
-            grade_count,
-            body.targetColumn,
-            json.dumps(body.featureColumns),
-            body.datasetFilename,
-            now,
-        ),
-    )
-    db.commit()
+    with transaction(db):
+        cursor = db.execute(
+            """INSERT INTO sessions
+               (name, date, status, grades, grade_count, target_column,
+                feature_columns, dataset_filename, row_count, labeled_count, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?)""",
+            (
+                body.name,
+                now,
+                body.status,
+                json.dumps(grades),
+                grade_count,
+                body.targetColumn,
+                json.dumps(body.featureColumns),
+                body.datasetFilename,
+                now,
+            ),
+        )
+        bump_data_version(db, cursor.lastrowid)
 
     row = db.execute("SELECT * FROM sessions WHERE id = ?", (cursor.lastrowid,)).fetchone()
     return _row_to_session(row)
 
 
 @router.put("/{session_id}")
-def update_session(session_id: int, body: SessionUpdate):
-    db = get_db()
+def update_session(
+    session_id: int, body: SessionUpdate, db: sqlite3.Connection = Depends(get_db)
+):
     existing = db.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
     if not existing:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -93,24 +193,9 @@ def update_session(session_id: int, body: SessionUpdate):
     if not updates:
         return _row_to_session(existing)
 
-    # Map camelCase fields to snake_case columns
-    column_map = {
-        "name": "name",
-        "date": "date",
-        "status": "status",
-        "grades": "grades",
-        "gradeCount": "grade_count",
-        "targetColumn": "target_column",
-        "featureColumns": "feature_columns",
-        "datasetFilename": "dataset_filename",
-        "rowCount": "row_count",
-        "labeledCount": "labeled_count",
-        "trainResult": "train_result",
-    }
-
     set_parts = []
     values = []
-    for camel, snake in column_map.items():
+    for camel, snake in FIELDS.items():
         if camel in updates:
             val = updates[camel]
             if camel == "grades":
@@ -124,21 +209,22 @@ def update_session(session_id: int, body: SessionUpdate):
 
     if set_parts:
         values.append(session_id)
-        db.execute(
-            f"UPDATE sessions SET {', '.join(set_parts)} WHERE id = ?",
-            values,
-        )
-        db.commit()
+        with transaction(db):
+            db.execute(
+                f"UPDATE sessions SET {', '.join(set_parts)} WHERE id = ?",
+                values,
+            )
+            bump_data_version(db, session_id)
 
     row = db.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
     return _row_to_session(row)
 
 
 @router.delete("/{session_id}", status_code=204)
-def delete_session(session_id: int):
-    db = get_db()
-    existing = db.execute("SELECT id FROM sessions WHERE id = ?", (session_id,)).fetchone()
-    if not existing:
-        raise HTTPException(status_code=404, detail="Session not found")
-    db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
-    db.commit()
+def delete_session(session_id: int, db: sqlite3.Connection = Depends(get_db)):
+    with transaction(db):
+        existing = db.execute("SELECT id FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if not existing:
+            raise HTTPException(status_code=404, detail="Session not found")
+        db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        bump_data_version(db)
@@ -1,111 +1,232 @@
 import json
-from datetime import datetime, timezone
-from pathlib import Path
+import os
+import sqlite3
+import time
+from typing import TYPE_CHECKING
 
-import joblib
-import pandas as pd
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 
-from database import get_db
+from database import get_db, get_read_db
 from schemas import (
     TrainRequest,
     TrainResponse,
-    TrainResultMetrics,
     PredictRequest,
     PredictResponse,
 )
-from ml.rf import train_random_forest
-from s3_sync import upload_db, upload_model
+import batcher
+import model_cache
+from profiling import StageProfiler
+import s3_sync
+import training
+from training import compiled_model_path, model_path
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# joblib, NumPy and the forest engine are imported on first use so the app
+# starts without loading the ML stack
 
 router = APIRouter(prefix="/api", tags=["Training"])
 
-MODELS_DIR = Path(__file__).parent.parent / "data" / "models"
-MODELS_DIR.mkdir(parents=True, exist_ok=True)
+# Batches up to this size use the compiled NumPy forest; above it sklearn's
+# own traversal is faster. 0 always uses sklearn.
+COMPILED_MAX_BATCH = int(os.environ.get("FOREST_COMPILED_MAX_BATCH", "128"))
 
+# Same as ml.forest.MANIFEST_FILENAME, without importing NumPy to check a path
+MANIFEST_FILENAME = "manifest.json"
+# How long to wait for a retrained forest's directory swap to finish
+SWAP_WAIT_SECONDS = 0.05
 
-@router.post("/train", response_model=TrainResponse, summary="Start a training job")
-def start_training(body: TrainRequest):
-    df = pd.DataFrame(body.rows)
 
-    now = datetime.now(timezone.utc)
-    job_id = f"train_{body.sessionId}_{int(now.timestamp())}"
+def _load_compiled(path):
+    from ml import forest
+
+    return forest.load(path, mmap_mode="r")
+
+
+def _load_manifest(manifest_path):
+    from ml import forest
+
+    return forest.read_manifest(manifest_path.parent)
 
+
+def _load_forest_file(path, loader):
+    """`model_cache.load` of a compiled forest path, retried once if a
+    retrained forest is being swapped in (see `ml.forest._replace_dir`).
+    """
     try:
-        result = train_random_forest(df, body.targetColumn, body.featureColumns)
-    except Exception as e:
-        print(f"Training failed: {type(e).__name__}: {e}")
-        return TrainResponse(
-            job_id=job_id,
-            status="failed",
-            sessionId=body.sessionId,
-            created_at=now.isoformat(),
-            message=str(e),
+        return model_cache.load(path, loader)
+    except FileNotFoundError:
+        time.sleep(SWAP_WAIT_SECONDS)
+        return model_cache.load(path, loader)
+
+
+def _has_compiled(compiled_path) -> bool:
+    manifest_path = compiled_path / MANIFEST_FILENAME
+    if manifest_path.exists():
+        return True
+    from ml import forest
+
+    if not forest.swapping(compiled_path):
+        return False
+    time.sleep(SWAP_WAIT_SECONDS)
+    return manifest_path.exists()
+
+
+def _check_columns(feature_columns: list[str], body: PredictRequest):
+    missing = [c for c in feature_columns if c not in body.featureColumns]
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Model expects feature columns missing from the request: {', '.join(missing)}",
         )
 
-    # Save model to disk
-    model = result.pop("model")
-    model_path = MODELS_DIR / f"session_{body.sessionId}.joblib"
-    joblib.dump(
-        {"model": model, "feature_columns": body.featureColumns},
-        model_path,
-    )
 
-    # Build metrics for response
-    metrics = TrainResultMetrics(
-        accuracy=result["accuracy"],
-        precision=result["precision"],
-        recall=result["recall"],
-        f1_score=result["f1_score"],
-        confusionMatrix=result["confusion_matrix"],
-        classificationReport=result["classification_report"],
-        featureImportances=result["feature_importances"],
-        targetDistribution=result["target_distribution"],
-        trainSize=result["train_size"],
-        testSize=result["test_size"],
-    )
+def _load_joblib(path):
+    import joblib
+
+    return joblib.load(path)
 
-    # Persist metrics to session in SQLite
-    db = get_db()
-    db.execute(
-        "UPDATE sessions SET train_result = ? WHERE id = ?",
-        (json.dumps(metrics.model_dump()), body.sessionId),
+
+def _job_to_response(job: dict) -> TrainResponse:
+    return TrainResponse(
+        job_id=job["id"],
+        status=job["status"],
+        sessionId=job["session_id"],
+        created_at=job["created_at"],
+        message=job["message"] or "",
+        stage=job["stage"],
+        progress=job["progress"],
+        started_at=job["started_at"],
+        finished_at=job["finished_at"],
+        metrics=job["metrics"],
     )
-    db.commit()
 
-    # Upload model + DB to S3
-    upload_model(body.sessionId)
-    upload_db()
 
-    print(
-        f"Training done — accuracy: {result['accuracy']}, "
-        f"train: {result['train_size']}, test: {result['test_size']}"
+@router.post("/train", response_model=TrainResponse, summary="Start a training job")
+def start_training(body: TrainRequest, request: Request, db: sqlite3.Connection = Depends(get_db)):
+    """Queue a training job and return immediately.
+
+    Poll `GET /api/train/{job_id}` for progress and the final metrics,
+    including a per-stage profile of the run.
+    """
+    # Time from receiving the request until here: reading and validating `rows`
+    received = getattr(request.state, "received", None)
+    profiler = StageProfiler()
+    if received is not None:
+        profiler.add("parse_request", time.perf_counter() - received)
+
+    session = db.execute(
+        "SELECT target_column, feature_columns FROM sessions WHERE id = ?",
+        (body.sessionId,),
+    ).fetchone()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    target_column = body.targetColumn or session["target_column"]
+    feature_columns = body.featureColumns or json.loads(session["feature_columns"])
+    if not feature_columns:
+        raise HTTPException(status_code=400, detail="No feature columns configured")
+    if body.rows is not None and not target_column:
+        raise HTTPException(status_code=400, detail="No target column configured")
+
+    job = training.create_job(db, body.sessionId)
+    training.submit(
+        job["id"], body.sessionId, target_column, feature_columns, body.rows,
+        forest=body.forest.model_dump() if body.forest else None,
+        tune=body.tune.model_dump() if body.tune else None,
+        stages=profiler.stages,
     )
+    return _job_to_response(job)
 
-    return TrainResponse(
-        job_id=job_id,
-        status="completed",
-        sessionId=body.sessionId,
-        created_at=now.isoformat(),
-        message=f"Training completed — accuracy: {result['accuracy']}",
-        metrics=metrics,
+
+@router.get("/train/{job_id}", response_model=TrainResponse, summary="Get training status")
+def get_training_job(job_id: str, db: sqlite3.Connection = Depends(get_read_db)):
+    job = training.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return _job_to_response(job)
+
+
+def _rows_to_matrix(rows: list[dict], feature_columns: list[str]) -> "np.ndarray":
+    # Coerced like training data, so "12" predicts the same as 12
+    from ml.dataset import to_float_matrix
+
+    return to_float_matrix(
+        [[row.get(c) for c in feature_columns] for row in rows], len(feature_columns)
     )
 
 
+def _prepare_predict(session_id: int, body: PredictRequest):
+    """Validate the request and return (model, X), or (None, None) for no rows.
+
+    The request is checked against the compiled model's manifest before any
+    tree is loaded; rows are then ordered by the loaded model's own feature
+    columns, which differ if the session was retrained in between.
+    """
+    s3_sync.ensure_model(session_id)
+    path = model_path(session_id)
+    compiled_path = compiled_model_path(session_id)
+    manifest_path = compiled_path / MANIFEST_FILENAME
+    has_compiled = _has_compiled(compiled_path)
+    if not has_compiled and not path.exists():
+        raise HTTPException(status_code=404, detail="No trained model for this session")
+
+    use_compiled = has_compiled and (len(body.rows) <= COMPILED_MAX_BATCH or not path.exists())
+    saved = None
+    if has_compiled:
+        feature_columns = _load_forest_file(manifest_path, _load_manifest)["feature_columns"]
+    else:
+        # Models saved before compiled artifacts existed carry their columns inline
+        saved = model_cache.load(path, _load_joblib)
+        feature_columns = saved["feature_columns"]
+
+    _check_columns(feature_columns, body)
+    if not body.rows:
+        return None, None
+
+    if use_compiled:
+        model = _load_forest_file(compiled_path, _load_compiled)
+        model_columns = model.meta["feature_columns"]
+    else:
+        saved = saved or model_cache.load(path, _load_joblib)
+        model, model_columns = saved["model"], saved["feature_columns"]
+    if model_columns != feature_columns:
+        _check_columns(model_columns, body)
+    return model, _rows_to_matrix(body.rows, model_columns)
+
+
 @router.post(
     "/sessions/{session_id}/predict",
     response_model=PredictResponse,
     summary="Predict grades using saved model",
 )
-def predict(session_id: int, body: PredictRequest):
-    model_path = MODELS_DIR / f"session_{session_id}.joblib"
-    if not model_path.exists():
-        raise HTTPException(status_code=404, detail="No trained model for this session")
-
-    saved = joblib.load(model_path)
-    model = saved["model"]
-
-    df = pd.DataFrame(body.rows)
-    X = df[body.featureColumns].apply(pd.to_numeric, errors="coerce")
-    predictions = model.predict(X).tolist()
-
-    return PredictResponse(predictions=predictions)
+async def predict(session_id: int, body: PredictRequest):
+    """Predict with the session's model.
+
+    Small concurrent requests for the same model are merged into one
+    vectorized predict call (see `batcher`).
+    """
+    model, X = await run_in_threadpool(_prepare_predict, session_id, body)
+    if model is None:
+        return PredictResponse(predictions=[])
+
+    if len(X) > batcher.MAX_ROWS:
+        predictions = await run_in_threadpool(model.predict, X)
+    else:
+        # The cached model object changes when the session is retrained
+        predictions = await batcher.predict((session_id, id(model)), model, X)
+    return PredictResponse(predictions=predictions.tolist())
+
+
+@router.get("/models/cache", summary="Model cache statistics")
+def model_cache_stats():
+    """Hit/miss counters and current size of the in-process model cache."""
+    return model_cache.stats()
+
+
+@router.get("/predict/batching", summary="Predict micro-batching statistics")
+def batching_stats():
+    """Histograms of merged batch sizes and of how long requests waited to be batched."""
+    return batcher.stats()
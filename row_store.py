@@ -0,0 +1,306 @@
+"""Storage layout for dataset rows.
+
+Numeric defect metrics (`count_*` / `area_*` keys) are stored as real columns
+on `dataset_rows`, one column per metric name, added on first use up to
+MAX_METRIC_COLUMNS; further names stay in the blob. Everything else
+(`imageSrc`, the label copy, free-form fields) stays in the `data` JSON blob,
+where typed metrics keep a null placeholder so the row's key order survives.
+Metric columns are declared without a type so SQLite keeps integers as
+integers and reals as reals, and rows reassemble to exactly what was written.
+
+Blobs are stored in the compact, unescaped form responses are encoded in, so
+`member_encoder` can copy them into a response without parsing them.
+"""
+
+import json
+import math
+import os
+import re
+import sqlite3
+from typing import Callable, Iterable
+
+METRIC_NAME = re.compile(r"^(count|area)_[A-Za-z0-9_]+$")
+# SQLite allows 2000 columns per table
+MAX_METRIC_COLUMNS = int(os.environ.get("MAX_METRIC_COLUMNS", "256"))
+# Stay well under SQLite's bound-parameter limit in IN (...) lookups
+ID_LOOKUP_CHUNK = 500
+# Largest page the row and prediction listings serve
+MAX_PAGE_SIZE = 10_000
+
+_known_columns: set[str] = set()
+
+# FastAPI's JSONResponse encoding, except that NaN and infinities are accepted
+_encode_data = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def is_metric(key: str, value) -> bool:
+    if METRIC_NAME.match(key) is None or isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        # SQLite integers are 64-bit; anything larger stays in the blob
+        return -(2**63) <= value < 2**63
+    # SQLite stores NaN as NULL; non-finite floats stay in the blob, as NaN/Infinity
+    return isinstance(value, float) and math.isfinite(value)
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def split_row(row: dict, typed: set[str]) -> tuple[dict, dict]:
+    """Split a row into (metrics, extras).
+
+    Metric values whose column is in `typed` go to `metrics`. `extras` keeps
+    every key in the row's order, with None standing in for those values.
+    """
+    metrics = {}
+    extras = {}
+    for k, v in row.items():
+        if k in typed and is_metric(k, v):
+            metrics[k] = v
+            extras[k] = None
+        else:
+            extras[k] = v
+    return metrics, extras
+
+
+def _metric_names(rows: Iterable[dict]) -> list[str]:
+    return list(dict.fromkeys(k for row in rows for k, v in row.items() if is_metric(k, v)))
+
+
+def metric_columns(db: sqlite3.Connection) -> list[str]:
+    """Metric columns currently present on dataset_rows, in table order."""
+    cols = [
+        r[1] for r in db.execute("PRAGMA table_info(dataset_rows)").fetchall()
+        if METRIC_NAME.match(r[1])
+    ]
+    _known_columns.update(cols)
+    return cols
+
+
+def ensure_metric_columns(db: sqlite3.Connection, names: Iterable[str]) -> set[str]:
+    """Add columns for `names` while under MAX_METRIC_COLUMNS.
+
+    Returns the names that have a column; values of the others stay in the
+    blob. The columns are added in the caller's transaction; a rollback
+    undoes them, so `database.transaction` calls `forget_columns` then.
+    """
+    names = list(names)
+    missing = [n for n in names if n not in _known_columns]
+    if missing and len(_known_columns) < MAX_METRIC_COLUMNS:
+        existing = set(metric_columns(db))
+        for name in missing:
+            if name not in existing and len(existing) < MAX_METRIC_COLUMNS:
+                db.execute(f"ALTER TABLE dataset_rows ADD COLUMN {quote(name)}")
+                existing.add(name)
+        _known_columns.update(existing)
+    return {n for n in names if n in _known_columns}
+
+
+def forget_columns():
+    """Drop the column cache, e.g. after a rollback that may have undone an ALTER TABLE."""
+    _known_columns.clear()
+
+
+def dumps_data(extras: dict) -> str:
+    return _encode_data(extras)
+
+
+def row_data(row: sqlite3.Row) -> dict:
+    """Reassemble the stored row dict from the JSON blob plus metric columns.
+
+    Metric values fill their placeholders in place; rows stored before
+    placeholders existed get them appended after the blob's keys.
+    """
+    data = json.loads(row["data"])
+    for key in row.keys():
+        if METRIC_NAME.match(key):
+            value = row[key]
+            if value is not None:
+                data[key] = value
+    return data
+
+
+def insert_rows(
+    db: sqlite3.Connection, session_id: int, rows: Iterable[tuple[str, dict]]
+) -> int:
+    """Insert (label, data) pairs for a session. Returns the number inserted."""
+    rows = list(rows)
+    if not rows:
+        return 0
+    candidates = _metric_names(data for _, data in rows)
+    typed = ensure_metric_columns(db, candidates)
+    names = [n for n in candidates if n in typed]
+    split = [(label, *split_row(data, typed)) for label, data in rows]
+
+    columns = ", ".join(["session_id", "target_column", "data"] + [quote(n) for n in names])
+    placeholders = ", ".join(["?"] * (3 + len(names)))
+    db.executemany(
+        f"INSERT INTO dataset_rows ({columns}) VALUES ({placeholders})",
+        [
+            (session_id, label, dumps_data(extras), *(metrics.get(n) for n in names))
+            for label, metrics, extras in split
+        ],
+    )
+    return len(split)
+
+
+def update_row(db: sqlite3.Connection, row_id: int, label: str, data: dict):
+    """Overwrite a row's label and full data dict."""
+    update_rows(db, [(row_id, label, data)])
+
+
+def _set_metric_columns(db: sqlite3.Connection, row_ids: list[int]) -> dict[int, set[str]]:
+    """The metric columns holding a value, per row id."""
+    names = metric_columns(db)
+    if not names:
+        return {}
+    columns = ", ".join(quote(n) for n in names)
+    found = {}
+    for i in range(0, len(row_ids), ID_LOOKUP_CHUNK):
+        chunk = row_ids[i:i + ID_LOOKUP_CHUNK]
+        for row_id, *values in db.execute(
+            f"SELECT id, {columns} FROM dataset_rows WHERE id IN ({', '.join('?' * len(chunk))})",
+            chunk,
+        ):
+            found[row_id] = {n for n, v in zip(names, values) if v is not None}
+    return found
+
+
+def update_rows(db: sqlite3.Connection, rows: Iterable[tuple[int, str, dict]]):
+    """Overwrite the label and full data dict of each (row_id, label, data).
+
+    Only the metric columns a row has a value in, before or after, are
+    written; the rest are NULL already.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    typed = ensure_metric_columns(db, _metric_names(data for _, _, data in rows))
+    current = _set_metric_columns(db, [row_id for row_id, _, _ in rows])
+
+    groups: dict[tuple[str, ...], list] = {}
+    for row_id, label, data in rows:
+        metrics, extras = split_row(data, typed)
+        # Columns set before but not now are cleared so they can't shadow the new data
+        names = tuple(sorted(current.get(row_id, set()) | metrics.keys()))
+        groups.setdefault(names, []).append(
+            (label, dumps_data(extras), *(metrics.get(n) for n in names), row_id)
+        )
+    for names, params in groups.items():
+        set_parts = ", ".join(["target_column = ?", "data = ?"] + [f"{quote(n)} = ?" for n in names])
+        db.executemany(f"UPDATE dataset_rows SET {set_parts} WHERE id = ?", params)
+
+
+def migrate(db: sqlite3.Connection, chunk_size: int = 5000):
+    """Move metric values out of JSON blobs written by the old layout.
+
+    Run inside a transaction so a partial migration is never committed.
+    """
+    last_id = 0
+    moved = 0
+    while True:
+        chunk = db.execute(
+            "SELECT id, data FROM dataset_rows WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk_size),
+        ).fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+
+        decoded = [(row_id, json.loads(raw)) for row_id, raw in chunk]
+        typed = ensure_metric_columns(db, _metric_names(data for _, data in decoded))
+        updates: dict[tuple[str, ...], list] = {}
+        for row_id, data in decoded:
+            metrics, extras = split_row(data, typed)
+            if not metrics:
+                continue
+            names = tuple(metrics)
+            updates.setdefault(names, []).append(
+                (dumps_data(extras), *metrics.values(), row_id)
+            )
+        for names, params in updates.items():
+            set_parts = ", ".join(["data = ?"] + [f"{quote(n)} = ?" for n in names])
+            db.executemany(f"UPDATE dataset_rows SET {set_parts} WHERE id = ?", params)
+            moved += len(params)
+
+    if moved:
+        print(f"[row_store] Migrated {moved} row(s) to typed metric columns")
+
+
+def compact_blobs(db: sqlite3.Connection, chunk_size: int = 5000):
+    """Rewrite data blobs stored with `json.dumps` defaults in the `dumps_data` form.
+
+    Run inside a transaction so a partial rewrite is never committed.
+    """
+    last_id = 0
+    rewritten = 0
+    while True:
+        chunk = db.execute(
+            "SELECT id, data FROM dataset_rows WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk_size),
+        ).fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        params = []
+        for row_id, raw in chunk:
+            compact = dumps_data(json.loads(raw))
+            if compact != raw:
+                params.append((compact, row_id))
+        db.executemany("UPDATE dataset_rows SET data = ? WHERE id = ?", params)
+        rewritten += len(params)
+
+    if rewritten:
+        print(f"[row_store] Compacted {rewritten} row data blob(s)")
+
+
+def _metric_json(value) -> str | None:
+    if type(value) is int:
+        return int.__repr__(value)
+    if type(value) is float and math.isfinite(value):
+        return float.__repr__(value)
+    return None
+
+
+def member_encoder(columns: list[str]) -> Callable[[sqlite3.Row], str | None]:
+    """Build an encoder for rows of a query returning `columns` (which include `data`).
+
+    It returns the members of the JSON object `row_data(row)` encodes to, i.e.
+    the text between its braces, spliced together from the stored blob and
+    the metric values without parsing or building a dict: each value replaces
+    its `"name":null` placeholder, or is appended for rows stored before
+    placeholders. It returns None for a row only a full encode handles the
+    same way: one holding NaN or an infinity, which a response can't encode,
+    or a nested object whose keys could be mistaken for a placeholder.
+    """
+    data_index = columns.index("data")
+    metrics = [
+        (i, _encode_data(name) + ":", _encode_data(name) + ":null")
+        for i, name in enumerate(columns) if METRIC_NAME.match(name)
+    ]
+
+    def encode(row) -> str | None:
+        blob = row[data_index]
+        if "NaN" in blob or "Infinity" in blob:
+            return None
+        nested = blob.find("{", 1) != -1
+        appended = []
+        for i, prefix, placeholder in metrics:
+            value = row[i]
+            if value is None:
+                continue
+            text = _metric_json(value)
+            if text is None:
+                return None
+            # Quotes inside strings are escaped, so only a key can match
+            if placeholder not in blob:
+                appended.append(prefix + text)
+            elif nested:
+                return None
+            else:
+                blob = blob.replace(placeholder, prefix + text, 1)
+        inner = blob[1:-1]
+        return ",".join([inner, *appended] if inner else appended)
+
+    return encode
@@ -1,25 +1,75 @@
 """S3 persistence for SQLite database and trained model files.
 
 On startup: download DB + model files from S3 to local data/ directory.
-After training: upload updated DB + new model file to S3.
+After training: upload the new model file to S3.
+After any database write: upload a snapshot of the DB from a background
+thread, at most once per S3_UPLOAD_DEBOUNCE_SECONDS (see `schedule_db_upload`).
+With S3_PERSIST_MODE=changelog only the changed rows are shipped instead, and
+startup restores from the replica (see replication.py).
+
+Compiled models (`session_{id}.forest` directories) travel as a single tar
+archive, gzipped unless MODEL_UPLOAD_COMPRESS=0, and are unpacked on download.
+
+Startup sync is incremental: the ETag and size of every object fetched are
+kept in a local manifest, so objects that haven't changed since the last run
+are skipped, and the rest are downloaded in parallel. With S3_LAZY_MODELS=1
+model files are not downloaded at startup at all but on the first request
+that needs them (see `ensure_model`).
 """
 
+import atexit
+import json
 import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 
+import database
+import metrics
+import replication
+from profiling import StageProfiler
+
 BUCKET = os.environ.get("S3_BUCKET", "")
+ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+SYNC_WORKERS = int(os.environ.get("S3_SYNC_WORKERS", "8"))
+LAZY_MODELS = os.environ.get("S3_LAZY_MODELS", "0") == "1"
 DATA_DIR = Path(__file__).parent / "data"
 MODELS_DIR = DATA_DIR / "models"
 DB_FILENAME = "grade_ninja.db"
+MANIFEST_PATH = DATA_DIR / "s3_manifest.json"
+COMPRESS_MODELS = os.environ.get("MODEL_UPLOAD_COMPRESS", "1") != "0"
+UPLOAD_DEBOUNCE_SECONDS = float(os.environ.get("S3_UPLOAD_DEBOUNCE_SECONDS", "5"))
+MULTIPART_THRESHOLD = int(os.environ.get("S3_MULTIPART_THRESHOLD_MB", "16")) * 1024**2
+MULTIPART_CHUNKSIZE = int(os.environ.get("S3_MULTIPART_CHUNK_MB", "16")) * 1024**2
+FOREST_ARCHIVE_SUFFIXES = (".forest.tar.gz", ".forest.tar")
 
 _client = None
 
+# key -> {"etag", "size"} of the object version the local copy came from
+_manifest: dict[str, dict] | None = None
+_manifest_lock = threading.Lock()
+
+# Model objects listed at startup but not downloaded yet (lazy mode)
+_remote_models: dict[str, dict] = {}
+_session_locks: dict[int, threading.Lock] = {}
+_session_locks_lock = threading.Lock()
+
+# Background DB persistence
+_db_dirty = threading.Event()
+_db_upload_lock = threading.Lock()
+_db_uploader: threading.Thread | None = None
+_db_uploader_lock = threading.Lock()
+
 
 def _get_client():
     global _client
     if _client is None:
         import boto3
-        _client = boto3.client("s3")
+        _client = boto3.client("s3", endpoint_url=ENDPOINT_URL)
     return _client
 
 
@@ -27,6 +77,98 @@ def _s3_enabled():
     return bool(BUCKET)
 
 
+def _transfer_config():
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=MULTIPART_THRESHOLD,
+        multipart_chunksize=MULTIPART_CHUNKSIZE,
+    )
+
+
+def _load_manifest() -> dict[str, dict]:
+    global _manifest
+    if _manifest is None:
+        try:
+            _manifest = json.loads(MANIFEST_PATH.read_text())
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def _record(key: str, etag: str | None, size: int | None):
+    """Remember which object version the local copy of `key` came from."""
+    with _manifest_lock:
+        manifest = _load_manifest()
+        if etag is None:
+            manifest.pop(key, None)
+        else:
+            manifest[key] = {"etag": etag, "size": size}
+        tmp = MANIFEST_PATH.with_suffix(".tmp")
+        tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+        os.replace(tmp, MANIFEST_PATH)
+
+
+def _local_path(key: str) -> Path:
+    """Where the object `key` lives locally (a directory for forest archives)."""
+    if key == DB_FILENAME:
+        return Path(database.DB_PATH)
+    for suffix in FOREST_ARCHIVE_SUFFIXES:
+        if key.endswith(suffix):
+            return DATA_DIR / (key[: -len(suffix)] + ".forest")
+    return DATA_DIR / key
+
+
+def _is_current(key: str, etag: str, size: int) -> bool:
+    with _manifest_lock:
+        entry = _load_manifest().get(key)
+    return (
+        entry is not None
+        and entry["etag"] == etag
+        and entry["size"] == size
+        and _local_path(key).exists()
+    )
+
+
+def _download(s3, key: str, etag: str, size: int):
+    """Fetch one object into place atomically and record it in the manifest."""
+    target = _local_path(key)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=target.parent) as tmp:
+        downloaded = Path(tmp) / "object"
+        with metrics.s3_transfer("download", size):
+            s3.download_file(BUCKET, key, str(downloaded))
+        if key.endswith(FOREST_ARCHIVE_SUFFIXES):
+            from ml import forest
+
+            forest.unpack(downloaded, target)
+        else:
+            if key == DB_FILENAME:
+                # A WAL left over from the old local copy must not be replayed onto the new one
+                for suffix in ("-wal", "-shm"):
+                    Path(f"{target}{suffix}").unlink(missing_ok=True)
+            os.replace(downloaded, target)
+    _record(key, etag, size)
+
+
+def _sync(s3, key: str, etag: str, size: int) -> bool:
+    """Download `key` unless the local copy is already current. Returns True if fetched."""
+    if _is_current(key, etag, size):
+        return False
+    _download(s3, key, etag, size)
+    print(f"[s3_sync] Downloaded {key}")
+    return True
+
+
+def _list_models(s3) -> dict[str, dict]:
+    objects = {}
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=BUCKET, Prefix="models/"):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith("/"):
+                objects[obj["Key"]] = {"etag": obj["ETag"], "size": obj["Size"]}
+    return objects
+
+
 def download_all():
     """Download DB and all model files from S3. Called on startup.
     Never raises — logs errors and continues so the app always starts.
@@ -35,64 +177,236 @@ def download_all():
         print("[s3_sync] S3_BUCKET not set, skipping download")
         return
 
+    started = time.monotonic()
     try:
         s3 = _get_client()
         DATA_DIR.mkdir(parents=True, exist_ok=True)
         MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
-        # Download database
-        db_path = DATA_DIR / DB_FILENAME
-        try:
-            s3.head_object(Bucket=BUCKET, Key=DB_FILENAME)
-            s3.download_file(BUCKET, DB_FILENAME, str(db_path))
-            print(f"[s3_sync] Downloaded {DB_FILENAME}")
-        except Exception:
-            print(f"[s3_sync] {DB_FILENAME} not found in S3, starting fresh")
+        objects = {}
+        restored = False
+        if replication.ENABLED:
+            try:
+                restored = replication.restore(s3, BUCKET, database.DB_PATH)
+            except Exception as e:
+                print(f"[s3_sync] Error restoring DB replica: {e}")
+        if not restored:
+            # Also the way in when switching over from snapshot uploads
+            try:
+                head = s3.head_object(Bucket=BUCKET, Key=DB_FILENAME)
+                objects[DB_FILENAME] = {"etag": head["ETag"], "size": head["ContentLength"]}
+            except Exception:
+                print(f"[s3_sync] {DB_FILENAME} not found in S3, starting fresh")
 
-        # Download model files
         try:
-            resp = s3.list_objects_v2(Bucket=BUCKET, Prefix="models/")
-            for obj in resp.get("Contents", []):
-                key = obj["Key"]
-                if key.endswith("/"):
-                    continue
-                local_path = DATA_DIR / key
-                local_path.parent.mkdir(parents=True, exist_ok=True)
-                s3.download_file(BUCKET, key, str(local_path))
-                print(f"[s3_sync] Downloaded {key}")
+            models = _list_models(s3)
         except Exception as e:
             print(f"[s3_sync] Error listing models: {e}")
+            models = {}
+        if LAZY_MODELS:
+            _remote_models.update(models)
+        else:
+            objects.update(models)
+
+        fetched = skipped = failed = 0
+        with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as pool:
+            futures = {
+                pool.submit(_sync, s3, key, obj["etag"], obj["size"]): key
+                for key, obj in objects.items()
+            }
+            for future, key in futures.items():
+                try:
+                    if future.result():
+                        fetched += 1
+                    else:
+                        skipped += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"[s3_sync] Error downloading {key}: {e}")
 
+        print(
+            f"[s3_sync] Startup sync: {fetched} downloaded, {skipped} unchanged, "
+            f"{failed} failed, {len(_remote_models)} model file(s) deferred "
+            f"({time.monotonic() - started:.2f}s)"
+        )
     except Exception as e:
         print(f"[s3_sync] S3 download failed, starting fresh: {e}")
 
 
+def _session_lock(session_id: int) -> threading.Lock:
+    with _session_locks_lock:
+        return _session_locks.setdefault(session_id, threading.Lock())
+
+
+def ensure_model(session_id: int):
+    """Fetch a session's model files deferred at startup. No-op unless S3_LAZY_MODELS=1.
+
+    Never raises; a failed fetch just leaves the model missing locally.
+    """
+    prefix = f"models/session_{session_id}."
+    if not any(k.startswith(prefix) for k in list(_remote_models)):
+        return
+    with _session_lock(session_id):
+        for key in [k for k in list(_remote_models) if k.startswith(prefix)]:
+            obj = _remote_models.get(key)
+            if obj is None:
+                continue
+            try:
+                _sync(_get_client(), key, obj["etag"], obj["size"])
+                _remote_models.pop(key, None)
+            except Exception as e:
+                print(f"[s3_sync] Error downloading {key}: {e}")
+
+
+def claim_models(session_id: int) -> dict[str, dict]:
+    """Stop `ensure_model` fetching the session's deferred model files.
+
+    Called before a training job starts writing a new model, which the S3
+    copies must not overwrite before it is uploaded. Waits for a fetch already
+    in progress. Returns what was deferred, for `release_models`.
+    """
+    prefix = f"models/session_{session_id}."
+    with _session_lock(session_id):
+        keys = [k for k in list(_remote_models) if k.startswith(prefix)]
+        return {k: obj for k in keys if (obj := _remote_models.pop(k, None)) is not None}
+
+
+def release_models(session_id: int, claimed: dict[str, dict]):
+    """Defer `claimed` (from `claim_models`) again, e.g. because the job that
+    claimed them failed. Files that exist locally by now are left alone.
+    """
+    with _session_lock(session_id):
+        for key, obj in claimed.items():
+            if not _local_path(key).exists():
+                _remote_models.setdefault(key, obj)
+
+
+def _record_upload(s3, key: str):
+    """Record the uploaded object so the next startup doesn't download it back."""
+    _remote_models.pop(key, None)
+    try:
+        head = s3.head_object(Bucket=BUCKET, Key=key)
+        _record(key, head["ETag"], head["ContentLength"])
+    except Exception:
+        _record(key, None, None)
+
+
+def _snapshot_db(dest: Path):
+    """Copy a consistent snapshot of the live DB (WAL included) to `dest`."""
+    source = sqlite3.connect(database.DB_PATH)
+    target = sqlite3.connect(dest)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
 def upload_db():
-    """Upload the SQLite database to S3."""
+    """Upload a snapshot of the SQLite database to S3, now."""
     if not _s3_enabled():
         return
 
-    try:
-        s3 = _get_client()
-        db_path = DATA_DIR / DB_FILENAME
-        if db_path.exists():
-            s3.upload_file(str(db_path), BUCKET, DB_FILENAME)
+    with _db_upload_lock:
+        try:
+            s3 = _get_client()
+            if not os.path.exists(database.DB_PATH):
+                return
+            with tempfile.TemporaryDirectory(dir=DATA_DIR) as tmp:
+                snapshot = Path(tmp) / DB_FILENAME
+                _snapshot_db(snapshot)
+                with metrics.s3_transfer("upload", snapshot.stat().st_size):
+                    s3.upload_file(str(snapshot), BUCKET, DB_FILENAME, Config=_transfer_config())
+            _record_upload(s3, DB_FILENAME)
             print(f"[s3_sync] Uploaded {DB_FILENAME}")
-    except Exception as e:
-        print(f"[s3_sync] Error uploading DB: {e}")
+        except Exception as e:
+            print(f"[s3_sync] Error uploading DB: {e}")
+
+
+def _db_upload_loop():
+    while True:
+        _db_dirty.wait()
+        # Let the rest of a burst of writes land before taking the snapshot
+        time.sleep(UPLOAD_DEBOUNCE_SECONDS)
+        # Cleared before the snapshot so writes made during it schedule another
+        _db_dirty.clear()
+        _persist_db()
 
 
-def upload_model(session_id: int):
-    """Upload a specific model file to S3."""
+def schedule_db_upload():
+    """Mark the DB as changed; the background uploader snapshots and uploads it.
+
+    Returns immediately. Writes within one debounce interval share an upload.
+    """
+    global _db_uploader
+    if not _s3_enabled():
+        return
+    with _db_uploader_lock:
+        if _db_uploader is None or not _db_uploader.is_alive():
+            _db_uploader = threading.Thread(
+                target=_db_upload_loop, name="s3-db-uploader", daemon=True
+            )
+            _db_uploader.start()
+            atexit.register(flush_db_upload)
+    _db_dirty.set()
+
+
+def flush_db_upload():
+    """Upload now if a scheduled upload is still pending (e.g. on shutdown)."""
+    if _db_dirty.is_set():
+        _db_dirty.clear()
+        _persist_db()
+
+
+def _persist_db():
+    if not replication.ENABLED:
+        upload_db()
+        return
+    with _db_upload_lock:
+        try:
+            replication.ship(_get_client(), BUCKET, _transfer_config())
+        except Exception as e:
+            print(f"[s3_sync] Error shipping DB changes: {e}")
+
+
+def upload_model(session_id: int, profiler: StageProfiler | None = None):
+    """Upload a session's model file and compiled forest to S3.
+
+    Each upload is recorded as a stage on `profiler`, if given.
+    """
     if not _s3_enabled():
         return
+    stage = profiler.stage if profiler else lambda name: nullcontext()
 
     try:
         s3 = _get_client()
         model_path = MODELS_DIR / f"session_{session_id}.joblib"
         if model_path.exists():
             key = f"models/session_{session_id}.joblib"
-            s3.upload_file(str(model_path), BUCKET, key)
+            with stage("s3_upload_joblib"), metrics.s3_transfer("upload", model_path.stat().st_size):
+                s3.upload_file(str(model_path), BUCKET, key, Config=_transfer_config())
+            _record_upload(s3, key)
+            print(f"[s3_sync] Uploaded {key}")
+
+        forest_path = MODELS_DIR / f"session_{session_id}.forest"
+        if forest_path.is_dir():
+            from ml import forest
+
+            suffix = FOREST_ARCHIVE_SUFFIXES[0] if COMPRESS_MODELS else FOREST_ARCHIVE_SUFFIXES[1]
+            key = f"models/session_{session_id}{suffix}"
+            with stage("s3_upload_forest"), tempfile.TemporaryDirectory() as tmp:
+                archive = Path(tmp) / f"session_{session_id}{suffix}"
+                forest.pack(forest_path, archive, compress=COMPRESS_MODELS)
+                with metrics.s3_transfer("upload", archive.stat().st_size):
+                    s3.upload_file(str(archive), BUCKET, key, Config=_transfer_config())
+            _record_upload(s3, key)
+            # Don't leave an archive in the other format behind to be restored later
+            stale = f"models/session_{session_id}" + (
+                FOREST_ARCHIVE_SUFFIXES[1] if COMPRESS_MODELS else FOREST_ARCHIVE_SUFFIXES[0]
+            )
+            s3.delete_object(Bucket=BUCKET, Key=stale)
+            _remote_models.pop(stale, None)
+            _record(stale, None, None)
             print(f"[s3_sync] Uploaded {key}")
     except Exception as e:
         print(f"[s3_sync] Error uploading model: {e}")
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Literal
+
 from pydantic import BaseModel, Field
 
 
@@ -11,12 +13,42 @@ class GradeConfig(BaseModel):
     color: str = Field(example="#00b894")
 
 
+class ForestConfig(BaseModel):
+    """`fixed` fits exactly `nEstimators` trees. `adaptive` grows the forest
+    `step` trees at a time and stops once out-of-bag accuracy changes by at
+    most `tolerance` for `patience` steps, or at `nEstimators` trees or
+    `timeBudgetSeconds`, whichever comes first."""
+
+    mode: Literal["fixed", "adaptive"] = "fixed"
+    nEstimators: int = Field(default=1000, ge=1, le=5000)
+    step: int = Field(default=50, ge=1)
+    tolerance: float = Field(default=0.002, ge=0)
+    patience: int = Field(default=2, ge=1)
+    timeBudgetSeconds: float | None = Field(default=None, gt=0)
+
+
+class TuneConfig(BaseModel):
+    """Run a cross-validated hyperparameter search before training. The
+    winning config, tree count included, is saved on the session and reused
+    by later retrains; a `forest` config on the request sets the tree count."""
+
+    budgetSeconds: float = Field(default=60, gt=0, le=3600)
+    candidates: int = Field(default=24, ge=1, le=192)
+    folds: int = Field(default=5, ge=2, le=10)
+    workers: int | None = Field(default=None, ge=1)
+
+
 class TrainRequest(BaseModel):
+    """Omit `rows` to train on the session's stored dataset rows; target and
+    feature columns then default to the session's configuration."""
+
     sessionId: int = Field(example=1)
-    targetColumn: str = Field(example="grade")
-    featureColumns: list[str] = Field(example=["count_br", "count_ct"])
-    grades: list[GradeConfig]
-    rows: list[dict]
+    targetColumn: str | None = Field(default=None, example="grade")
+    featureColumns: list[str] | None = Field(default=None, example=["count_br", "count_ct"])
+    grades: list[GradeConfig] | None = None
+    rows: list[dict] | None = None
+    forest: ForestConfig | None = None
+    tune: TuneConfig | None = None
 
 
 class ClassMetrics(BaseModel):
@@ -26,6 +58,26 @@ class ClassMetrics(BaseModel):
     support: int = Field(example=42)
 
 
+class OobPoint(BaseModel):
+    trees: int = Field(example=100)
+    oobScore: float = Field(example=0.86)
+
+
+class ProfileStage(BaseModel):
+    name: str = Field(example="fit")
+    wallMs: float = Field(example=5231.4)
+    cpuMs: float | None = Field(default=None, example=20410.9)
+    peakRssMb: float | None = Field(default=None, example=412.3)
+
+
+class TrainProfile(BaseModel):
+    stages: list[ProfileStage]
+    wallMs: float = Field(example=6120.7)
+    cpuMs: float = Field(example=21377.2)
+    peakRssMb: float | None = Field(default=None, example=412.3)
+    cprofilePath: str | None = None
+
+
 class TrainResultMetrics(BaseModel):
     accuracy: float = Field(example=0.87)
     precision: float = Field(example=0.85)
@@ -37,6 +89,11 @@ class TrainResultMetrics(BaseModel):
     targetDistribution: dict[str, int]
     trainSize: int = Field(example=80)
     testSize: int = Field(example=20)
+    nEstimators: int | None = Field(default=None, example=250)
+    oobCurve: list[OobPoint] | None = None
+    hyperparameters: dict | None = None
+    tuning: dict | None = None
+    profile: TrainProfile | None = None
 
 
 class TrainResponse(BaseModel):
@@ -45,6 +102,10 @@ class TrainResponse(BaseModel):
     sessionId: int = Field(example=1)
     created_at: str = Field(example="2026-02-10T12:00:00Z")
     message: str = Field(example="Training job started successfully")
+    stage: str | None = Field(default=None, example="fitting")
+    progress: float = Field(default=0, example=0.1)
+    started_at: str | None = None
+    finished_at: str | None = None
     metrics: TrainResultMetrics | None = None
 
 
@@ -57,6 +118,28 @@ class PredictResponse(BaseModel):
     predictions: list[str]
 
 
+class ScoreResponse(BaseModel):
+    job_id: str = Field(example="score_1_1760000000_a1b2c3")
+    status: str = Field(example="running")
+    sessionId: int = Field(example=1)
+    modelVersion: str = Field(example="train_1_1760000000_d4e5f6")
+    created_at: str = Field(example="2026-02-10T12:00:00Z")
+    message: str = Field(example="Scoring job queued")
+    progress: float = Field(default=0, example=0.4)
+    rowsTotal: int = Field(default=0, example=100000)
+    rowsScored: int = Field(default=0, example=40000)
+    started_at: str | None = None
+    finished_at: str | None = None
+
+
+class PredictionResponse(BaseModel):
+    rowId: int = Field(example=42)
+    modelVersion: str = Field(example="train_1_1760000000_d4e5f6")
+    predicted: str = Field(example="B")
+    confidence: float = Field(example=0.71)
+    probabilities: dict[str, float]
+
+
 # --- Sessions ---
 
 class SessionCreate(BaseModel):
@@ -109,6 +192,14 @@ class RowUpdate(BaseModel):
     data: dict | None = None
 
 
+class RowBatchUpdateItem(RowUpdate):
+    id: int = Field(example=42)
+
+
+class RowsBatchUpdate(BaseModel):
+    updates: list[RowBatchUpdateItem]
+
+
 class RowResponse(BaseModel):
     id: int
     sessionId: int
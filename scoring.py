@@ -0,0 +1,147 @@
+"""Background batch scoring of a session's unlabeled rows.
+
+A scoring job reads the unlabeled `dataset_rows` in chunks, runs the session
+model over each chunk in a worker process and stores the predicted grade,
+class probabilities and confidence in `predictions`, keyed by row and model
+version. Job state lives in `scoring_jobs`, like training jobs.
+"""
+
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+
+from database import connection, transaction
+import jobs
+import model_cache
+import training
+
+SCORE_CHUNK_ROWS = int(os.environ.get("SCORE_CHUNK_ROWS", "5000"))
+
+
+def create_job(db, session_id: int, model_version: str) -> dict:
+    """Insert a queued job row and return it."""
+    now = datetime.now(timezone.utc)
+    job_id = f"score_{session_id}_{int(now.timestamp())}_{uuid.uuid4().hex[:6]}"
+    db.execute(
+        """INSERT INTO scoring_jobs (id, session_id, model_version, status, message, created_at)
+           VALUES (?, ?, ?, 'queued', 'Scoring job queued', ?)""",
+        (job_id, session_id, model_version, now.isoformat()),
+    )
+    return get_job(db, job_id)
+
+
+def get_job(db, job_id: str) -> dict | None:
+    row = db.execute("SELECT * FROM scoring_jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def latest_version(db, session_id: int) -> str | None:
+    """Model version of the session's most recent completed scoring job."""
+    row = db.execute(
+        """SELECT model_version FROM scoring_jobs
+           WHERE session_id = ? AND status = 'completed'
+           ORDER BY finished_at DESC LIMIT 1""",
+        (session_id,),
+    ).fetchone()
+    return row["model_version"] if row else None
+
+
+def submit(job_id: str, session_id: int):
+    """Run the job in the shared worker pool."""
+    future = training.get_executor().submit(run_job, job_id, session_id)
+    future.add_done_callback(lambda f: _on_job_done(f, job_id))
+
+
+def _on_job_done(future, job_id: str):
+    """Record a crash; anything slower is left to the finisher thread (`jobs.after_job`)."""
+    from s3_sync import schedule_db_upload
+
+    try:
+        future.result()
+    except Exception as e:
+        print(f"[scoring] Job {job_id} crashed: {type(e).__name__}: {e}")
+        with connection() as db:
+            jobs.update_job(db, "scoring_jobs", job_id, status="failed", message=str(e),
+                            finished_at=jobs.now())
+        return
+
+    # Whether it succeeded or not, the worker wrote to the DB from another process
+    jobs.after_job(schedule_db_upload)
+
+
+def _load_model(session_id: int):
+    """Return (model, classes, feature_columns) for the session.
+
+    Whole chunks are scored at once, where sklearn's own traversal beats the
+    compiled forest, so the joblib model is preferred when present.
+    """
+    import joblib
+    from ml import forest
+
+    path = training.model_path(session_id)
+    if path.exists():
+        saved = model_cache.load(path, joblib.load)
+        model = saved["model"]
+        return model, model.classes_, saved["feature_columns"]
+    compiled = model_cache.load(
+        training.compiled_model_path(session_id),
+        lambda p: forest.load(p, mmap_mode="r"),
+    )
+    return compiled, compiled.classes, compiled.meta["feature_columns"]
+
+
+def run_job(job_id: str, session_id: int) -> bool:
+    """Score every unlabeled row of the session. Runs in a worker process.
+
+    Returns True on success. Scoring errors are recorded on the job row.
+    """
+    from ml.dataset import iter_unlabeled_chunks
+
+    with connection() as db, connection(readonly=True) as read_db:
+        try:
+            # The model may have been retrained since the job was queued
+            version = training.model_version(session_id)
+            if version is None:
+                raise FileNotFoundError("No trained model for this session")
+            model, classes, feature_columns = _load_model(session_id)
+            classes = [str(c) for c in classes]
+
+            total = read_db.execute(
+                "SELECT COUNT(*) FROM dataset_rows WHERE session_id = ? AND target_column = ''",
+                (session_id,),
+            ).fetchone()[0]
+            jobs.update_job(db, "scoring_jobs", job_id, status="running", model_version=version,
+                            rows_total=total, message="Scoring started", started_at=jobs.now())
+
+            scored = 0
+            for ids, X in iter_unlabeled_chunks(read_db, session_id, feature_columns, SCORE_CHUNK_ROWS):
+                proba = model.predict_proba(X)
+                best = proba.argmax(axis=1)
+                params = [
+                    (
+                        int(row_id), version, session_id, classes[b], float(p[b]),
+                        json.dumps(dict(zip(classes, p.round(6).tolist()))),
+                    )
+                    for row_id, p, b in zip(ids, proba, best)
+                ]
+                scored += len(params)
+                with transaction(db):
+                    db.executemany(
+                        """INSERT OR REPLACE INTO predictions
+                           (row_id, model_version, session_id, predicted, confidence, probabilities)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        params,
+                    )
+                    jobs.update_job(db, "scoring_jobs", job_id, rows_scored=scored,
+                                    progress=round(scored / total, 4) if total else 1.0)
+        except Exception as e:
+            print(f"[scoring] Job {job_id} failed: {type(e).__name__}: {e}")
+            jobs.update_job(db, "scoring_jobs", job_id, status="failed", message=str(e),
+                            finished_at=jobs.now())
+            return False
+
+        jobs.update_job(db, "scoring_jobs", job_id, status="completed", progress=1.0,
+                        message=f"Scored {scored} row(s)", finished_at=jobs.now())
+        print(f"[scoring] Session {session_id}: scored {scored} row(s) with model {version}")
+        return True
@@ -0,0 +1,44 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# The app is a set of top-level modules run from the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+import row_store  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, initialized (and seeded) database connection."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "test.db"))
+    row_store.forget_columns()
+    conn = database.connect()
+    database._init_db(conn)
+    yield conn
+    conn.close()
+    row_store.forget_columns()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """The app, started (as a new process would be) against a fresh database."""
+    from fastapi.testclient import TestClient
+
+    import main
+    import response_cache
+
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "app.db"))
+    monkeypatch.setitem(main.startup, "status", "starting")
+    monkeypatch.setattr(response_cache, "_epoch", "test")
+    database.reset_pools()
+    row_store.forget_columns()
+    with TestClient(main.app) as c:
+        while main.startup["status"] == "starting":
+            time.sleep(0.01)
+        yield c
+    database.reset_pools()
+    row_store.forget_columns()
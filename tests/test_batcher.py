@@ -0,0 +1,74 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import batcher
+
+
+class RecordingModel:
+    """Predicts each row's first value, logging the row count of every call."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def predict(self, X):
+        self.calls.append(len(X))
+        if self.fail:
+            raise RuntimeError("model exploded")
+        return X[:, 0] * 10
+
+
+@pytest.fixture(autouse=True)
+def window(monkeypatch):
+    monkeypatch.setattr(batcher, "WINDOW_MS", 20)
+    monkeypatch.setattr(batcher, "MAX_ROWS", 4)
+    monkeypatch.setattr(batcher, "_queues", {})
+
+
+def _rows(*values):
+    return np.array([[v] for v in values], dtype=float)
+
+
+def _gather(*calls):
+    async def run():
+        return await asyncio.gather(
+            *(batcher.predict(key, model, X) for key, model, X in calls),
+            return_exceptions=True,
+        )
+    return asyncio.run(run())
+
+
+def test_concurrent_calls_merge_and_split_back():
+    model = RecordingModel()
+    results = _gather(("a", model, _rows(1)), ("a", model, _rows(2, 3)))
+
+    assert model.calls == [3]
+    assert [r.tolist() for r in results] == [[10], [20, 30]]
+
+
+def test_full_batch_flushes_without_waiting_for_the_window():
+    model = RecordingModel()
+    results = _gather(
+        ("a", model, _rows(1, 2, 3)), ("a", model, _rows(4)), ("a", model, _rows(5)),
+    )
+
+    assert model.calls == [4, 1]
+    assert [r.tolist() for r in results] == [[10, 20, 30], [40], [50]]
+
+
+def test_models_are_never_mixed():
+    old, new = RecordingModel(), RecordingModel()
+    results = _gather(("v1", old, _rows(1)), ("v2", new, _rows(2)), ("v1", old, _rows(3)))
+
+    assert (old.calls, new.calls) == ([2], [1])
+    assert [r.tolist() for r in results] == [[10], [20], [30]]
+
+
+def test_a_failed_batch_fails_every_caller():
+    model = RecordingModel(fail=True)
+    results = _gather(("a", model, _rows(1)), ("a", model, _rows(2)))
+
+    assert model.calls == [2]
+    assert [str(r) for r in results] == ["model exploded"] * 2
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+import row_store
+from ml.dataset import load_session_arrays
+from ml.rf import frame_to_arrays
+
+FEATURES = ["count_br", "area_sqft", "thickness"]
+ROWS = [
+    {"grade": "A", "count_br": 3, "area_sqft": 44.5, "thickness": "1.2"},
+    {"grade": "B", "count_br": "12", "area_sqft": "n/a", "thickness": 1.4},
+    {"grade": "A", "count_br": None, "area_sqft": " 40 ", "thickness": "1_000"},
+    {"grade": "C", "count_br": 2**70, "area_sqft": True, "thickness": [1]},
+    {"grade": "", "count_br": 1, "area_sqft": 1.0, "thickness": 1.0},
+]
+
+
+def test_stored_rows_train_like_request_rows(db):
+    session_id = db.execute(
+        "INSERT INTO sessions (name, date, created_at, labeled_count) VALUES ('t', '', '', 4)"
+    ).lastrowid
+    row_store.insert_rows(db, session_id, [(r["grade"], r) for r in ROWS])
+
+    X, y = load_session_arrays(db, session_id, FEATURES)
+    expected_X, expected_y = frame_to_arrays(pd.DataFrame(ROWS), "grade", FEATURES)
+
+    np.testing.assert_array_equal(X, expected_X)
+    assert list(y) == list(expected_y)
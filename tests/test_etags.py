@@ -0,0 +1,33 @@
+import response_cache
+
+
+def _tag(client, url, if_none_match=None):
+    headers = {"If-None-Match": if_none_match} if if_none_match else {}
+    response = client.get(url, headers=headers)
+    return response.status_code, response.headers["etag"]
+
+
+def test_rows_tag_depends_on_the_query(client):
+    status, first_page = _tag(client, "/api/sessions/1/rows?limit=1")
+    assert status == 200
+    assert _tag(client, "/api/sessions/1/rows?limit=1", if_none_match=first_page)[0] == 304
+
+    for url in ("/api/sessions/1/rows?limit=2", "/api/sessions/1/rows?limit=1&after_id=1",
+                "/api/sessions/1/rows", "/api/sessions/1/rows?limit=1&stream=ndjson"):
+        status, tag = _tag(client, url, if_none_match=first_page)
+        assert (status, tag != first_page) == (200, True), url
+
+
+def test_sessions_tag_depends_on_the_projection(client):
+    _, summary = _tag(client, "/api/sessions?fields=summary")
+    assert _tag(client, "/api/sessions", if_none_match=summary)[0] == 200
+    _, one = _tag(client, "/api/sessions/1?fields=name,date")
+    assert _tag(client, "/api/sessions/1?fields=date,%20name", if_none_match=one)[0] == 304
+    assert _tag(client, "/api/sessions/1?fields=name", if_none_match=one)[0] == 200
+
+
+def test_tags_change_with_the_process(client, monkeypatch):
+    _, before = _tag(client, "/api/sessions/1/rows")
+    # A restart may have restored an older snapshot, so the version alone proves nothing
+    monkeypatch.setattr(response_cache, "_epoch", "restarted")
+    assert _tag(client, "/api/sessions/1/rows", if_none_match=before)[0] == 200
@@ -0,0 +1,57 @@
+import os
+import threading
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from ml import forest
+from routes import train
+
+
+def _data(rng, n):
+    X = rng.normal(size=(n, 5))
+    y = np.where(X[:, 0] + X[:, 1] > 0, "B", np.where(X[:, 2] > 0.5, "C", "D"))
+    # sklearn learns which side of each split missing values go to
+    X[rng.random(X.shape) < 0.15] = np.nan
+    return X, y
+
+
+def _fit(rng):
+    X, y = _data(rng, 600)
+    return RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(X, y)
+
+
+def test_compiled_forest_matches_sklearn(tmp_path):
+    rng = np.random.default_rng(0)
+    rf = _fit(rng)
+    X_test, _ = _data(rng, 400)
+
+    compiled = forest.compile_forest(rf, meta={"feature_columns": list("abcde")})
+    forest.save(compiled, tmp_path / "m.forest")
+    loaded = forest.load(tmp_path / "m.forest", mmap_mode="r")
+
+    expected_proba = rf.predict_proba(X_test)
+    for model in (compiled, loaded):
+        assert np.array_equal(model.predict(X_test), rf.predict(X_test))
+        assert np.allclose(model.predict_proba(X_test), expected_proba)
+    assert loaded.meta["feature_columns"] == list("abcde")
+
+
+def test_predict_waits_out_a_forest_swap(tmp_path, monkeypatch):
+    monkeypatch.setattr(train, "SWAP_WAIT_SECONDS", 0.5)
+    path = tmp_path / "m.forest"
+    forest.save(forest.compile_forest(_fit(np.random.default_rng(0))), path)
+    assert not forest.swapping(path)
+
+    def caught_mid_swap():
+        """Leave `path` as it is between the two renames of a save, for 50ms."""
+        old = tmp_path / "m.forest.old-1234"
+        os.rename(path, old)
+        threading.Timer(0.05, os.rename, (old, path)).start()
+
+    caught_mid_swap()
+    assert forest.swapping(path)
+    assert train._has_compiled(path)
+
+    caught_mid_swap()
+    assert train._load_forest_file(path, train._load_compiled).n_trees == 25
@@ -0,0 +1,24 @@
+import io
+
+import ingest
+
+CSV = b"""grade,count_br,area_sqft,thickness,note
+A,2,1.0,x,first
+,,2.5,3,
+7,4,,5,third
+"""
+
+
+def test_csv_columns_keep_their_types():
+    chunks = list(ingest.iter_row_chunks(io.BytesIO(CSV), "csv", "grade", ["thickness"]))
+    rows = [row for chunk in chunks for row in chunk]
+
+    assert rows == [
+        ("A", {"grade": "A", "count_br": 2, "area_sqft": 1.0, "note": "first"}),
+        ("", {"area_sqft": 2.5, "thickness": 3}),
+        ("7", {"grade": "7", "count_br": 4, "thickness": 5, "note": "third"}),
+    ]
+    # 2 == 2.0, so check the types too
+    assert [type(v) for _, data in rows for v in data.values()] == [
+        str, int, float, str, float, int, str, int, int, str,
+    ]
@@ -0,0 +1,68 @@
+import re
+
+import pytest
+
+import metrics
+
+# name{labels} value, per the text exposition format
+SAMPLE = re.compile(
+    r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_][a-zA-Z0-9_]*="(\\.|[^"\\])*"'
+    r'(,[a-zA-Z_][a-zA-Z0-9_]*="(\\.|[^"\\])*")*\})? '
+    r"(-?[0-9.e+-]+|[+-]Inf|NaN)$"
+)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "_metrics", [])
+    monkeypatch.setattr(metrics, "_collectors", [])
+
+
+def test_render_exposition_format(registry):
+    jobs = metrics.counter("jobs_total", "Jobs run", ("kind",))
+    jobs.labels('odd "kind"\\').inc(2)
+    metrics.gauge("queue_depth", "Queued items").labels().set(1.5)
+    latency = metrics.histogram("latency_seconds", "Latency", [0.1, 1])
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.labels().observe(value)
+    metrics.add_collector(lambda: [("cache_hits", "counter", "Hits", [({"tier": "a"}, 4)])])
+
+    assert metrics.render().splitlines() == [
+        "# HELP jobs_total Jobs run",
+        "# TYPE jobs_total counter",
+        'jobs_total{kind="odd \\"kind\\"\\\\"} 2',
+        "# HELP queue_depth Queued items",
+        "# TYPE queue_depth gauge",
+        "queue_depth 1.5",
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+        "# HELP cache_hits Hits",
+        "# TYPE cache_hits counter",
+        'cache_hits{tier="a"} 4',
+    ]
+
+
+def test_labels_must_match_the_declared_names(registry):
+    requests = metrics.counter("requests_total", "Requests", ("method", "route"))
+    with pytest.raises(ValueError):
+        requests.labels("GET")
+
+
+def test_metrics_endpoint(client):
+    client.get("/api/sessions")
+    response = client.get("/metrics")
+
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    for line in lines:
+        assert line.startswith(("# HELP ", "# TYPE ")) or SAMPLE.match(line), line
+    assert "app_ready 1" in lines
+    assert any(
+        line.startswith('http_requests_total{method="GET",route="/api/sessions",status="200"} ')
+        for line in lines
+    )
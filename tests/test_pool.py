@@ -0,0 +1,38 @@
+import database
+
+
+def _names(conn):
+    return [r["name"] for r in conn.execute("SELECT name FROM sessions ORDER BY id")]
+
+
+def test_released_write_connection_drops_uncommitted_work(db):
+    pool = database.ConnectionPool(1)
+    conn = pool.acquire()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("UPDATE sessions SET name = 'half done' WHERE id = 1")
+    pool.release(conn)
+
+    # The next borrower gets the same connection, without the open transaction
+    again = pool.acquire()
+    assert again is conn
+    assert not again.in_transaction
+    assert "half done" not in _names(again) + _names(db)
+    again.execute("UPDATE sessions SET name = 'done' WHERE id = 1")
+    assert _names(db)[0] == "done"
+    pool.release(again)
+    pool.close_all()
+
+
+def test_released_read_connection_drops_its_snapshot(db):
+    pool = database.ConnectionPool(1, readonly=True)
+    conn = pool.acquire()
+    conn.execute("BEGIN")
+    before = _names(conn)
+    pool.release(conn)
+
+    db.execute("UPDATE sessions SET name = 'renamed' WHERE id = 1")
+    reader = pool.acquire()
+    assert reader is conn
+    assert _names(reader) == ["renamed", *before[1:]]
+    pool.release(reader)
+    pool.close_all()
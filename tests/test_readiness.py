@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import main
+import row_store
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The app, with the S3 restore step of its startup held until released."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "app.db"))
+    monkeypatch.setitem(main.startup, "status", "starting")
+    monkeypatch.setitem(main.startup, "error", None)
+    monkeypatch.setitem(main.startup, "phasesMs", {})
+    database.reset_pools()
+    row_store.forget_columns()
+    restore = {"release": threading.Event(), "error": None}
+
+    def download_all():
+        restore["release"].wait(10)
+        if restore["error"]:
+            raise restore["error"]
+
+    monkeypatch.setattr(main, "download_all", download_all)
+    yield restore
+    restore["release"].set()
+    database.reset_pools()
+    row_store.forget_columns()
+
+
+def _wait_while_starting():
+    deadline = time.monotonic() + 10
+    while main.startup["status"] == "starting" and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_api_answers_503_until_ready(app):
+    with TestClient(main.app) as client:
+        starting = client.get("/api/sessions")
+        assert (starting.status_code, starting.json()) == (503, {"detail": "Service is starting"})
+        assert starting.headers["retry-after"] == "1"
+        assert client.get("/ready").status_code == 503
+        assert client.get("/").status_code == 200
+
+        app["release"].set()
+        _wait_while_starting()
+        assert client.get("/ready").status_code == 200
+        assert client.get("/api/sessions").status_code == 200
+
+
+def test_failed_startup_keeps_answering_503(app):
+    app["error"] = ConnectionError("bucket unreachable")
+    app["release"].set()
+    with TestClient(main.app) as client:
+        _wait_while_starting()
+        failed = client.get("/api/sessions")
+        assert (failed.status_code, failed.json()) == (503, {"detail": "Service failed to start"})
+        ready = client.get("/ready")
+        assert ready.status_code == 503
+        assert ready.json()["error"] == "ConnectionError: bucket unreachable"
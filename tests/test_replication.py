@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+import database
+import replication
+import row_store
+from benchmarks.fake_s3 import LocalS3
+
+
+@pytest.fixture
+def primary(tmp_path, monkeypatch):
+    """A fresh database recording its changes for replication."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "primary.db"))
+    monkeypatch.setattr(replication, "ENABLED", True)
+    row_store.forget_columns()
+    conn = database.connect()
+    database._init_db(conn)
+    yield conn
+    conn.close()
+    row_store.forget_columns()
+
+
+def _insert(db, rows):
+    with database.transaction(db):
+        row_store.insert_rows(db, 1, [(label, data) for label, data in rows])
+
+
+def _contents(path) -> dict:
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    try:
+        tables = {}
+        for table in replication.TABLES:
+            order = ", ".join(replication._pk_columns(db, table))
+            tables[table] = [dict(r) for r in db.execute(f"SELECT * FROM {table} ORDER BY {order}")]
+        tables["sqlite_sequence"] = dict(db.execute(
+            "SELECT name, seq FROM sqlite_sequence WHERE name != 'change_log'"
+        ))
+        return tables
+    finally:
+        db.close()
+
+
+def test_restore_replays_segments_onto_the_base(primary, tmp_path):
+    s3 = LocalS3(tmp_path / "bucket")
+    _insert(primary, [("A", {"count_br": 1}), ("", {"count_br": 2})])
+    assert replication.ship(s3, "test") == 0  # the first ship is a base
+
+    # After the base: a metric column added by ALTER, updates, then deletes
+    # of the newest rows, whose ids must not come back after a restore
+    _insert(primary, [("B", {"count_br": 3, "count_new": 1.5, "note": "x"})])
+    assert replication.ship(s3, "test") == 1
+    _insert(primary, [("C", {"count_new": 7}), ("", {"count_br": 8})])
+    with database.transaction(primary):
+        row_store.update_row(primary, 1, "D", {"count_br": 10, "count_new": 2})
+        primary.execute("DELETE FROM dataset_rows WHERE id > 2")
+        primary.execute("UPDATE sessions SET name = 'renamed' WHERE id = 1")
+    assert replication.ship(s3, "test") == 1
+
+    restored = tmp_path / "restored.db"
+    assert replication.restore(s3, "test", restored)
+    assert _contents(restored) == _contents(database.DB_PATH)
+
+    # An up to date local copy only replays the segments shipped since
+    _insert(primary, [("E", {"count_br": 11})])
+    assert replication.ship(s3, "test") == 1
+    assert replication.restore(s3, "test", restored)
+    assert _contents(restored) == _contents(database.DB_PATH)
@@ -0,0 +1,78 @@
+import json
+import math
+
+from fastapi.responses import JSONResponse
+
+import row_store
+from routes import rows
+
+MIXED_ROWS = [
+    ("A", {"grade": "A", "area_sqft": 44.5, "count_br": 3, "imageSrc": "/hide1.webp", "count_w": 7}),
+    ("", {"count_br": 0, "area_br": 0.1 + 0.2, "note": "naïve ☃ \"quoted\" \\ \n"}),
+    ("", {}),
+    ("B", {"imageSrc": "/x.webp", "grade": "B", "count_ct": -4, "area_sqft": 1e-05}),
+    # Too large for a typed column; stays in the blob
+    ("", {"count_zz": 2**70, "count_br": 1}),
+    # Not numeric, so not typed
+    ("C", {"grade": "C", "count_br": "n/a", "count_w": None, "flag": True}),
+    # Nested object with a key shaped like a placeholder
+    ("", {"meta": {"count_br": None, "list": [1, 2.5, None]}, "count_br": 9}),
+    # Keys the response sets itself
+    ("D", {"id": 99, "count_br": 2, "targetColumn": "Z", "sessionId": 5}),
+    ("", {"text": '"count_br":null', "count_br": 4}),
+]
+
+
+def _insert(db):
+    """Insert MIXED_ROWS and return a cursor over them."""
+    last_id = db.execute("SELECT MAX(id) FROM dataset_rows").fetchone()[0]
+    row_store.insert_rows(db, 1, MIXED_ROWS)
+    return db.execute("SELECT * FROM dataset_rows WHERE id > ? ORDER BY id", (last_id,))
+
+
+def test_row_data_keeps_key_order(db):
+    stored = _insert(db).fetchall()
+    for row, (_, data) in zip(stored, MIXED_ROWS):
+        assert list(row_store.row_data(row)) == list(data)
+        assert row_store.row_data(row) == data
+
+
+def test_non_finite_metrics_read_back(db):
+    written = {"count_br": math.nan, "area_sqft": math.inf, "area_br": -math.inf, "count_w": 2.5}
+    row_store.insert_rows(db, 1, [("", written)])
+    row = db.execute("SELECT * FROM dataset_rows ORDER BY id DESC LIMIT 1").fetchone()
+
+    data = row_store.row_data(row)
+    assert list(data) == list(written)
+    assert math.isnan(data["count_br"])
+    assert (data["area_sqft"], data["area_br"], data["count_w"]) == (math.inf, -math.inf, 2.5)
+
+
+def test_fast_path_matches_full_encode(db):
+    cursor = _insert(db)
+    encode = rows._row_encoder(cursor)
+    for row in cursor.fetchall():
+        expected = JSONResponse(rows._row_to_dict(row)).body.decode("utf-8")
+        assert encode(row) == expected
+
+
+def test_fast_path_handles_rows_stored_without_placeholders(db):
+    # The layout before placeholders: metrics only in their columns
+    row_store.insert_rows(db, 1, [("A", {"imageSrc": "/h.webp", "count_br": 5})])
+    row_id = db.execute("SELECT MAX(id) FROM dataset_rows").fetchone()[0]
+    db.execute(
+        "UPDATE dataset_rows SET data = ? WHERE id = ?",
+        (row_store.dumps_data({"imageSrc": "/h.webp"}), row_id),
+    )
+    cursor = db.execute("SELECT * FROM dataset_rows WHERE id = ?", (row_id,))
+    encode = rows._row_encoder(cursor)
+    row = cursor.fetchone()
+    assert encode(row) == JSONResponse(rows._row_to_dict(row)).body.decode("utf-8")
+    assert json.loads(encode(row))["count_br"] == 5
+
+
+def test_plain_rows_skip_the_full_encode(db):
+    cursor = _insert(db)
+    members = row_store.member_encoder([c[0] for c in cursor.description])
+    first = cursor.fetchone()
+    assert members(first) is not None
@@ -0,0 +1,128 @@
+import pytest
+
+import database
+import replication
+import s3_sync
+from benchmarks.fake_s3 import LocalS3
+
+# One more than a list_objects_v2 page
+N_MODELS = 1001
+
+
+class RecordingS3(LocalS3):
+    """LocalS3 that logs downloads and fails those of keys in `failing`, once each."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.downloads = []
+        self.failing = set()
+
+    def download_file(self, bucket, key, filename):
+        if key in self.failing:
+            self.failing.discard(key)
+            raise ConnectionError(f"connection reset downloading {key}")
+        self.downloads.append(key)
+        super().download_file(bucket, key, filename)
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    client = RecordingS3(tmp_path / "bucket")
+    data_dir = tmp_path / "data"
+    monkeypatch.setattr(s3_sync, "BUCKET", "test")
+    monkeypatch.setattr(s3_sync, "_client", client)
+    monkeypatch.setattr(s3_sync, "DATA_DIR", data_dir)
+    monkeypatch.setattr(s3_sync, "MODELS_DIR", data_dir / "models")
+    monkeypatch.setattr(s3_sync, "MANIFEST_PATH", data_dir / "s3_manifest.json")
+    monkeypatch.setattr(s3_sync, "_manifest", None)
+    monkeypatch.setattr(s3_sync, "_remote_models", {})
+    monkeypatch.setattr(s3_sync, "LAZY_MODELS", False)
+    monkeypatch.setattr(replication, "ENABLED", False)
+    monkeypatch.setattr(database, "DB_PATH", str(data_dir / "grade_ninja.db"))
+
+    client.put_object(Bucket="test", Key=s3_sync.DB_FILENAME, Body=b"db v1")
+    for i in range(N_MODELS):
+        client.put_object(Bucket="test", Key=f"models/session_{i}.joblib", Body=f"model {i}".encode())
+    return client
+
+
+def _restart():
+    """Forget the in-memory manifest, as a new process would."""
+    s3_sync._manifest = None
+    s3_sync._remote_models.clear()
+
+
+def test_download_all_fetches_every_page_then_only_changes(s3):
+    s3_sync.download_all()
+
+    assert len(s3.downloads) == N_MODELS + 1
+    assert open(database.DB_PATH, "rb").read() == b"db v1"
+    last = s3_sync.MODELS_DIR / f"session_{N_MODELS - 1}.joblib"
+    assert last.read_bytes() == f"model {N_MODELS - 1}".encode()
+
+    s3.downloads.clear()
+    s3.put_object(Bucket="test", Key="models/session_7.joblib", Body=b"model 7, retrained")
+    _restart()
+    s3_sync.download_all()
+
+    assert s3.downloads == ["models/session_7.joblib"]
+    assert (s3_sync.MODELS_DIR / "session_7.joblib").read_bytes() == b"model 7, retrained"
+
+
+def test_failed_download_is_retried_on_next_start(s3):
+    s3.failing = {"models/session_3.joblib"}
+    s3_sync.download_all()
+
+    assert not (s3_sync.MODELS_DIR / "session_3.joblib").exists()
+    assert "models/session_3.joblib" not in s3_sync._load_manifest()
+    assert len(s3.downloads) == N_MODELS
+
+    s3.downloads.clear()
+    _restart()
+    s3_sync.download_all()
+
+    assert s3.downloads == ["models/session_3.joblib"]
+    assert (s3_sync.MODELS_DIR / "session_3.joblib").read_bytes() == b"model 3"
+
+
+def test_lazy_models_are_fetched_on_first_use(s3, monkeypatch):
+    monkeypatch.setattr(s3_sync, "LAZY_MODELS", True)
+    s3_sync.download_all()
+    assert s3.downloads == [s3_sync.DB_FILENAME]
+
+    s3.failing = {"models/session_5.joblib"}
+    s3_sync.ensure_model(5)
+    assert not (s3_sync.MODELS_DIR / "session_5.joblib").exists()
+
+    s3_sync.ensure_model(5)
+    s3_sync.ensure_model(5)
+    assert s3.downloads == [s3_sync.DB_FILENAME, "models/session_5.joblib"]
+    assert (s3_sync.MODELS_DIR / "session_5.joblib").read_bytes() == b"model 5"
+
+
+def test_lazy_fetch_never_overwrites_a_model_being_trained(s3, monkeypatch):
+    monkeypatch.setattr(s3_sync, "LAZY_MODELS", True)
+    s3_sync.download_all()
+
+    # Training starts, writes its model, and a predict arrives before the upload
+    claimed = s3_sync.claim_models(5)
+    (s3_sync.MODELS_DIR / "session_5.joblib").write_bytes(b"model 5, retrained")
+    s3_sync.ensure_model(5)
+    s3_sync.upload_model(5)
+
+    assert "models/session_5.joblib" not in s3.downloads
+    assert (s3.root / "models/session_5.joblib").read_bytes() == b"model 5, retrained"
+    assert list(claimed) == ["models/session_5.joblib"]
+
+
+def test_failed_training_defers_the_stored_model_again(s3, monkeypatch):
+    monkeypatch.setattr(s3_sync, "LAZY_MODELS", True)
+    s3_sync.download_all()
+
+    claimed = s3_sync.claim_models(5)
+    s3_sync.ensure_model(5)
+    assert not (s3_sync.MODELS_DIR / "session_5.joblib").exists()
+
+    s3_sync.release_models(5, claimed)
+    s3_sync.ensure_model(5)
+    assert (s3_sync.MODELS_DIR / "session_5.joblib").read_bytes() == b"model 5"
@@ -0,0 +1,58 @@
+import pytest
+
+
+@pytest.fixture
+def session(client):
+    session_id = client.post("/api/sessions", json={
+        "name": "counts", "targetColumn": "grade", "featureColumns": ["count_br"],
+    }).json()["id"]
+    created = client.post(f"/api/sessions/{session_id}/rows/bulk", json={"rows": [
+        {"grade": "A", "count_br": 1}, {"grade": "B", "count_br": 2}, {"count_br": 3},
+    ]})
+    assert created.status_code == 201
+    ids = [r["id"] for r in client.get(f"/api/sessions/{session_id}/rows").json()]
+    return session_id, ids
+
+
+def _counts(client, session_id):
+    session = client.get(f"/api/sessions/{session_id}").json()
+    return session["rowCount"], session["labeledCount"]
+
+
+def test_writes_keep_the_counters_in_step(client, session):
+    session_id, (a, b, unlabeled) = session
+    assert _counts(client, session_id) == (3, 2)
+
+    client.put(f"/api/sessions/{session_id}/rows/{a}", json={"targetColumn": ""})
+    assert _counts(client, session_id) == (3, 1)
+    client.put(f"/api/sessions/{session_id}/rows/{unlabeled}", json={"targetColumn": "C"})
+    assert _counts(client, session_id) == (3, 2)
+
+    # The same row twice in a batch counts once, by its final label
+    patched = client.patch(f"/api/sessions/{session_id}/rows", json={"updates": [
+        {"id": a, "targetColumn": "A"}, {"id": b, "targetColumn": ""},
+        {"id": b, "targetColumn": "B"}, {"id": unlabeled, "data": {"count_br": 4}},
+        {"id": 10_000, "targetColumn": "A"},
+    ]}).json()
+    assert patched["updated"] == 3
+    assert _counts(client, session_id) == (3, 3)
+
+    client.delete(f"/api/sessions/{session_id}/rows")
+    assert _counts(client, session_id) == (0, 0)
+
+
+def test_reconcile_repairs_drifted_counters(client, session):
+    import database
+
+    session_id, _ = session
+    with database.connection() as db:
+        with database.transaction(db):
+            db.execute(
+                "UPDATE sessions SET row_count = 40, labeled_count = -1 WHERE id = ?",
+                (session_id,),
+            )
+
+    repaired = client.post(f"/api/sessions/{session_id}/rows/reconcile")
+    assert repaired.json() == {"rowCount": 3, "labeledCount": 2}
+    assert _counts(client, session_id) == (3, 2)
+    assert client.post("/api/sessions/999/rows/reconcile").status_code == 404
@@ -0,0 +1,62 @@
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import ingest
+from routes import rows
+
+GOOD_CSV = b"grade,count_br\nA,1\n,2\nB,3\n"
+# Two chunks parse before the unterminated quote in the third
+BAD_CSV = b'grade,count_br\nA,1\n,2\nB,3\nC,4\nD,"5\n'
+
+
+@pytest.fixture
+def session_id(db, monkeypatch):
+    monkeypatch.setattr(ingest, "CHUNK_ROWS", 2)
+    session_id = db.execute(
+        """INSERT INTO sessions (name, date, target_column, feature_columns, created_at)
+           VALUES ('u', '', 'grade', '["count_br"]', '')"""
+    ).lastrowid
+    rows.bulk_create_rows(session_id, rows.RowsBulkCreate(rows=[
+        {"grade": "E", "count_br": 9}, {"count_br": 8},
+    ]), db)
+    return session_id
+
+
+def _upload(db, session_id, content, replace):
+    file = UploadFile(io.BytesIO(content), filename="d.csv")
+    return rows.upload_dataset(session_id, file=file, replace=replace, db=db)
+
+
+def _state(db, session_id):
+    labels = [r[0] for r in db.execute(
+        "SELECT target_column FROM dataset_rows WHERE session_id = ? ORDER BY id", (session_id,)
+    )]
+    counts = db.execute(
+        "SELECT row_count, labeled_count, data_version FROM sessions WHERE id = ?", (session_id,)
+    ).fetchone()
+    return labels, tuple(counts)
+
+
+def test_failed_upload_leaves_the_rows_as_they_were(db, session_id):
+    labels, (row_count, labeled_count, version) = _state(db, session_id)
+    assert labels == ["E", ""]
+
+    with pytest.raises(HTTPException) as raised:
+        _upload(db, session_id, BAD_CSV, replace=True)
+
+    assert raised.value.status_code == 400
+    assert raised.value.detail["status"] == "failed"
+    labels_after, (rows_after, labeled_after, version_after) = _state(db, session_id)
+    assert (labels_after, rows_after, labeled_after) == (labels, row_count, labeled_count)
+    assert version_after > version
+
+
+def test_replace_swaps_the_rows_once_ingested(db, session_id):
+    upload = _upload(db, session_id, GOOD_CSV, replace=True)
+
+    assert (upload["status"], upload["rowsIngested"]) == ("completed", 3)
+    labels, (row_count, labeled_count, _) = _state(db, session_id)
+    assert labels == ["A", "", "B"]
+    assert (row_count, labeled_count) == (3, 2)
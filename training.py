@@ -0,0 +1,403 @@
+"""Background training jobs.
+
+`POST /api/train` only records a job and hands it to a worker process; the
+fit, evaluation and model dump happen there. Job state lives in the
+`train_jobs` table so `GET /api/train/{job_id}` keeps working across restarts.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import database
+from database import connection, transaction
+import jobs
+import metrics
+import model_cache
+from profiling import StageProfiler
+
+MODELS_DIR = Path(__file__).parent / "data" / "models"
+MODELS_DIR.mkdir(parents=True, exist_ok=True)
+
+TRAIN_WORKERS = int(os.environ.get("TRAIN_WORKERS", "1"))
+# zlib level for the joblib model, which is only loaded for large predict batches.
+# Off by default: compressing a large forest costs more than the disk it saves
+MODEL_COMPRESS = int(os.environ.get("MODEL_COMPRESS", "0"))
+# When set, every job also runs under cProfile and dumps its stats here
+PROFILE_DIR = os.environ.get("TRAIN_PROFILE_DIR")
+
+_job_seconds = metrics.histogram(
+    "training_job_duration_seconds", "Time from submitting a training job until it finished",
+    [1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600], ("status",),
+)
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def model_path(session_id: int) -> Path:
+    return MODELS_DIR / f"session_{session_id}.joblib"
+
+
+def compiled_model_path(session_id: int) -> Path:
+    """Directory holding the session model compiled for `ml.forest`."""
+    return MODELS_DIR / f"session_{session_id}.forest"
+
+
+def model_version(session_id: int) -> str | None:
+    """Identify the session's current model: the id of the job that trained it.
+
+    Models saved before compiled artifacts existed have no manifest and are
+    identified by their file's mtime instead. Returns None without a model.
+    """
+    from ml import forest
+
+    try:
+        return forest.read_manifest(compiled_model_path(session_id))["job_id"]
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        return f"legacy_{os.stat(model_path(session_id)).st_mtime_ns}"
+    except OSError:
+        return None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Worker pool shared by training and batch scoring jobs.
+
+    Workers start from a forkserver rather than forking the server, whose
+    threads (and any locks they hold) a forked child would inherit.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=TRAIN_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    return _executor
+
+
+def shutdown_executor():
+    """Stop the worker processes once their current job (if any) finishes.
+
+    Queued jobs are dropped; `jobs.recover_jobs` marks them failed on the next start.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def create_job(db, session_id: int) -> dict:
+    """Insert a queued job row and return it."""
+    now = datetime.now(timezone.utc)
+    job_id = f"train_{session_id}_{int(now.timestamp())}_{uuid.uuid4().hex[:6]}"
+    db.execute(
+        """INSERT INTO train_jobs (id, session_id, status, progress, message, created_at)
+           VALUES (?, ?, 'queued', 0, 'Training job queued', ?)""",
+        (job_id, session_id, now.isoformat()),
+    )
+    return get_job(db, job_id)
+
+
+def get_job(db, job_id: str) -> dict | None:
+    row = db.execute("SELECT * FROM train_jobs WHERE id = ?", (job_id,)).fetchone()
+    if not row:
+        return None
+    job = dict(row)
+    job["metrics"] = json.loads(job["metrics"]) if job["metrics"] else None
+    return job
+
+
+def submit(job_id: str, session_id: int, target_column: str,
+           feature_columns: list[str], rows: list[dict] | None,
+           forest: dict | None = None, tune: dict | None = None,
+           stages: list[dict] | None = None):
+    """Run the job in the worker pool; finish S3 persistence when it returns.
+
+    With `rows=None` the worker reads the session's stored rows itself.
+    `forest` and `tune` are `ForestConfig` / `TuneConfig` dumps. `stages`
+    are profile entries recorded before submitting (see `StageProfiler`).
+    """
+    from s3_sync import claim_models
+
+    submitted = time.perf_counter()
+    # Model files still deferred in S3 must not be fetched over the one this job writes
+    claimed = claim_models(session_id)
+    future = get_executor().submit(
+        run_job, job_id, session_id, target_column, feature_columns, rows, forest, tune,
+        stages, time.time(),
+    )
+    future.add_done_callback(lambda f: _on_job_done(f, job_id, session_id, submitted, claimed))
+
+
+def _on_job_done(future, job_id: str, session_id: int, submitted: float, claimed: dict):
+    """Record how the job ended; the S3 persistence is left to `_persist`."""
+    try:
+        completed = future.result()
+    except Exception as e:
+        # The worker itself died (e.g. OOM-killed); it couldn't record the failure
+        print(f"[training] Job {job_id} crashed: {type(e).__name__}: {e}")
+        _job_seconds.labels("crashed").observe(time.perf_counter() - submitted)
+        with connection() as db:
+            jobs.update_job(db, "train_jobs", job_id, status="failed", message=str(e),
+                            finished_at=jobs.now())
+        completed = False
+    else:
+        _job_seconds.labels("completed" if completed else "failed").observe(
+            time.perf_counter() - submitted
+        )
+    if completed:
+        model_cache.invalidate(model_path(session_id))
+        model_cache.invalidate(compiled_model_path(session_id))
+    jobs.after_job(_persist, job_id, session_id, completed, claimed)
+
+
+def _persist(job_id: str, session_id: int, completed: bool, claimed: dict):
+    from s3_sync import release_models, schedule_db_upload, upload_model
+
+    # The worker's writes happen in another process, so the write listener never sees them
+    schedule_db_upload()
+    if not completed:
+        release_models(session_id, claimed)
+        return
+    profiler = StageProfiler()
+    upload_model(session_id, profiler)
+    if profiler.stages:
+        _append_profile_stages(job_id, session_id, profiler.stages)
+
+
+def _append_profile_stages(job_id: str, session_id: int, stages: list[dict]):
+    """Add stages that ran after the result was stored (the S3 uploads) to its profile."""
+    with connection() as db, transaction(db):
+        job = db.execute("SELECT metrics FROM train_jobs WHERE id = ?", (job_id,)).fetchone()
+        result = json.loads(job["metrics"]) if job and job["metrics"] else {}
+        profile = result.get("profile")
+        if not profile:
+            return
+        result["profile"] = {
+            **profile,
+            **StageProfiler(profile["stages"] + stages).summary(),
+        }
+        updated = json.dumps(result)
+        # Only if no newer job has replaced the session's result in the meantime
+        if db.execute(
+            "UPDATE sessions SET train_result = ? WHERE id = ? AND train_result = ?",
+            (updated, session_id, job["metrics"]),
+        ).rowcount:
+            database.bump_data_version(db, session_id)
+        db.execute("UPDATE train_jobs SET metrics = ? WHERE id = ?", (updated, job_id))
+
+
+def _forest_options(forest: dict | None) -> dict:
+    if not forest:
+        return {}
+    return {
+        "n_estimators": forest["nEstimators"],
+        "adaptive": forest["mode"] == "adaptive",
+        "tree_step": forest["step"],
+        "tolerance": forest["tolerance"],
+        "patience": forest["patience"],
+        "time_budget": forest["timeBudgetSeconds"],
+    }
+
+
+def _tune(db, session_id: int, X, y, tune: dict | None) -> dict | None:
+    """Search hyperparameters if asked to, else reuse the session's saved result.
+
+    The search only sees the training part of the holdout split the final
+    model is scored on.
+    """
+    from ml.rf import check_trainable, holdout_split
+    from ml.tuning import search
+
+    if not tune:
+        row = db.execute(
+            "SELECT tuned_params FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        return json.loads(row["tuned_params"]) if row and row["tuned_params"] else None
+
+    check_trainable(y)
+    X_train, _, y_train, _ = holdout_split(X, y)
+    found = search(
+        X_train, y_train,
+        budget_seconds=tune["budgetSeconds"],
+        n_candidates=tune["candidates"],
+        folds=tune["folds"],
+        workers=tune["workers"],
+    )
+    tuning = {
+        "params": found["params"],
+        "trees": found["n_estimators"],
+        "meanScore": found["mean_score"],
+        "cvScores": found["cv_scores"],
+        "rounds": found["rounds"],
+        "evaluated": found["evaluated"],
+        "elapsedSeconds": found["elapsed_seconds"],
+        "leaderboard": found["leaderboard"],
+    }
+    with transaction(db):
+        db.execute(
+            "UPDATE sessions SET tuned_params = ? WHERE id = ?",
+            (json.dumps(tuning), session_id),
+        )
+        database.bump_data_version(db, session_id)
+    print(
+        f"[training] Tuned session {session_id}: {found['params']} "
+        f"(cv {found['mean_score']}, {found['evaluated']} evaluations)"
+    )
+    return tuning
+
+
+def run_job(job_id: str, session_id: int, target_column: str,
+            feature_columns: list[str], rows: list[dict] | None,
+            forest: dict | None = None, tune: dict | None = None,
+            stages: list[dict] | None = None, submitted_at: float | None = None) -> bool:
+    """Train and save a model. Runs in a worker process.
+
+    Returns True on success. Training errors are recorded on the job row.
+    With TRAIN_PROFILE_DIR set the job runs under cProfile; the worker's pid
+    is printed too, for attaching py-spy instead.
+    """
+    args = (job_id, session_id, target_column, feature_columns, rows, forest, tune,
+            stages, submitted_at)
+    if not PROFILE_DIR:
+        return _run_job(*args)
+
+    import cProfile
+
+    path = Path(PROFILE_DIR) / f"{job_id}.prof"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    print(f"[training] Profiling job {job_id} (pid {os.getpid()}) to {path}")
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(_run_job, *args, cprofile_path=str(path))
+    finally:
+        profile.dump_stats(path)
+
+
+def _run_job(job_id: str, session_id: int, target_column: str,
+             feature_columns: list[str], rows: list[dict] | None,
+             forest: dict | None, tune: dict | None,
+             stages: list[dict] | None, submitted_at: float | None,
+             cprofile_path: str | None = None) -> bool:
+    profiler = StageProfiler(stages)
+    if submitted_at is not None:
+        # Includes pickling `rows` over to this process
+        profiler.add("queued", time.time() - submitted_at)
+
+    with profiler.stage("import"):
+        import joblib
+        import pandas as pd
+        from ml import forest as compiled_forest
+        from ml.dataset import load_session_arrays
+        from ml.rf import fit_random_forest, frame_to_arrays
+        from schemas import TrainResultMetrics
+
+    with connection() as db:
+        jobs.update_job(db, "train_jobs", job_id, status="running", stage="preparing",
+                        progress=0.0, message="Training started", started_at=jobs.now())
+
+        def progress(stage: str, fraction: float):
+            jobs.update_job(db, "train_jobs", job_id, stage=stage, progress=fraction)
+
+        options = _forest_options(forest)
+        try:
+            if rows is None:
+                with profiler.stage("load_rows"):
+                    X, y = load_session_arrays(db, session_id, feature_columns)
+            else:
+                with profiler.stage("build_frame"):
+                    df = pd.DataFrame(rows)
+                with profiler.stage("coerce"):
+                    X, y = frame_to_arrays(df, target_column, feature_columns)
+
+            if tune:
+                progress("tuning", 0.05)
+            with profiler.stage("tune") if tune else nullcontext():
+                tuning = _tune(db, session_id, X, y, tune)
+            params = tuning["params"] if tuning else None
+            if tuning and not forest:
+                # An explicit forest config still decides the tree count
+                options["n_estimators"] = tuning["trees"]
+            result = fit_random_forest(
+                X, y, feature_columns, progress=progress, params=params,
+                profiler=profiler, **options
+            )
+        except Exception as e:
+            print(f"Training failed: {type(e).__name__}: {e}")
+            jobs.update_job(db, "train_jobs", job_id, status="failed", message=str(e),
+                            finished_at=jobs.now())
+            return False
+
+        progress("saving", 0.9)
+        model = result.pop("model")
+        with profiler.stage("dump_joblib"):
+            # Readers never see a half-written file: dump beside it, then swap it in
+            path = model_path(session_id)
+            tmp = path.with_name(f"{path.name}.tmp-{uuid.uuid4().hex[:8]}")
+            try:
+                joblib.dump(
+                    {"model": model, "feature_columns": feature_columns},
+                    tmp,
+                    compress=MODEL_COMPRESS,
+                )
+                os.replace(tmp, path)
+            finally:
+                tmp.unlink(missing_ok=True)
+        with profiler.stage("compile_forest"):
+            compiled_forest.save(
+                compiled_forest.compile_forest(model, meta={
+                    "session_id": session_id,
+                    "job_id": job_id,
+                    "target_column": target_column,
+                    "feature_columns": feature_columns,
+                }),
+                compiled_model_path(session_id),
+            )
+
+        metrics = TrainResultMetrics(
+            accuracy=result["accuracy"],
+            precision=result["precision"],
+            recall=result["recall"],
+            f1_score=result["f1_score"],
+            confusionMatrix=result["confusion_matrix"],
+            classificationReport=result["classification_report"],
+            featureImportances=result["feature_importances"],
+            targetDistribution=result["target_distribution"],
+            trainSize=result["train_size"],
+            testSize=result["test_size"],
+            nEstimators=result["n_estimators"],
+            oobCurve=result["oob_curve"],
+            hyperparameters=result["hyperparameters"],
+            tuning=tuning,
+            profile={**profiler.summary(), "cprofilePath": cprofile_path},
+        )
+        metrics_json = json.dumps(metrics.model_dump())
+
+        with transaction(db):
+            db.execute(
+                "UPDATE sessions SET train_result = ? WHERE id = ?",
+                (metrics_json, session_id),
+            )
+            database.bump_data_version(db, session_id)
+            jobs.update_job(
+                db, "train_jobs", job_id,
+                status="completed",
+                stage="done",
+                progress=1.0,
+                message=f"Training completed — accuracy: {result['accuracy']}",
+                metrics=metrics_json,
+                finished_at=jobs.now(),
+            )
+
+        print(
+            f"Training done — accuracy: {result['accuracy']}, "
+            f"train: {result['train_size']}, test: {result['test_size']}"
+        )
+        return True